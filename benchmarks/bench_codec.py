@@ -0,0 +1,49 @@
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from renogybt.Utils import CRC16_HIGH_BYTES, CRC16_LOW_BYTES, check_crc, crc16_modbus, int_to_bytes, modbus_request
+
+# Micro-benchmarks for the Modbus codec in renogybt/Utils.py against the previous implementation.
+# Usage: python3 benchmarks/bench_codec.py
+
+NUMBER = 20000
+
+# Previous request path: int_to_bytes() string formatting and the two-table CRC, rebuilt on every poll
+def legacy_crc16_modbus(data):
+    crc_high = 0xFF
+    crc_low = 0xFF
+    for byte in data:
+        index = crc_high ^ int(byte)
+        crc_high = crc_low ^ CRC16_HIGH_BYTES[index]
+        crc_low = CRC16_LOW_BYTES[index]
+    return bytes([crc_high, crc_low])
+
+def legacy_request(device_id, function, regAddr, readWrd):
+    data = [device_id, function, int_to_bytes(regAddr, 0), int_to_bytes(regAddr, 1), int_to_bytes(readWrd, 0), int_to_bytes(readWrd, 1)]
+    crc = legacy_crc16_modbus(bytes(data))
+    data.append(crc[0])
+    data.append(crc[1])
+    return data
+
+def legacy_check_crc(frame):
+    return legacy_crc16_modbus(frame[:-2]) == bytes(frame[-2:])
+
+def report(name, legacy, current):
+    legacy_time = timeit.timeit(legacy, number=NUMBER)
+    current_time = timeit.timeit(current, number=NUMBER)
+    print(f"{name:<28} legacy {legacy_time / NUMBER * 1e6:8.2f} us  current {current_time / NUMBER * 1e6:8.2f} us  x{legacy_time / current_time:.1f}")
+
+if __name__ == "__main__":
+    payload = bytes(range(68))
+    frame = bytes([255, 3, 68]) + payload
+    frame += crc16_modbus(frame)
+    frames = [frame] * 5
+    assert bytes(legacy_request(255, 3, 256, 34)) == modbus_request(255, 3, 256, 34)
+    assert legacy_check_crc(frame) and check_crc(frame)
+
+    report("build request frame", lambda: legacy_request(255, 3, 256, 34), lambda: modbus_request(255, 3, 256, 34))
+    report("crc16 73 byte frame", lambda: legacy_crc16_modbus(frame), lambda: crc16_modbus(frame))
+    report("validate frame crc", lambda: legacy_check_crc(frame), lambda: check_crc(frame))
+    report("validate 5 frames", lambda: [legacy_check_crc(f) for f in frames], lambda: [check_crc(f) for f in frames])
@@ -0,0 +1,120 @@
+import argparse
+import configparser
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+
+# Cold start of the cron path: a fresh interpreter runs what example.py does before the bluetooth scan.
+#   python3 benchmarks/startup.py                         default config.ini, every sink disabled
+#   python3 benchmarks/startup.py --config my.ini         with the sinks enabled in that config
+#   python3 benchmarks/startup.py --budget 40             import time budget of the package (ms)
+#   python3 benchmarks/startup.py --save startup.json     same format as suite.py, `suite.py compare` works on it
+# Exits with status 1 when the package's own imports exceed the budget or an optional dependency
+# is imported although none of the sections using it is enabled.
+
+REPEAT = 10
+IMPORT_BUDGET = 40 # self time of renogybt and logger_config imports (ms)
+
+# module => config sections that need it
+OPTIONAL_MODULES = {
+    'requests': ('remote_logging', 'pvoutput'),
+    'paho': ('mqtt',),
+    'sqlite3': ('outbox',),
+    'http.server': ('metrics', 'api'),
+}
+
+STARTUP = """
+import configparser, sys
+sys.path.insert(0, {root!r})
+from logger_config import logger
+from renogybt import DataLogger, Utils
+from renogybt.Collector import create_client
+from renogybt.SinkPipeline import SinkPipeline
+from renogybt.Metrics import start_server
+from renogybt.Heartbeat import start_watchdog
+from renogybt.ReadingCache import start_api
+config = configparser.ConfigParser(inline_comment_prefixes=('#'))
+config.read({config!r})
+data_logger = DataLogger(config)
+sink_pipeline = SinkPipeline()
+client = create_client(config)
+"""
+
+def run_python(code, cwd, flags=()):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, *flags, '-c', code], cwd=cwd, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0: sys.exit(f"startup failed:\n{result.stderr}")
+    return elapsed, result.stderr
+
+def summary(times):
+    return {'unit': 'ms', 'median': round(statistics.median(times), 3), 'min': round(min(times), 3), 'number': len(times)}
+
+# -X importtime lines: "import time: self [us] | cumulative | imported package"
+def parse_importtime(stderr):
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line: continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+def enabled(config, section):
+    return config.has_section(section) and config[section].getboolean('enabled', fallback=False)
+
+def measure(config_path, repeat=REPEAT):
+    code = STARTUP.format(root=ROOT, config=config_path)
+    with tempfile.TemporaryDirectory() as cwd: # keeps renogy.log out of the tree
+        interpreter = [run_python('pass', cwd)[0] * 1e3 for _ in range(repeat)]
+        startup = [run_python(code, cwd)[0] * 1e3 for _ in range(repeat)]
+        imports = [parse_importtime(run_python(code, cwd, ['-X', 'importtime'])[1]) for _ in range(repeat)]
+    package = [sum(self_us for name, (self_us, _) in modules.items() if name.split('.')[0] in ('renogybt', 'logger_config')) / 1e3
+               for modules in imports]
+    return {
+        'startup': summary(startup),
+        'startup_overhead': summary([s - i for s, i in zip(startup, interpreter)]),
+        'import_package': summary(package),
+    }, set(imports[0])
+
+def check(results, modules, config, budget):
+    problems = []
+    if results['import_package']['median'] > budget:
+        problems.append(f"package imports take {results['import_package']['median']:.1f} ms, budget {budget} ms")
+    for module, sections in OPTIONAL_MODULES.items():
+        if module in modules and not any(enabled(config, section) for section in sections):
+            problems.append(f"{module} imported although {', '.join(sections)} disabled")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description='renogybt cold start benchmark')
+    parser.add_argument('--config', default=os.path.join(ROOT, 'config.ini'))
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--budget', type=float, default=IMPORT_BUDGET, help='package import time budget (ms)')
+    parser.add_argument('--save', help='write the results to this file')
+    args = parser.parse_args()
+
+    config_path = os.path.realpath(args.config)
+    config = configparser.ConfigParser(inline_comment_prefixes=('#'))
+    config.read(config_path)
+    results, modules = measure(config_path, args.repeat)
+    for name, result in results.items():
+        print(f"{name:<20} {result['median']:12.3f} {result['unit']}")
+    if args.save:
+        current = {'meta': {'python': platform.python_version(), 'machine': platform.machine(), 'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+                   'results': results}
+        with open(args.save, 'w') as f: json.dump(current, f, indent=2)
+
+    problems = check(results, modules, config, args.budget)
+    for problem in problems: print(f"FAIL: {problem}")
+    if len(problems) > 0: sys.exit(1)
+
+if __name__ == "__main__":
+    main()
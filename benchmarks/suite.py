@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import timeit
+
+BENCH_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# The BLE layer is replaced by the simulator before renogybt is imported
+from simulator import DeviceFarm, DEVICE_MODELS, install, load_test
+farm = DeviceFarm(latency=0, jitter=0, connect_latency=0, advertise_interval=0, seed=1)
+install(farm)
+
+from renogybt import DataLogger, Utils
+from renogybt.Collector import create_client
+from renogybt.Utils import bytes_to_int, check_crc, crc16_modbus, modbus_request
+
+# End-to-end benchmark suite with machine-readable results.
+#   python3 benchmarks/suite.py record                                 re-record the device payloads
+#   python3 benchmarks/suite.py run --save benchmarks/baseline.json    store a baseline
+#   python3 benchmarks/suite.py run --compare benchmarks/baseline.json flag regressions against it
+#   python3 benchmarks/suite.py compare old.json new.json --threshold 10
+# The comparison exits with status 1 when a benchmark got slower than the threshold (percent).
+
+PAYLOADS = os.path.join(BENCH_DIR, 'payloads.json')
+THRESHOLD = 10 # (percent)
+REPEAT = 5
+POLL_DEVICES = 10 # devices per poll cycle benchmark
+POLL_REPEAT = 3
+
+BENCHMARKS = {} # name => setup function returning the callable to time
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+def make_config(kind, **options):
+    config_farm = DeviceFarm()
+    config_farm.add_devices(kind, 1)
+    config = config_farm.configs(**options)[0]
+    config['mqtt'].update({'topic': 'solar/state', 'field_topics': 'true', 'qos': '0', 'retain': 'false'})
+    return config
+
+def load_payloads():
+    with open(PAYLOADS) as f:
+        return json.load(f)
+
+# Recorded responses of the simulated devices for every section of their client
+def record():
+    payloads = {}
+    for kind, model_class in DEVICE_MODELS.items():
+        model = model_class('DE:AD:00:00:00:01', seed=1)
+        if model.streaming:
+            payloads[kind] = {'stream': model.packet(time.time()).hex()}
+            continue
+        client = create_client(make_config(kind))
+        payloads[kind] = {str(section['register']): model.handle(modbus_request(255, 3, section['register'], section['words'])).hex()
+                          for section in client.sections}
+    with open(PAYLOADS, 'w') as f:
+        json.dump(payloads, f, indent=2)
+    print(f"Recorded {PAYLOADS}")
+
+def decode_reading(kind):
+    client = create_client(make_config(kind))
+    frames = load_payloads()[kind]
+    if 'stream' in frames:
+        packet = bytes.fromhex(frames['stream'])
+        return lambda: client.decode_shunt_info(packet)
+    parsers = [(section['parser'], bytes.fromhex(frames[str(section['register'])])) for section in client.sections]
+    def decode():
+        for parser, frame in parsers: parser(frame)
+        return client.data
+    return decode
+
+def rover_reading():
+    reading = decode_reading('rover')()
+    reading.update({'__device': 'BT-TH-B00FXXXX', '__client': 'RoverClient'})
+    return dict(reading)
+
+@benchmark('frame_build')
+def frame_build():
+    build = modbus_request.__wrapped__ # uncached, what the cache saves on every poll
+    return lambda: build(255, 3, 256, 34)
+
+@benchmark('crc16')
+def crc16():
+    frame = bytes.fromhex(load_payloads()['rover']['256'])[:-2]
+    return lambda: crc16_modbus(frame)
+
+@benchmark('check_crc')
+def crc_check():
+    frame = bytes.fromhex(load_payloads()['rover']['256'])
+    return lambda: check_crc(frame)
+
+@benchmark('bytes_to_int')
+def bytes_to_int_bench():
+    frame = bytes.fromhex(load_payloads()['rover']['256'])
+    return lambda: bytes_to_int(frame, 5, 2, scale=0.1)
+
+for kind in DEVICE_MODELS:
+    benchmark(f'decode_{kind}')(lambda kind=kind: decode_reading(kind))
+
+@benchmark('filter_fields')
+def filter_fields():
+    reading = rover_reading()
+    return lambda: Utils.filter_fields(reading, 'battery_voltage, pv_power, load_power, battery_percentage')
+
+@benchmark('json_payload')
+def json_payload():
+    reading = rover_reading()
+    return lambda: json.dumps(reading)
+
+@benchmark('mqtt_payload')
+def mqtt_payload():
+    reading = rover_reading()
+    data_logger = DataLogger(make_config('rover'))
+    return lambda: data_logger.mqtt_messages(reading)
+
+def time_call(func):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    times = [t / number * 1e6 for t in timer.repeat(REPEAT, number)]
+    return {'unit': 'us', 'median': round(statistics.median(times), 3), 'min': round(min(times), 3), 'number': number}
+
+# Full poll cycle over POLL_DEVICES simulated Rovers with adaptive pacing, per device
+def poll_cycle():
+    farm.devices.clear()
+    farm.add_devices('rover', POLL_DEVICES)
+    times = []
+    for _ in range(POLL_REPEAT):
+        result = load_test(farm, max_connections=POLL_DEVICES, adaptive_pacing='true')
+        times.append(result['elapsed'] / POLL_DEVICES * 1e3)
+    return {'unit': 'ms', 'median': round(statistics.median(times), 3), 'min': round(min(times), 3), 'number': POLL_REPEAT}
+
+def run(names=None):
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if names and name not in names: continue
+        results[name] = time_call(setup())
+        print(f"{name:<20} {results[name]['median']:12.3f} {results[name]['unit']}")
+    if not names or 'poll_cycle' in names:
+        results['poll_cycle'] = poll_cycle()
+        print(f"{'poll_cycle':<20} {results['poll_cycle']['median']:12.3f} ms")
+    return {
+        'meta': {'python': platform.python_version(), 'machine': platform.machine(), 'platform': platform.platform(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'results': results
+    }
+
+def compare(baseline, current, threshold=THRESHOLD):
+    regressions = []
+    print(f"{'benchmark':<20} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None or base['unit'] != result['unit'] or base['median'] == 0: continue
+        change = (result['median'] - base['median']) / base['median'] * 100
+        flag = ''
+        if change > threshold:
+            flag = 'REGRESSION'
+            regressions.append(name)
+        elif change < -threshold:
+            flag = 'faster'
+        print(f"{name:<20} {base['median']:12.3f} {result['median']:12.3f} {change:+7.1f}% {flag}")
+    if baseline['meta'].get('machine') != current['meta'].get('machine'):
+        print("Warning: baseline was recorded on a different machine")
+    return regressions
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description='renogybt benchmark suite')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run')
+    run_parser.add_argument('names', nargs='*', help='benchmarks to run, default all')
+    run_parser.add_argument('--save', help='write the results to this file')
+    run_parser.add_argument('--compare', help='baseline file to compare with')
+    run_parser.add_argument('--threshold', type=float, default=THRESHOLD, help='regression threshold (percent)')
+    compare_parser = commands.add_parser('compare')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=THRESHOLD, help='regression threshold (percent)')
+    commands.add_parser('record')
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        return record()
+    if args.command == 'run':
+        current = run(args.names)
+        if args.save:
+            with open(args.save, 'w') as f: json.dump(current, f, indent=2)
+        baseline = read_json(args.compare) if args.compare else None
+    else:
+        baseline, current = read_json(args.baseline), read_json(args.current)
+    if baseline is not None:
+        regressions = compare(baseline, current, args.threshold)
+        if len(regressions) > 0:
+            print(f"{len(regressions)} regressions above {args.threshold}%: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
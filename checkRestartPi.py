@@ -1,14 +1,22 @@
 import os
+import struct
 import sys
 import logging
 from datetime import datetime, timedelta
 
-# Use this script to check the renogy.log file and restart the Pi if the log is stale
+# Use this script to check the renogy.heartbeat file (or renogy.log) and restart the Pi if it is stale
 # Put this script in /home/pi or change the BASE_FOLDER variable below
 # You can run this script from cron or as a service in System Control
+# With [heartbeat] enabled only the 12 byte header of the heartbeat file is read. Under systemd,
+# prefer WatchdogSec= in the service (see README), it restarts the collector instead of the Pi.
 
 # Define the base folder as a global variable
 BASE_FOLDER = "/home/pi"  # Change this to your desired path
+STALE_AFTER = timedelta(minutes=30)
+# renogybt/Heartbeat.py MAGIC and HEADER, not imported so the script runs without the package and its logging
+HEARTBEAT_MAGIC = b'RHB1'
+HEARTBEAT_HEADER = struct.Struct('<4sd') # magic, newest read (unix time)
+TAIL_BYTES = 4096 # the last log line is looked up in this many bytes at the end of the log
 
 # Set up logging to a file in BASE_FOLDER
 logging.basicConfig(
@@ -25,10 +33,37 @@ def restart_pi():
         logging.error(f"Error: {e}")
         sys.exit(1)
 
-def restartPiIfNeeded(log_file):
+def restartIfStale(last_date):
+    logging.debug(f"Last reading: {last_date}  -  Delta: {datetime.now() - last_date}")
+    if datetime.now() - last_date > STALE_AFTER:
+        logging.warning(f"Last reading is more than {STALE_AFTER} in the past. Restarting Pi.")
+        restart_pi()
+
+# Time of the newest successful read from the heartbeat file, None when missing or invalid
+def readHeartbeat(heartbeat_file):
+    try:
+        with open(heartbeat_file, "rb") as f:
+            magic, last = HEARTBEAT_HEADER.unpack(f.read(HEARTBEAT_HEADER.size))
+    except (OSError, struct.error):
+        return None
+    if magic != HEARTBEAT_MAGIC or last <= 0:
+        return None
+    return datetime.fromtimestamp(last)
+
+def restartPiIfNeeded(log_file, heartbeat_file=None):
+    if heartbeat_file is not None and os.path.exists(heartbeat_file):
+        last_date = readHeartbeat(heartbeat_file)
+        if last_date is None:
+            logging.error("Could not read the heartbeat file.")
+            return None
+        restartIfStale(last_date)
+        return last_date
     try:
-        with open(log_file, "r") as f:
-            lines = f.readlines()
+        with open(log_file, "rb") as f:
+            # only the end of the log is read, not the whole file
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - TAIL_BYTES))
+            lines = f.read().decode("utf-8", "replace").strip().splitlines()
             if not lines:
                 logging.warning("Log file is empty.")
                 return None
@@ -36,11 +71,7 @@ def restartPiIfNeeded(log_file):
             # Assuming the date is at the start of the line, e.g. "2024-06-10 12:34:56, Some log message"
             date_str = last_line.split(',', 1)[0].strip()
             try:
-                log_date = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
-                logging.debug(f"Last log date: {date_str}  -  Delta: {datetime.now() - log_date}")
-                if datetime.now() - log_date > timedelta(minutes=30):
-                    logging.warning("Log date is more than 30 minutes in the past. Restarting Pi.")
-                    restart_pi()
+                restartIfStale(datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S"))
             except ValueError:
                 logging.error("Could not parse date from log line.")
             return date_str
@@ -50,5 +81,5 @@ def restartPiIfNeeded(log_file):
 
 if __name__ == "__main__":
     log_file_path = os.path.join(BASE_FOLDER, "renogy.log")
-    restartPiIfNeeded(log_file_path)
-
+    heartbeat_file_path = os.path.join(BASE_FOLDER, "renogy.heartbeat")
+    restartPiIfNeeded(log_file_path, heartbeat_file_path)
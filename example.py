@@ -1,8 +1,14 @@
 import configparser
 import os
 import sys
-from logger_config import logger
-from renogybt import ShuntClient, DCChargerClient, InverterClient, RoverClient, RoverHistoryClient, BatteryClient, DataLogger, Utils
+from logger_config import logger, configure_logging
+from renogybt import DataLogger, Utils
+from renogybt.DataLogger import pvoutput_device
+from renogybt.Collector import create_client
+from renogybt.SinkPipeline import SinkPipeline
+from renogybt.Metrics import start_server
+from renogybt.Heartbeat import start_watchdog
+from renogybt.ReadingCache import start_api
 
 # Configure the logger
 #logging.basicConfig(level=logging.INFO)
@@ -12,18 +18,25 @@ config_file = sys.argv[1] if len(sys.argv) > 1 else 'config.ini'
 config_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), config_file)
 config = configparser.ConfigParser(inline_comment_prefixes=('#'))
 config.read(config_path)
+configure_logging(config)
 data_logger: DataLogger = DataLogger(config)
+start_server(config) # metrics endpoint, when enabled
+start_watchdog(config) # systemd watchdog, when run as a Type=notify service
+start_api(config) # latest readings over HTTP, useful with enable_polling
+sink_pipeline = SinkPipeline() # sinks run off the BLE event loop
 
 # the callback func when you receive data
 def on_data_received(client, data, config):
     filtered_data = Utils.filter_fields(data, config['data']['fields'])
     logger.warning(f"{client.ble_manager.device.name} => {filtered_data}")
     if config['remote_logging'].getboolean('enabled'):
-        data_logger.log_remote(json_data=filtered_data)
+        data_logger.submit(sink_pipeline, 'remote_logging', filtered_data)
     if config['mqtt'].getboolean('enabled'):
-        data_logger.log_mqtt(json_data=filtered_data)
-    if config['pvoutput'].getboolean('enabled') and config['device']['type'] == 'RNG_CTRL':
-        data_logger.log_pvoutput(json_data=filtered_data)
+        data_logger.submit(sink_pipeline, 'mqtt', filtered_data)
+    if config['pvoutput'].getboolean('enabled') and pvoutput_device(config):
+        data_logger.submit(sink_pipeline, 'pvoutput', filtered_data)
+    if config.has_section('timeseries') and config['timeseries'].getboolean('enabled'):
+        data_logger.submit(sink_pipeline, 'timeseries', filtered_data)
     if not config['data'].getboolean('enable_polling'):
         client.stop()
 
@@ -31,18 +44,11 @@ def on_data_received(client, data, config):
 def on_error(client, error, param2=None):  #added param2 to avoid error?
     logger.error(f"on_error: {error}")
 
-# start client
-if config['device']['type'] == 'RNG_CTRL':
-    RoverClient(config, on_data_received, on_error).start()
-elif config['device']['type'] == 'RNG_CTRL_HIST':
-    RoverHistoryClient(config, on_data_received, on_error).start()
-elif config['device']['type'] == 'RNG_BATT':
-    BatteryClient(config, on_data_received, on_error).start()
-elif config['device']['type'] == 'RNG_INVT':
-    InverterClient(config, on_data_received, on_error).start()
-elif config['device']['type'] == 'RNG_DCC':
-    DCChargerClient(config, on_data_received, on_error).start()
-elif config['device']['type'] == 'RNG_SHNT':
-    ShuntClient(config, on_data_received, on_error).start()
-else:
-    logger.error("unknown device type")
+# start client, only the client class of the configured type is imported
+client = create_client(config, on_data_received, on_error)
+
+if client is not None:
+    client.start()
+    # wait for the queued sink calls before exiting
+    if client.loop is not None and not client.loop.is_closed():
+        client.loop.run_until_complete(sink_pipeline.drain())
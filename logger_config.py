@@ -1,32 +1,110 @@
 # logger_config.py
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+import time
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
-def setup_shared_logger():
+LOG_FILE = 'renogy.log'
+LOG_LEVEL = 'INFO'
+RATE_LIMIT_INTERVAL = 60 # per-packet messages are written at most once per interval (seconds)
+RATE_LIMITED = {'rate_limited': True} # pass as extra= to messages logged for every packet or notification
+
+listener = None # QueueListener writing the log file off the event loop
+configured = False
+
+# Drops repeats of a rate limited message (same format string and level) within the interval.
+# The next message that gets through tells how many were suppressed
+class RateLimitFilter(logging.Filter):
+    def __init__(self, interval=RATE_LIMIT_INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self.last = {} # (msg, level) => [time, suppressed]
+
+    def filter(self, record):
+        if self.interval <= 0 or not getattr(record, 'rate_limited', False): return True
+        now = time.monotonic()
+        key = (record.msg, record.levelno)
+        entry = self.last.get(key)
+        if entry is not None and now - entry[0] < self.interval:
+            entry[1] += 1
+            return False
+        if entry is not None and entry[1] > 0:
+            record.msg = f"{record.getMessage()} ({entry[1]} similar messages suppressed)"
+            record.args = None
+        self.last[key] = [now, 0]
+        return True
+
+# Defers bytes.hex() until a packet dump is actually written
+class HexDump:
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return self.data.hex()
+
+def setup_shared_logger(level=LOG_LEVEL, filename=LOG_FILE, use_queue=True, rate_limit_interval=RATE_LIMIT_INTERVAL):
+    global listener
     logger = logging.getLogger('shared_app_logger')
-    logger.setLevel(logging.INFO) # Set desired logging level
-
-    # Prevent adding multiple handlers if the function is called multiple times
-    if not logger.handlers:
-        # Create a RotatingFileHandler
-        # filename: path to the log file
-        # maxBytes: maximum size of the log file before rotation (e.g., 1MB)
-        # backupCount: number of backup log files to keep
-        file_handler = RotatingFileHandler(
-            'renogy.log', 
-            maxBytes=3 * 1024 * 1024, # 3MB
-            backupCount=5
-        )
-        file_handler.setLevel(logging.INFO) # Set handler-specific level
-
-        # Define log formatter
-        formatter = logging.Formatter('%(asctime)s-%(levelname)s: %(message)s')
-        file_handler.setFormatter(formatter)
-
-        # Add the handler to the logger
+    logger.setLevel(level) # Set desired logging level
+
+    # Replace the handlers when the function is called again with new settings
+    if listener is not None:
+        listener.stop()
+        listener = None
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    for log_filter in list(logger.filters):
+        logger.removeFilter(log_filter)
+
+    # Create a RotatingFileHandler
+    # filename: path to the log file
+    # maxBytes: maximum size of the log file before rotation (e.g., 1MB)
+    # backupCount: number of backup log files to keep
+    file_handler = RotatingFileHandler(
+        filename,
+        maxBytes=3 * 1024 * 1024, # 3MB
+        backupCount=5
+    )
+
+    # Define log formatter
+    formatter = logging.Formatter('%(asctime)s-%(levelname)s: %(message)s')
+    file_handler.setFormatter(formatter)
+
+    if use_queue:
+        # the caller only puts the record on a queue, a background thread writes to the SD card
+        listener = QueueListener(queue.SimpleQueue(), file_handler)
+        listener.start()
+        logger.addHandler(QueueHandler(listener.queue))
+    else:
         logger.addHandler(file_handler)
+    logger.addFilter(RateLimitFilter(rate_limit_interval))
 
     return logger
 
+# Applies the [logging] section of config.ini, once per process (the first config file wins)
+def configure_logging(config):
+    global configured
+    if configured or not config.has_section('logging'): return logger
+    configured = True
+    section = config['logging']
+    setup_shared_logger(level=section.get('level', fallback=LOG_LEVEL).upper(),
+                        filename=section.get('file', fallback=LOG_FILE),
+                        use_queue=section.getboolean('queue', fallback=True),
+                        rate_limit_interval=section.getfloat('rate_limit_interval', fallback=RATE_LIMIT_INTERVAL))
+    packet_logger.setLevel(logging.DEBUG if section.getboolean('packet_dump', fallback=False) else logging.WARNING)
+    return logger
+
+@atexit.register
+def stop_listener():
+    # writes the queued records before the process exits
+    if listener is not None: listener.stop()
+
 # Initialize the logger when the module is imported
 logger = setup_shared_logger()
+# Raw packet and frame dumps, enabled with packet_dump = true
+packet_logger = logging.getLogger('shared_app_logger.packets')
+packet_logger.setLevel(logging.WARNING)
@@ -2,20 +2,39 @@ import configparser
 import os
 import sys
 import time
-from logger_config import logger
-from renogybt import ShuntClient, DCChargerClient, InverterClient, RoverClient, RoverHistoryClient, BatteryClient, DataLogger, Utils
+from logger_config import logger, configure_logging
+from renogybt import DataLogger, Utils
+from renogybt.DataLogger import pvoutput_device
+from renogybt.Collector import Collector, create_client, MAX_CONNECTIONS
+from renogybt.SinkPipeline import SinkPipeline
+from renogybt.Metrics import start_server
+from renogybt.Heartbeat import start_watchdog
+from renogybt.ReadingCache import start_api
+
+# sinks run off the BLE event loop, one logger per device alias. Configs are loaded again every loop
+# (and hub members get a copy per run), the alias keeps the same logger and its encoders across loops
+sink_pipeline = SinkPipeline()
+data_loggers = {}
+
+def get_data_logger(config):
+    alias = config['device']['alias']
+    if alias not in data_loggers:
+        data_loggers[alias] = DataLogger(config)
+    return data_loggers[alias]
 
 # the callback func when you receive data
 def on_data_received(client, data, config):
-    data_logger: DataLogger = DataLogger(config)
+    data_logger: DataLogger = get_data_logger(config)
     filtered_data = Utils.filter_fields(data, config['data']['fields'])
     logger.warning(f"{client.ble_manager.device.name} => {filtered_data}")
     if config['remote_logging'].getboolean('enabled'):
-        data_logger.log_remote(json_data=filtered_data)
+        data_logger.submit(sink_pipeline, 'remote_logging', filtered_data)
     if config['mqtt'].getboolean('enabled'):
-        data_logger.log_mqtt(json_data=filtered_data)
-    if config['pvoutput'].getboolean('enabled') and config['device']['type'] == 'RNG_CTRL':
-        data_logger.log_pvoutput(json_data=filtered_data)
+        data_logger.submit(sink_pipeline, 'mqtt', filtered_data)
+    if config['pvoutput'].getboolean('enabled') and pvoutput_device(config):
+        data_logger.submit(sink_pipeline, 'pvoutput', filtered_data)
+    if config.has_section('timeseries') and config['timeseries'].getboolean('enabled'):
+        data_logger.submit(sink_pipeline, 'timeseries', filtered_data)
     if not config['data'].getboolean('enable_polling'):
         client.stop()
 
@@ -23,62 +42,82 @@ def on_data_received(client, data, config):
 def on_error(client, error, param2=None):  #added param2 to avoid error?
     logger.error(f"on_error: {error}")
 
-# Process the configuration file
-def process_config(config_file):
+# Load the configuration file
+def load_config(config_file):
     config_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), config_file)
     config = configparser.ConfigParser(inline_comment_prefixes=('#'))
     config.read(config_path)
+    configure_logging(config) # the first config file sets up logging
+    start_server(config) # metrics endpoint of the first config that enables it
+    start_watchdog(config) # systemd watchdog, when run as a Type=notify service
+    start_api(config) # latest readings over HTTP, when [api] is enabled
+    return config
+
+# Process the configuration file
+def process_config(config_file):
+    config = load_config(config_file)
 
     logger.warning(f"Processing {config_file}...")
 
     # start client
-    if config['device']['type'] == 'RNG_CTRL':
-        RoverClient(config, on_data_received, on_error).start()
-    elif config['device']['type'] == 'RNG_CTRL_HIST':
-        RoverHistoryClient(config, on_data_received, on_error).start()
-    elif config['device']['type'] == 'RNG_BATT':
-        BatteryClient(config, on_data_received, on_error).start()
-    elif config['device']['type'] == 'RNG_INVT':
-        InverterClient(config, on_data_received, on_error).start()
-    elif config['device']['type'] == 'RNG_DCC':
-        DCChargerClient(config, on_data_received, on_error).start()
-    elif config['device']['type'] == 'RNG_SHNT':
-        ShuntClient(config, on_data_received, on_error).start()
-    else:
-        logger.error("unknown device type")
+    client = create_client(config, on_data_received, on_error)
+    if client is not None:
+        client.start()
+        if client.loop is not None and not client.loop.is_closed():
+            client.loop.run_until_complete(sink_pipeline.drain())
 
 loopvalue = 0
 loopcount = 1  # -1 means infinite loop
 count = 1
+concurrent = False
+maxconnections = MAX_CONNECTIONS
+config_files = []
 
 if len(sys.argv) > 1:
+    for arg in sys.argv[1:]:
+        if arg.startswith('-lt:'):
+            try:
+                loopvalue = int(arg[4:])
+            except ValueError:
+                print("Invalid loop value. Please provide a valid integer.")
+                sys.exit(1)
+        elif arg.startswith('-lc:'):
+            try:
+                loopcount = int(arg[4:])
+            except ValueError:
+                print("Invalid loop count. Please provide a valid integer.")
+                sys.exit(1)
+        elif arg == '-cc':
+            concurrent = True
+        elif arg.startswith('-mc:'):
+            try:
+                maxconnections = int(arg[4:])
+            except ValueError:
+                print("Invalid max connections. Please provide a valid integer.")
+                sys.exit(1)
+        elif os.path.isfile(arg):
+            config_files.append(arg)
+        else:
+            print(f"File not found: {arg}")
+            sys.exit(1)
+
     try:
-        while loopcount < 0 or count <= loopcount:
-            for arg in sys.argv[1:]:
-                if arg.startswith('-lt:'):
-                    try:
-                        loopvalue = int(arg[4:])
-                    except ValueError:
-                        print("Invalid loop value. Please provide a valid integer.")
-                        sys.exit(1)
-                elif arg.startswith('-lc:'):
-                    try:
-                        loopcount = int(arg[4:])
-                    except ValueError:
-                        print("Invalid loop count. Please provide a valid integer.")
-                        sys.exit(1)
-                elif os.path.isfile(arg):
-                    process_config(arg)
+        if concurrent:
+            # all devices run as tasks on one event loop, a cycle takes as long as the slowest device
+            logger.warning(f"Processing {len(config_files)} config files concurrently...")
+            collector = Collector([load_config(f) for f in config_files], on_data_received, on_error, max_connections=maxconnections, sinks=sink_pipeline)
+            collector.start(loop_count=loopcount, loop_interval=loopvalue)
+        else:
+            while loopcount < 0 or count <= loopcount:
+                for config_file in config_files:
+                    process_config(config_file)
                     logger.info("Sleeping for {} seconds...".format(10))
                     time.sleep(10)  # wait for 10 seconds before next loop
-                else:
-                    print(f"File not found: {arg}")
-                    sys.exit(1)
 
-            count += 1
-            #if count <= loopcount:
-            logger.info("Sleeping for {} seconds...".format(loopvalue))
-            time.sleep(loopvalue)
+                count += 1
+                #if count <= loopcount:
+                logger.info("Sleeping for {} seconds...".format(loopvalue))
+                time.sleep(loopvalue)
 
     except KeyboardInterrupt:
         print("\nCtrl+C detected. Performing cleanup...")
@@ -87,4 +126,5 @@ else:
     print("Usage: <options> python renogyProcessor.py <config_file1> <config_file2> ...")
     print("   Options: -lt:nn (loop every nn secs)")
     print("            -lc:nn (max number of loops)")
-
+    print("            -cc    (read all devices concurrently on one event loop)")
+    print("            -mc:nn (max concurrent connections per adapter with -cc, default {})".format(MAX_CONNECTIONS))
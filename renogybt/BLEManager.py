@@ -1,46 +1,52 @@
 import asyncio
 import sys
-from bleak import BleakClient, BleakScanner, BLEDevice
-from logger_config import logger
+import time
+from bleak import BleakClient, BLEDevice
+from logger_config import logger, packet_logger, HexDump
+from .DiscoveryService import discovery_service
+from .Metrics import metrics
 
-
-DISCOVERY_TIMEOUT = 5 # max wait time to complete the bluetooth scanning (seconds)
+WRITE_DELAY = 0.5 # pause after each write (seconds), set to 0 when the client paces requests itself
 
 class BLEManager:
-    def __init__(self, mac_address, alias, on_data, on_connect_fail, write_service_uuid, notify_char_uuid, write_char_uuid):
+    def __init__(self, mac_address, alias, on_data, on_connect_fail, write_service_uuid, notify_char_uuid, write_char_uuid, on_disconnect=None):
         self.mac_address = mac_address
         self.device_alias = alias
         self.data_callback = on_data
         self.connect_fail_callback = on_connect_fail
+        self.disconnect_callback = on_disconnect
+        self.closing = False # set while we disconnect on purpose, so it is not reported as link loss
         self.write_service_uuid = write_service_uuid
         self.notify_char_uuid = notify_char_uuid
         self.write_char_uuid = write_char_uuid
         self.write_char_handle = None
+        self.write_delay = WRITE_DELAY
         self.device: BLEDevice = None
         self.client: BleakClient = None
         self.discovered_devices = []
 
     async def discover(self):
-        mac_address = self.mac_address.upper()
-        logger.info("Starting discovery...")
-        self.discovered_devices = await BleakScanner.discover(timeout=DISCOVERY_TIMEOUT)
-        logger.info("Devices found: %s", len(self.discovered_devices))
-
-        for dev in self.discovered_devices:
-            if dev.address != None and (dev.address.upper() == mac_address or (dev.name and dev.name.strip() == self.device_alias)):
-                logger.info(f"Found matching device {dev.name} => {dev.address}")
-                self.device = dev
+        self.device = await discovery_service.find(self.mac_address, self.device_alias)
+        self.discovered_devices = discovery_service.discovered_devices
+        if self.device:
+            logger.info(f"Found matching device {self.device.name} => {self.device.address}")
 
     async def connect(self):
         if not self.device: return logger.error("No device connected!")
 
         logger.info(f'BLEManager.connect {self.notify_char_uuid} {self.write_service_uuid} {self.write_char_uuid}')
 
-        self.client = BleakClient(self.device)
+        self.closing = False
+        self.client = BleakClient(self.device, disconnected_callback=self.on_disconnected)
+        start = time.perf_counter()
         try:
             await self.client.connect()
             logger.info(f"Client connection: {self.client.is_connected}")
-            if not self.client.is_connected: return logger.error("Unable to connect")
+            if not self.client.is_connected:
+                metrics.inc('renogy_connect_failures_total', device=self.device_alias)
+                return logger.error("Unable to connect")
+            connected = time.perf_counter()
+            metrics.observe('renogy_connect_seconds', connected - start, device=self.device_alias)
 
             for service in self.client.services:
                 for characteristic in service.characteristics:
@@ -50,11 +56,19 @@ class BLEManager:
                     if self.write_char_uuid != "" and characteristic.uuid == self.write_char_uuid and service.uuid == self.write_service_uuid:
                         self.write_char_handle = characteristic.handle
                         logger.info(f"found write characteristic {characteristic.uuid}, service {service.uuid}")
+            metrics.observe('renogy_services_seconds', time.perf_counter() - connected, device=self.device_alias)
 
         except Exception as e:
             logger.error(f"Error connecting to device {e}")
+            metrics.inc('renogy_connect_failures_total', device=self.device_alias)
+            discovery_service.forget(self.mac_address, self.device_alias) # the cached device may be stale, rescan next time
             self.connect_fail_callback(sys.exc_info())
 
+    def on_disconnected(self, client):
+        if self.closing or client is not self.client: return
+        logger.warning(f"Link lost: {self.device.name} {self.device.address}")
+        if self.disconnect_callback is not None: self.disconnect_callback()
+
     async def notification_callback(self, characteristic, data: bytearray):
         #logger.info("notification_callback")
         await self.data_callback(data)
@@ -62,16 +76,17 @@ class BLEManager:
     async def characteristic_write_value(self, data):
         if self.write_char_handle is not None:
             try:
-                logger.info(f'writing to {self.write_char_uuid} {data}')
+                packet_logger.debug("%s => %s", self.device_alias, HexDump(data))
                 await self.client.write_gatt_char(self.write_char_handle, bytearray(data), response=False)
-                logger.info('characteristic_write_value succeeded')
-                await asyncio.sleep(0.5)
+                logger.debug("characteristic_write_value succeeded")
+                if self.write_delay > 0: await asyncio.sleep(self.write_delay)
             except Exception as e:
-                logger.info(f'characteristic_write_value failed {e}')
+                logger.info("characteristic_write_value failed %s", e)
         else:
             logger.error(f'characteristic_write_value not called since write_char_handle is None')
 
     async def disconnect(self):
+        self.closing = True
         if self.client and self.client.is_connected:
             logger.info(f"Exit: Disconnecting device: {self.device.name} {self.device.address}")
             await self.client.disconnect()
@@ -1,18 +1,36 @@
 import sys
+import random
 import asyncio
 import configparser
+import time
 import traceback
-from logger_config import logger
+from logger_config import logger, packet_logger, HexDump, RATE_LIMITED
 from .BLEManager import BLEManager
-from .Utils import bytes_to_int, crc16_modbus, int_to_bytes
+from .FrameAssembler import FrameAssembler
+from .Metrics import metrics
+from . import Heartbeat
+from .ReadingCache import reading_cache
+from .Utils import bytes_to_int, modbus_request
+from .Pacing import get_pacing, MAX_RETRIES
+from .ReadPlanner import plan_reads, single_request, split_request, slice_response, MAX_READ_WORDS, MAX_READ_GAP
 
 # Base class that works with all Renogy family devices
 # Should be extended by each client with its own parsers and section definitions
 # Section example: {'register': 5000, 'words': 8, 'parser': self.parser_func}
+# Optional 'refresh' tag of a section: 'static' values (model, address...) are read once per connection,
+# 'slow' ones every slow_read_interval reads, 'fast' ones (the default) on every read. The values of
+# static and slow sections are cached and merged into every reading.
 
 ALIAS_PREFIXES = ['BT-TH', 'RNGRBP', 'BTRIC', 'RTMShunt300', 'Shunt300', 'RNGRIU']
 READ_SUCCESS = 3
 READ_ERROR = 131
+REQUEST_DELAY = 0.5 # pause before the next request when adaptive pacing is off (seconds)
+RECONNECT_BASE_DELAY = 2 # first reconnect attempt after link loss (seconds), doubled on every failure
+RECONNECT_MAX_DELAY = 300 # (seconds)
+STATIC = 'static'
+SLOW = 'slow'
+FAST = 'fast'
+SLOW_READ_INTERVAL = 10 # reads
 
 class BaseClient:
     def __init__(self, config):
@@ -33,8 +51,37 @@ class BaseClient:
         self.data = {}
         self.device_id = self.config['device'].getint('device_id')
         self.sections = []
-        self.section_index = 0
+        self.read_plan = None # requests of the current read, see get_read_plan()
+        self.read_plans = {} # refresh tags => planned requests
+        self.max_read_words = MAX_READ_WORDS # largest merged request the device answers, max_read_words in [data] overrides it
+        self.section_index = 0 # index of the current request in the read plan
+        self.assembler = FrameAssembler()
         self.loop = None
+        self.future = None
+        self.connection_limiter = None # optional asyncio.Semaphore shared by clients on the same adapter
+        self.holds_connection = False
+        self.share_connection = False # more devices than connection slots on the adapter: disconnect between polls
+        # Keep the connection open between polls and reconnect with backoff when the link is lost
+        self.persistent = (self.config['data'].getboolean('enable_polling', fallback=False) and
+                           self.config['data'].getboolean('persistent_connection', fallback=False))
+        self.reconnect_max_delay = self.config['data'].getint('reconnect_max_delay', fallback=RECONNECT_MAX_DELAY)
+        self.reconnecting = False
+        self.poll_task = None
+        # Send the next request as soon as the response checked out, after a gap learned per device
+        self.adaptive_pacing = self.config['data'].getboolean('adaptive_pacing', fallback=False)
+        self.pacing = None
+        self.response_timeout = None
+        self.retries = 0
+        self.awaiting_response = False # a request was written and not answered yet
+        self.resent = False # the last answered request was resent, its first answer may still come in
+        self.alias = self.config['device']['alias'] # device label of the metrics
+        self.request_start = None # perf_counter() of the last request write
+        self.read_start = None # perf_counter() of the first request of the current read
+        # Read static sections once per connection and slow ones every few reads
+        self.cache_reads = self.config['data'].getboolean('cache_static_reads', fallback=True)
+        self.slow_read_interval = max(1, self.config['data'].getint('slow_read_interval', fallback=SLOW_READ_INTERVAL))
+        self.cached_data = {} # values of the static and slow sections
+        self.reads = 0 # completed reads on the current connection
         logger.info(f"BaseClient.Init {self.__class__.__name__}: {self.config['device']['alias']} => {self.config['device']['mac_addr']}")
 
     def start(self):
@@ -49,18 +96,37 @@ class BaseClient:
 
                 asyncio.set_event_loop(self.loop)
 
-            self.loop.create_task(self.connect())
-            self.future = self.loop.create_future()
-            self.loop.run_until_complete(self.future)
+            self.loop.run_until_complete(self.run())
         except Exception as e:
             self.__on_error(e)
         except KeyboardInterrupt:
             self.loop = None
             self.__on_error("KeyboardInterrupt")
 
+    # Runs the client on the current event loop until it is stopped.
+    # Allows several clients to share one loop (see Collector)
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.loop.create_task(self.connect())
+        await self.future
+
+    async def acquire_connection(self):
+        if self.connection_limiter is not None and not self.holds_connection:
+            await self.connection_limiter.acquire()
+            self.holds_connection = True
+
+    def release_connection(self):
+        if self.holds_connection:
+            self.holds_connection = False
+            self.connection_limiter.release()
+
     async def connect(self):
         logger.info(f'BaseClient.connect {self.G_NOTIFY_CHAR_UUID} {self.G_WRITE_SERVICE_UUID} {self.G_WRITE_CHAR_UUID} {self.G_READ_TIMEOUT}')
-        self.ble_manager = BLEManager(mac_address=self.config['device']['mac_addr'], alias=self.config['device']['alias'], on_data=self.on_data_received, on_connect_fail=self.__on_connect_fail, notify_char_uuid=self.G_NOTIFY_CHAR_UUID, write_char_uuid=self.G_WRITE_CHAR_UUID, write_service_uuid=self.G_WRITE_SERVICE_UUID)
+        self.ble_manager = BLEManager(mac_address=self.config['device']['mac_addr'], alias=self.config['device']['alias'], on_data=self.on_notification, on_connect_fail=self.__on_connect_fail, on_disconnect=self.on_link_lost, notify_char_uuid=self.G_NOTIFY_CHAR_UUID, write_char_uuid=self.G_WRITE_CHAR_UUID, write_service_uuid=self.G_WRITE_SERVICE_UUID)
+        if self.adaptive_pacing:
+            self.pacing = get_pacing(self.config['device']['mac_addr'], self.device_id)
+            self.ble_manager.write_delay = 0
         self.discovery_timeout = self.loop.call_later(self.G_DISCOVERY_TIMEOUT, self.on_discovery_timeout)
         await self.ble_manager.discover()
 
@@ -73,62 +139,274 @@ class BaseClient:
                     logger.info(f"Other Device found ====> {dev.name} > [{dev.address}]")
             self.stop()
         else:
+            # waiting for a connection slot is no bluetooth outage, the timeout restarts once the slot is ours
+            if self.discovery_timeout and not self.discovery_timeout.cancelled(): self.discovery_timeout.cancel()
             self.is_running = True
+            await self.acquire_connection() # wait for a free connection slot on the adapter
+            if not self.is_running: return self.release_connection() # stopped while waiting
+            self.discovery_timeout = self.loop.call_later(self.G_DISCOVERY_TIMEOUT, self.on_discovery_timeout)
             await self.ble_manager.connect()
-            if self.ble_manager.client and self.ble_manager.client.is_connected: await self.read_section()
+            if self.ble_manager.client and self.ble_manager.client.is_connected:
+                self.reset_session()
+                await self.read_section()
+
+    # A new connection starts with a read of all sections
+    def reset_session(self):
+        self.reads = 0
+        self.cached_data = {}
+        self.read_plan = None
 
     async def disconnect(self):
         self.is_running = False
-        await self.ble_manager.disconnect()
-        self.future.set_result('DONE')
+        if self.discovery_timeout and not self.discovery_timeout.cancelled(): self.discovery_timeout.cancel()
+        try:
+            if self.ble_manager: await self.ble_manager.disconnect()
+        finally:
+            self.release_connection()
+            if self.future and not self.future.done(): self.future.set_result('DONE')
+
+    # Notifications are joined into complete frames with a valid CRC before they reach on_data_received
+    async def on_notification(self, data):
+        errors = self.assembler.errors
+        crc_failures = self.assembler.crc_failures
+        for frame in self.assembler.feed(data):
+            await self.on_data_received(frame)
+        if self.assembler.crc_failures > crc_failures:
+            metrics.inc('renogy_crc_errors_total', self.assembler.crc_failures - crc_failures, device=self.alias)
+        if self.assembler.errors > errors:
+            logger.warning("on_notification: dropped %d bytes while resyncing", self.assembler.errors - errors, extra=RATE_LIMITED)
+            if self.pacing is not None: self.pacing.on_failure()
 
     async def on_data_received(self, response):
-        logger.info(f"BaseClient.on_data_received: start")
+        logger.debug("BaseClient.on_data_received: start")
+        packet_logger.debug("%s <= %s", self.alias, HexDump(response))
         if self.read_timeout and not self.read_timeout.cancelled(): self.read_timeout.cancel()
         if self.discovery_timeout and not self.discovery_timeout.cancelled(): self.discovery_timeout.cancel()
         operation = bytes_to_int(response, 1, 1)
 
         if operation == READ_SUCCESS or operation == READ_ERROR:
+            read_plan = self.get_read_plan()
+            request = read_plan[self.section_index] if self.section_index < len(read_plan) else None
+            if self.pacing is not None and not await self.check_paced_response(request, response, operation): return
+            if request is not None and self.request_start is not None:
+                metrics.observe('renogy_request_seconds', time.perf_counter() - self.request_start, device=self.alias, register=request['register'])
+                self.request_start = None
             if (operation == READ_SUCCESS and
-                self.section_index < len(self.sections) and
-                self.sections[self.section_index]['parser'] != None and
-                self.sections[self.section_index]['words'] * 2 + 5 == len(response)):
-                # call the parser and update data
-                logger.info(f"on_data_received: read operation success")
-                self.__safe_parser(self.sections[self.section_index]['parser'], response)
+                request is not None and
+                request['words'] * 2 + 5 == len(response)):
+                # call the parsers and update data
+                logger.debug("on_data_received: read operation success")
+                self.parse_response(request, response)
+            elif operation == READ_ERROR and request is not None and len(request['sections']) > 1:
+                metrics.inc('renogy_read_errors_total', device=self.alias, register=request['register'])
+                # the device rejected the merged range, most likely a gap register it does not implement
+                logger.warning("on_data_received: merged read of register %s rejected, reading its sections one by one", request['register'])
+                read_plan[self.section_index:self.section_index + 1] = split_request(request)
+                await self.wait_before_request()
+                return await self.read_section()
             else:
-                logger.info(f"on_data_received: read operation failed: {response.hex()}")
+                if request is not None: metrics.inc('renogy_read_errors_total', device=self.alias, register=request['register'])
+                logger.info("on_data_received: read operation failed: %s", response.hex())
 
-            if self.section_index >= len(self.sections) - 1: # last section, read complete
+            if self.section_index >= len(read_plan) - 1: # last request, read complete
                 self.section_index = 0
                 self.on_read_operation_complete()
                 self.data = {}
-                await self.check_polling()
+                self.poll_task = self.loop.create_task(self.check_polling())
             else:
                 self.section_index += 1
-                await asyncio.sleep(0.5)
+                await self.wait_before_request()
                 await self.read_section()
         else:
-            logger.warning("on_data_received: unknown operation={}".format(operation))
+            logger.warning("on_data_received: unknown operation=%s", operation, extra=RATE_LIMITED)
+
+    # Returns False when the response must not advance the read: a stray frame (e.g. the late answer
+    # to a resent request) is ignored. Frames arrive CRC checked from the assembler
+    async def check_paced_response(self, request, response, operation):
+        if not self.awaiting_response:
+            # a function 3 answer does not echo the register, a late answer to a resent request is only
+            # told apart by arriving while no request is outstanding (see wait_before_request)
+            logger.info("on_data_received: ignoring a frame while no request is outstanding: %s", response.hex())
+            return False
+        if operation == READ_SUCCESS and request is not None and (response[2] != request['words'] * 2 or request['words'] * 2 + 5 != len(response)):
+            logger.info("on_data_received: ignoring unexpected frame: %s", response.hex())
+            return False # keep waiting, the response timeout is still running
+        if self.response_timeout and not self.response_timeout.cancelled(): self.response_timeout.cancel()
+        self.pacing.on_success()
+        self.awaiting_response = False
+        self.resent = self.retries > 0
+        self.retries = 0
+        return True
+
+    async def wait_before_request(self):
+        if self.pacing is None: return await asyncio.sleep(REQUEST_DELAY)
+        # after a resend the first answer may still arrive, it must come in before the next request is written
+        await asyncio.sleep(max(self.pacing.gap, self.pacing.response_timeout()) if self.resent else self.pacing.gap)
+        self.resent = False
+
+    def on_response_timeout(self):
+        logger.warning("on_response_timeout => no response after %.1f seconds", self.pacing.response_timeout())
+        metrics.inc('renogy_timeouts_total', device=self.alias, phase='response')
+        self.pacing.on_failure()
+        self.loop.create_task(self.retry_read())
+
+    async def retry_read(self):
+        if self.retries >= MAX_RETRIES:
+            self.retries = 0
+            return self.on_read_timeout()
+        self.retries += 1
+        if self.read_timeout and not self.read_timeout.cancelled(): self.read_timeout.cancel()
+        await self.wait_before_request()
+        if self.is_running: await self.read_section()
+
+    def parse_response(self, request, response):
+        if len(request['sections']) == 1:
+            self.parse_section(request['sections'][0][1], response)
+            return
+        for offset, section in request['sections']:
+            if section['parser'] is not None:
+                self.parse_section(section, slice_response(response, offset, section['words']))
+
+    # Values of static and slow sections are kept aside to be merged into the readings that skip them
+    def parse_section(self, section, frame):
+        if not self.cache_reads or section.get('refresh', FAST) == FAST:
+            return self.__safe_parser(section['parser'], frame)
+        data, self.data = self.data, {}
+        try:
+            self.__safe_parser(section['parser'], frame)
+        finally:
+            values, self.data = self.data, data
+        self.cached_data.update(values)
+        self.data.update(values)
+
+    # Refresh tags of the sections due in the next read
+    def refresh_tags(self):
+        if not self.cache_reads or self.reads == 0: return (STATIC, SLOW, FAST)
+        if self.reads % self.slow_read_interval == 0 and any(section.get('refresh') == SLOW for section in self.sections):
+            return (SLOW, FAST)
+        return (FAST,)
+
+    # Plan of the next read, chosen when the previous one completed. Adjacent sections are merged
+    # into one request unless coalesce_reads is disabled
+    def get_read_plan(self):
+        if self.read_plan is None:
+            tags = self.refresh_tags()
+            if tags not in self.read_plans:
+                sections = [section for section in self.sections if section.get('refresh', FAST) in tags]
+                if len(sections) == 0: sections = self.sections # nothing but static sections, read them all
+                data_config = self.config['data']
+                if data_config.getboolean('coalesce_reads', fallback=True):
+                    plan = plan_reads(sections,
+                                      max_words=int(data_config.get('max_read_words', '').strip() or self.max_read_words),
+                                      max_gap=data_config.getint('max_read_gap', fallback=MAX_READ_GAP))
+                else:
+                    plan = [single_request(section) for section in sections]
+                self.read_plans[tags] = plan
+                logger.info(f"Read plan ({', '.join(tags)}): {len(sections)} sections in {len(plan)} requests")
+            self.read_plan = self.read_plans[tags]
+        return self.read_plan
 
     def on_read_operation_complete(self):
-        logger.info("on_read_operation_complete")
+        logger.debug("on_read_operation_complete")
+        if self.read_start is not None: metrics.observe('renogy_read_seconds', time.perf_counter() - self.read_start, device=self.alias)
+        if len(self.cached_data) > 0: self.data = {**self.cached_data, **self.data}
         self.data['__device'] = self.config['device']['alias']
         self.data['__client'] = self.__class__.__name__
+        self.reads += 1
+        self.read_plan = None
+        self.on_reading()
         self.__safe_callback(self.on_data_callback, self.data, self.config)
 
+    # Bookkeeping of every successful read: metrics, the liveness heartbeat and the reading cache
+    def on_reading(self):
+        metrics.inc('renogy_readings_total', device=self.alias)
+        Heartbeat.beat(self.config, self.alias)
+        reading_cache.update(self.alias, self.data)
+
     def on_read_timeout(self):
         logger.error("on_read_timeout => Timed out! Please check your device_id!")
-        self.stop()
+        metrics.inc('renogy_timeouts_total', device=self.alias, phase='read')
+        if self.persistent and self.is_running:
+            # a single lost response should not end a long-lived session, retry at the next poll
+            self.section_index = 0
+            self.data = {}
+            if self.ble_manager.client and self.ble_manager.client.is_connected:
+                self.poll_task = self.loop.create_task(self.check_polling())
+            else:
+                self.loop.create_task(self.reconnect())
+        else:
+            self.stop()
 
     def on_discovery_timeout(self):
         logger.error("on_discovery_timeout => Timed out! Bluetooth outage?")
+        metrics.inc('renogy_timeouts_total', device=self.alias, phase='discovery')
         self.stop()
 
     async def check_polling(self):
         if self.config['data'].getboolean('enable_polling'): 
+            if self.share_connection: await self.hand_on_connection()
             await asyncio.sleep(self.config['data'].getint('poll_interval'))
-            await self.read_section()
+            if self.share_connection and not await self.take_back_connection(): return
+            if self.is_running and not self.reconnecting: await self.read_section()
+
+    # Disconnects and frees the connection slot for the devices waiting on the adapter
+    async def hand_on_connection(self):
+        await self.ble_manager.disconnect()
+        self.release_connection()
+
+    # Waits for a slot and connects again, False when the client was stopped or did not connect
+    async def take_back_connection(self):
+        await self.acquire_connection()
+        if not self.is_running:
+            self.release_connection()
+            return False
+        self.discovery_timeout = self.loop.call_later(self.G_DISCOVERY_TIMEOUT, self.on_discovery_timeout)
+        await self.ble_manager.connect()
+        if not (self.ble_manager.client and self.ble_manager.client.is_connected): return False # stopped by the connect failure
+        self.assembler.reset()
+        self.reset_session()
+        return True
+
+    def on_link_lost(self):
+        if not self.is_running: return
+        logger.warning(f"Connection lost: {self.config['device']['alias']} => {self.config['device']['mac_addr']}")
+        metrics.inc('renogy_link_lost_total', device=self.alias)
+        if self.read_timeout and not self.read_timeout.cancelled(): self.read_timeout.cancel()
+        if self.response_timeout and not self.response_timeout.cancelled(): self.response_timeout.cancel()
+        if self.persistent:
+            self.loop.create_task(self.reconnect())
+        else:
+            self.stop()
+
+    # Reconnects with exponential backoff and jitter until the link is back or the client is stopped.
+    # The polling cycle restarts from the first section once connected.
+    async def reconnect(self):
+        if self.reconnecting: return
+        self.reconnecting = True
+        if self.poll_task and not self.poll_task.done(): self.poll_task.cancel()
+        attempt = 0
+        try:
+            while self.is_running:
+                delay = min(self.reconnect_max_delay, RECONNECT_BASE_DELAY * 2 ** attempt)
+                delay = random.uniform(delay / 2, delay)
+                attempt += 1
+                logger.info(f"Reconnect attempt {attempt} in {delay:.1f} seconds")
+                await asyncio.sleep(delay)
+                if not self.is_running: break
+
+                await self.ble_manager.discover()
+                if self.ble_manager.device: await self.ble_manager.connect()
+                if self.ble_manager.client and self.ble_manager.client.is_connected:
+                    logger.info(f"Reconnected after {attempt} attempts")
+                    self.section_index = 0
+                    self.data = {}
+                    self.assembler.reset()
+                    self.reset_session()
+                    self.reconnecting = False
+                    await self.read_section()
+                    return
+        finally:
+            self.reconnecting = False
 
     async def read_section(self):
         index = self.section_index
@@ -136,25 +414,25 @@ class BaseClient:
             return logger.error("BaseClient cannot be used directly")
 
         self.read_timeout = self.loop.call_later(self.G_READ_TIMEOUT, self.on_read_timeout)
-        logger.info("Started read timeout for {} seconds".format(self.G_READ_TIMEOUT))
-        request = self.create_generic_read_request(self.device_id, 3, self.sections[index]['register'], self.sections[index]['words']) 
+        logger.debug("Started read timeout for %s seconds", self.G_READ_TIMEOUT)
+        if self.assembler.pending() > 0:
+            logger.info("read_section: discarding %d bytes of an incomplete response", self.assembler.pending())
+            self.assembler.reset()
+        read_plan = self.get_read_plan()
+        request = self.create_generic_read_request(self.device_id, 3, read_plan[index]['register'], read_plan[index]['words']) 
+        if self.pacing is not None:
+            self.awaiting_response = True
+            self.pacing.on_sent()
+            self.response_timeout = self.loop.call_later(self.pacing.response_timeout(), self.on_response_timeout)
+        self.request_start = time.perf_counter()
+        if index == 0 and self.retries == 0: self.read_start = self.request_start
         await self.ble_manager.characteristic_write_value(request)
 
     def create_generic_read_request(self, device_id, function, regAddr, readWrd):                             
         data = None                                
         if regAddr != None and readWrd != None:
-            data = []
-            data.append(device_id)
-            data.append(function)
-            data.append(int_to_bytes(regAddr, 0))
-            data.append(int_to_bytes(regAddr, 1))
-            data.append(int_to_bytes(readWrd, 0))
-            data.append(int_to_bytes(readWrd, 1))
-
-            crc = crc16_modbus(bytes(data))
-            data.append(crc[0])
-            data.append(crc[1])
-            logger.debug("{} {} => {}".format("create_request_payload", regAddr, data))
+            data = modbus_request(device_id, function, regAddr, readWrd)
+            packet_logger.debug("create_request_payload %s => %s", regAddr, HexDump(data))
         return data
 
     def __on_error(self, error = None):
@@ -165,10 +443,15 @@ class BaseClient:
     def __on_connect_fail(self, error):
         logger.error(f"Connection failed: {error}")
         self.__safe_callback(self.on_error_callback, error)
-        self.stop()
+        if self.persistent and self.is_running:
+            self.loop.create_task(self.reconnect()) # no-op while a reconnect loop is already retrying
+        else:
+            self.stop()
 
     def stop(self):
         if self.read_timeout and not self.read_timeout.cancelled(): self.read_timeout.cancel()
+        if self.response_timeout and not self.response_timeout.cancelled(): self.response_timeout.cancel()
+        if self.poll_task and not self.poll_task.done(): self.poll_task.cancel()
         if self.loop is None:
             self.loop = asyncio.get_event_loop()
             self.loop.create_task(self.disconnect())
@@ -1,4 +1,5 @@
 from .BaseClient import BaseClient
+from .RegisterMap import RegisterMap, Field
 from .Utils import bytes_to_int, format_temperature
 
 # Client for Renogy LFP battery with built-in bluetooth / BT-2 module
@@ -8,6 +9,14 @@ FUNCTION = {
     6: "WRITE"
 }
 
+BATTERY_INFO = RegisterMap([
+    Field('function', 1, 1, enum = FUNCTION),
+    Field('current', 3, signed = True, scale = 0.01),
+    Field('voltage', 5, scale = 0.1),
+    Field('remaining_charge', 7, 4, scale = 0.001),
+    Field('capacity', 11, 4, scale = 0.001)
+])
+
 class BatteryClient(BaseClient):
     def __init__(self, config, on_data_callback=None, on_error_callback=None):
         super().__init__(config)
@@ -18,8 +27,8 @@ class BatteryClient(BaseClient):
             {'register': 5000, 'words': 17, 'parser': self.parse_cell_volt_info},
             {'register': 5017, 'words': 17, 'parser': self.parse_cell_temp_info},
             {'register': 5042, 'words': 6, 'parser': self.parse_battery_info},
-            {'register': 5122, 'words': 8, 'parser': self.parse_device_info},
-            {'register': 5223, 'words': 1, 'parser': self.parse_device_address}
+            {'register': 5122, 'words': 8, 'parser': self.parse_device_info, 'refresh': 'static'},
+            {'register': 5223, 'words': 1, 'parser': self.parse_device_address, 'refresh': 'static'}
         ]
 
     def parse_cell_volt_info(self, bs):
@@ -40,13 +49,7 @@ class BatteryClient(BaseClient):
         self.data.update(data)
 
     def parse_battery_info(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['current'] = bytes_to_int(bs, 3, 2, True, scale = 0.01)
-        data['voltage'] = bytes_to_int(bs, 5, 2, scale = 0.1)
-        data['remaining_charge'] = bytes_to_int(bs, 7, 4, scale = 0.001)
-        data['capacity'] = bytes_to_int(bs, 11, 4, scale = 0.001)
-        self.data.update(data)
+        self.data.update(BATTERY_INFO.decode(bs))
 
     def parse_device_info(self, bs):
         data = {}
@@ -0,0 +1,72 @@
+import time
+
+# Change-only publishing: remembers the values last sent to a sink and passes on only the fields
+# that moved by more than their deadband, so unchanged readings (model, device id, lifetime
+# counters, ...) stop using bandwidth. A deadband is absolute ('0.05') or relative to the last sent
+# value ('2%'). A full snapshot is still sent every snapshot_interval, so late subscribers catch up.
+# Fields starting with '__' (device name, client type) are always kept.
+
+SNAPSHOT_INTERVAL = 15 # (minutes)
+
+filters = {}
+
+# one filter per device and sink, kept across polling loops and config reloads
+def get_filter(config, sink):
+    key = (config['device']['alias'], sink)
+    if key not in filters:
+        deadband_config = config['deadband']
+        # raw: percent deadbands ('2%') are not interpolation syntax
+        filters[key] = ChangeFilter(parse_deadbands(deadband_config.get('fields', '', raw=True)),
+                                    default=parse_deadband(deadband_config.get('default', '0', raw=True)),
+                                    always=[field.strip() for field in deadband_config.get('always', '').split(',') if field.strip()],
+                                    snapshot_interval=deadband_config.getfloat('snapshot_interval', fallback=SNAPSHOT_INTERVAL) * 60)
+    return filters[key]
+
+def filtered_sinks(config):
+    if not config.has_section('deadband') or not config['deadband'].getboolean('enabled', fallback=False): return []
+    return [sink.strip() for sink in config['deadband'].get('sinks', 'mqtt, remote_logging').split(',')]
+
+# 'battery_voltage:0.05, pv_power:2%' => {'battery_voltage': (0.05, False), 'pv_power': (2.0, True)}
+def parse_deadbands(value):
+    deadbands = {}
+    for entry in value.split(','):
+        if ':' not in entry: continue
+        field, deadband = entry.split(':', 1)
+        deadbands[field.strip()] = parse_deadband(deadband)
+    return deadbands
+
+def parse_deadband(value):
+    value = value.strip()
+    if value.endswith('%'): return (float(value[:-1]), True)
+    return (float(value or 0), False)
+
+class ChangeFilter:
+    def __init__(self, deadbands=None, default=(0, False), always=None, snapshot_interval=SNAPSHOT_INTERVAL * 60):
+        self.deadbands = deadbands or {}
+        self.default = default
+        self.always = set(always or [])
+        self.snapshot_interval = snapshot_interval
+        self.sent = {} # field => last value sent
+        self.snapshot_time = None
+
+    def changed(self, field, value):
+        if field not in self.sent: return True
+        last = self.sent[field]
+        if not isinstance(value, (int, float)) or not isinstance(last, (int, float)): return value != last
+        deadband, relative = self.deadbands.get(field, self.default)
+        if relative: deadband = abs(last) * deadband / 100
+        return abs(value - last) > deadband if deadband > 0 else value != last
+
+    # Returns the fields to send, or None when nothing changed
+    def apply(self, data, now=None):
+        now = time.time() if now is None else now
+        if self.snapshot_time is None or now - self.snapshot_time >= self.snapshot_interval:
+            self.snapshot_time = now
+            self.sent = dict(data)
+            return data
+        changes = {field: value for field, value in data.items() if self.changed(field, value)}
+        self.sent.update(changes)
+        if not any(not field.startswith('__') and field not in self.always for field in changes): return None
+        for field, value in data.items():
+            if field.startswith('__') or field in self.always: changes[field] = value
+        return changes
@@ -0,0 +1,101 @@
+import asyncio
+import importlib
+import time
+from collections import Counter
+from logger_config import logger
+from .DiscoveryService import discovery_service
+
+# Runs every configured client as a task on one shared event loop instead of one device after another.
+# Clients on the same adapter share a semaphore which limits the number of concurrent BLE connections.
+# When an adapter has more devices than connection slots, polling clients disconnect and hand their
+# slot on between polls, and persistent connections are not possible there (they would keep the slot).
+
+# device type => client class, imported when a config of that type is used
+CLIENT_TYPES = {
+    'RNG_CTRL': 'RoverClient',
+    'RNG_CTRL_HIST': 'RoverHistoryClient',
+    'RNG_BATT': 'BatteryClient',
+    'RNG_INVT': 'InverterClient',
+    'RNG_DCC': 'DCChargerClient',
+    'RNG_SHNT': 'ShuntClient'
+}
+
+DEFAULT_ADAPTER = 'default'
+MAX_CONNECTIONS = 2 # concurrent connections per adapter
+
+def adapter_name(config):
+    return config['device'].get('adapter', DEFAULT_ADAPTER).strip() or DEFAULT_ADAPTER
+
+def create_client(config, on_data_callback=None, on_error_callback=None):
+    if config['device'].get('hub_devices', '').strip():
+        class_name = 'HubClient' # several devices behind one BT-2 connection
+    else:
+        class_name = CLIENT_TYPES.get(config['device']['type'])
+    if class_name is None:
+        logger.error(f"unknown device type {config['device']['type']}")
+        return None
+    client_class = getattr(importlib.import_module(f".{class_name}", __package__), class_name)
+    return client_class(config, on_data_callback, on_error_callback)
+
+class Collector:
+    def __init__(self, configs, on_data_callback=None, on_error_callback=None, max_connections=MAX_CONNECTIONS, sinks=None):
+        self.configs = list(configs)
+        self.sinks = sinks # optional SinkPipeline, drained before the event loop ends
+        self.on_data_callback = on_data_callback
+        self.on_error_callback = on_error_callback
+        self.max_connections = max(1, max_connections)
+        self.limiters = {}
+        self.cycle = 0
+        self.devices = Counter(adapter_name(config) for config in self.configs) # adapter => devices (a hub is one)
+        for adapter, count in self.devices.items():
+            if count > self.max_connections:
+                logger.warning(f"Collector: {count} devices share {self.max_connections} connection slots on adapter {adapter}, "
+                               "polling devices disconnect between polls and persistent_connection is ignored there")
+
+    def get_limiter(self, config):
+        adapter = adapter_name(config)
+        if adapter not in self.limiters:
+            self.limiters[adapter] = asyncio.Semaphore(self.max_connections)
+        return self.limiters[adapter]
+
+    async def run_client(self, config):
+        client = create_client(config, self.on_data_callback, self.on_error_callback)
+        if client is None: return
+        client.connection_limiter = self.get_limiter(config)
+        if self.devices[adapter_name(config)] > self.max_connections:
+            client.share_connection = True
+            client.persistent = False
+        try:
+            await client.run()
+        except Exception as e:
+            logger.error(f"Collector: {config['device']['alias']} failed: {e}")
+            await client.disconnect()
+
+    async def run_cycle(self):
+        if len(self.configs) == 0: return
+        # asyncio.Semaphore wakes waiters in FIFO order, so rotating the start order
+        # each cycle keeps the same device from always waiting at the back of the queue
+        offset = self.cycle % len(self.configs)
+        ordered = self.configs[offset:] + self.configs[:offset]
+        self.cycle += 1
+
+        # one shared scan covers every device of the cycle and stops once all of them were seen
+        for config in ordered:
+            discovery_service.register(config['device']['mac_addr'], config['device']['alias'])
+
+        start = time.perf_counter()
+        await asyncio.gather(*(self.run_client(config) for config in ordered))
+        logger.info(f"Collector: cycle {self.cycle} with {len(ordered)} devices took {time.perf_counter() - start:.1f} seconds")
+
+    async def run(self, loop_count=1, loop_interval=0):
+        count = 1
+        while loop_count < 0 or count <= loop_count:
+            await self.run_cycle()
+            count += 1
+            if loop_count < 0 or count <= loop_count:
+                logger.info("Sleeping for {} seconds...".format(loop_interval))
+                await asyncio.sleep(loop_interval)
+        if self.sinks is not None: await self.sinks.drain()
+
+    def start(self, loop_count=1, loop_interval=0):
+        asyncio.run(self.run(loop_count, loop_interval))
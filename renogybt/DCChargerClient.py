@@ -1,5 +1,6 @@
 from logger_config import logger
 from .BaseClient import BaseClient
+from .RegisterMap import RegisterMap, Field
 from .Utils import bytes_to_int, parse_temperature
 
 FUNCTION = {
@@ -26,6 +27,32 @@ BATTERY_TYPE = {
     5: 'custom'
 }
 
+CHARGING_INFO = RegisterMap([
+    Field('function', 1, 1, enum = FUNCTION),
+    Field('battery_percentage', 3),
+    Field('battery_voltage', 5, scale = 0.1),
+    Field('combined_charge_current', 7, scale = 0.01),
+    Field('controller_temperature', 9, 1, convert = parse_temperature),
+    Field('battery_temperature', 10, 1, convert = parse_temperature),
+    Field('alternator_voltage', 11, scale = 0.1),
+    Field('alternator_current', 13, scale = 0.01),
+    Field('alternator_power', 15),
+    Field('pv_voltage', 17, scale = 0.1),
+    Field('pv_current', 19, scale = 0.01),
+    Field('pv_power', 21),
+    Field('battery_min_voltage_today', 25, scale = 0.1),
+    Field('battery_max_voltage_today', 27, scale = 0.1),
+    Field('battery_max_current_today', 29, scale = 0.01),
+    Field('max_charging_power_today', 33),
+    Field('charging_amp_hours_today', 37),
+    Field('power_generation_today', 41),
+    Field('total_working_days', 45),
+    Field('count_battery_overdischarged', 47),
+    Field('count_battery_fully_charged', 49),
+    Field('battery_ah_total_accumulated', 51, 4),
+    Field('power_generation_total', 59, 4)
+])
+
 class DCChargerClient(BaseClient):
     def __init__(self, config, on_data_callback=None, on_error_callback=None):
         super().__init__(config)
@@ -33,12 +60,14 @@ class DCChargerClient(BaseClient):
         self.on_error_callback = on_error_callback
         self.data = {}
         self.sections = [
-            {'register': 12, 'words': 8, 'parser': self.parse_device_info},
-            {'register': 26, 'words': 1, 'parser': self.parse_device_address},
+            {'register': 12, 'words': 8, 'parser': self.parse_device_info, 'refresh': 'static'},
+            {'register': 26, 'words': 1, 'parser': self.parse_device_address, 'refresh': 'static'},
             {'register': 256, 'words': 30, 'parser': self.parse_charging_info},
             {'register': 288, 'words': 3, 'parser': self.parse_state},
-            {'register': 57348, 'words': 1, 'parser': self.parse_battery_type}
+            {'register': 57348, 'words': 1, 'parser': self.parse_battery_type, 'refresh': 'static'}
         ]
+        # 256 and 288 would merge into a 35 word read, not confirmed on a device yet so the default limit
+        # keeps them apart. max_read_words = 35 in [data] tries it, a rejected read falls back to one request per section
 
     def parse_device_info(self, bs):
         data = {}
@@ -52,32 +81,7 @@ class DCChargerClient(BaseClient):
         self.data.update(data)
 
     def parse_charging_info(self, bs):
-        data = {}
-        temp_unit = self.config['data']['temperature_unit']
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['battery_percentage'] = bytes_to_int(bs, 3, 2)
-        data['battery_voltage'] = bytes_to_int(bs, 5, 2, scale = 0.1)
-        data['combined_charge_current'] = bytes_to_int(bs, 7, 2, scale = 0.01)
-        data['controller_temperature'] = parse_temperature(bytes_to_int(bs, 9, 1), temp_unit)
-        data['battery_temperature'] = parse_temperature(bytes_to_int(bs, 10, 1), temp_unit)
-        data['alternator_voltage'] = bytes_to_int(bs, 11, 2, scale = 0.1)
-        data['alternator_current'] = bytes_to_int(bs, 13, 2, scale = 0.01)
-        data['alternator_power'] = bytes_to_int(bs, 15, 2)
-        data['pv_voltage'] = bytes_to_int(bs, 17, 2, scale = 0.1) 
-        data['pv_current'] = bytes_to_int(bs, 19, 2, scale = 0.01)
-        data['pv_power'] = bytes_to_int(bs, 21, 2)
-        data['battery_min_voltage_today'] = bytes_to_int(bs, 25, 2, scale=0.1)
-        data['battery_max_voltage_today'] = bytes_to_int(bs, 27, 2, scale=0.1)
-        data['battery_max_current_today'] = bytes_to_int(bs, 29, 2, scale=0.01)
-        data['max_charging_power_today'] = bytes_to_int(bs, 33, 2)
-        data['charging_amp_hours_today'] = bytes_to_int(bs, 37, 2)
-        data['power_generation_today'] = bytes_to_int(bs, 41, 2)
-        data['total_working_days'] = bytes_to_int(bs, 45, 2)
-        data['count_battery_overdischarged'] = bytes_to_int(bs, 47, 2)
-        data['count_battery_fully_charged'] = bytes_to_int(bs, 49, 2)
-        data['battery_ah_total_accumulated'] = bytes_to_int(bs, 51, 4)
-        data['power_generation_total'] = bytes_to_int(bs, 59, 4)
-        self.data.update(data)
+        self.data.update(CHARGING_INFO.decode(bs, self.config['data']['temperature_unit']))
 
     def parse_state(self, bs):
         data = {}
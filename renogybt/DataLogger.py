@@ -1,39 +1,171 @@
 import json
 from logger_config import logger
-import requests
-import paho.mqtt.publish as publish
+from .ChangeFilter import get_filter, filtered_sinks
+from .Encoders import get_encoder, frame_schema_id, JsonEncoder
 from configparser import ConfigParser
-from datetime import datetime
+import time
 
-PVOUTPUT_URL = 'http://pvoutput.org/service/r2/addstatus.jsp'
+# The sink modules and their dependencies (requests, paho-mqtt, sqlite3) are imported on first use,
+# a cron run with every sink disabled does not pay for them
+
+HTTP_TIMEOUT = 15 # (seconds)
+HTTP_POOL_SIZE = 4 # keep-alive connections per host
+MQTT_ACK_TIMEOUT = 10 # wait for the broker to acknowledge replayed QoS 1/2 messages (seconds)
+OUTBOX_SINKS = ('remote_logging', 'mqtt') # sinks that can be stored and replayed
+PVOUTPUT_DEVICE_TYPES = 'RNG_CTRL' # device types uploaded to PVOutput unless device_types in [pvoutput] says otherwise
+
+session = None
+
+# One pooled keep-alive HTTP session shared by all loggers of the process
+def get_session():
+    global session
+    if session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+    return session
+
+# PVOutput statuses are the charge controller's, other devices only through an explicit device_types
+def pvoutput_device(config):
+    device_types = config['pvoutput'].get('device_types', fallback=PVOUTPUT_DEVICE_TYPES)
+    return config['device']['type'] in [device_type.strip() for device_type in device_types.split(',')]
 
 class DataLogger:
     def __init__(self, config: ConfigParser):
         self.config = config
+        self.outbox = None
+        if config.has_section('outbox') and config['outbox'].getboolean('enabled', fallback=False):
+            from .Outbox import get_outbox
+            self.outbox = get_outbox(config)
+        self.deadband_sinks = filtered_sinks(config)
+        self.encoders = {} # sink => encoder, created on first use
+
+    # Hands a reading to a sink through the pipeline. With the outbox enabled the reading is stored
+    # by the outbox thread and the worker delivers the sink's whole backlog, so readings survive outages
+    # and restarts
+    def submit(self, sink_pipeline, sink, json_data):
+        if sink in self.deadband_sinks:
+            json_data = get_filter(self.config, sink).apply(json_data) # only the changed fields
+            if json_data is None: return
+        if self.outbox is not None and sink in OUTBOX_SINKS:
+            stored = self.outbox.store(self.outbox_key(sink), json_data)
+            sink_pipeline.submit(sink, self.flush_outbox, sink, stored)
+        else:
+            sink_pipeline.submit(sink, getattr(self, f"log_{sink}"), json_data=json_data)
+
+    def outbox_key(self, sink):
+        if sink == 'mqtt':
+            return f"mqtt {self.config['mqtt']['server']}:{self.config['mqtt']['port']} {self.config['mqtt']['topic']}"
+        return f"{sink} {self.config[sink]['url']}"
+
+    def flush_outbox(self, sink, stored=None):
+        if stored is not None: stored.result() # the reading is in the outbox
+        deliver = self.log_remote_batch if sink == 'remote_logging' else self.log_mqtt_batch
+        self.outbox.flush(self.outbox_key(sink), deliver)
+
+    def encoder(self, sink):
+        if sink not in self.encoders:
+            self.encoders[sink] = get_encoder(self.config[sink].get('encoding', 'json'))
+        return self.encoders[sink]
+
+    def post_remote(self, payload, content_type):
+        headers = { "Authorization" : f"Bearer {self.config['remote_logging']['auth_header']}", "Content-Type": content_type }
+        return get_session().post(self.config['remote_logging']['url'], data = payload, timeout=HTTP_TIMEOUT, headers=headers)
 
     def log_remote(self, json_data):
-        headers = { "Authorization" : f"Bearer {self.config['remote_logging']['auth_header']}" }
-        req = requests.post(self.config['remote_logging']['url'], json = json_data, timeout=15, headers=headers)
-        logger.info("Log remote 200") if req.status_code == 200 else logger.error(f"Log remote error {req.status_code}")
+        encoder = self.encoder('remote_logging')
+        for kind, payload in encoder.encode(json_data):
+            req = self.post_remote(payload, encoder.content_type)
+            if req.status_code != 200:
+                encoder.reset() # send the schema again with the next reading
+                logger.error(f"Log remote error {req.status_code}")
+                return False
+        logger.debug("Log remote 200")
+        return True
+
+    # Returns how many records the server accepted, the outbox keeps the others
+    def log_remote_batch(self, records):
+        encoder = self.encoder('remote_logging')
+        if self.config['remote_logging'].getboolean('batch', fallback=False) and encoder.batchable:
+            # one request with a list of readings, the server has to accept lists
+            req = self.post_remote(encoder.encode_batch(records), encoder.content_type)
+            if req.status_code != 200: raise IOError(f"Log remote error {req.status_code}")
+            logger.info("Log remote 200 (%d records)", len(records))
+            return len(records)
+        for i, json_data in enumerate(records): # one request per record over the kept-alive connection
+            if not self.log_remote(json_data): return i
+        return len(records)
 
     def log_mqtt(self, json_data):
-        logger.info(f"mqtt logging")
-        user = self.config['mqtt']['user']
-        password = self.config['mqtt']['password']
-        auth = None if not user or not password else {"username": user, "password": password}
+        from .MqttPublisher import get_publisher
+        logger.debug("mqtt logging")
+        get_publisher(self.config).publish(self.mqtt_messages(json_data))
+
+    # Raises while the broker is unreachable. With QoS 1/2 returns how many records the broker
+    # acknowledged completely, the outbox keeps the others
+    def log_mqtt_batch(self, records):
+        from .MqttPublisher import get_publisher
+        publisher = get_publisher(self.config)
+        if not publisher.connected_event.wait(MQTT_ACK_TIMEOUT): raise IOError("MQTT broker not connected")
+        record_messages = [self.mqtt_messages(json_data) for json_data in records]
+        # the outbox keeps the records until acknowledged, the publisher must not queue a second copy
+        infos = publisher.publish([message for messages in record_messages for message in messages], queue=False)
+        if len(infos) == 0: raise IOError("MQTT broker not connected")
+        if self.config['mqtt'].getint('qos', fallback=0) > 0:
+            start = 0
+            for i, messages in enumerate(record_messages):
+                for info in infos[start:start + len(messages)]:
+                    info.wait_for_publish(MQTT_ACK_TIMEOUT)
+                    if not info.is_published():
+                        logger.error("mqtt logging: %d of %d records acknowledged", i, len(records))
+                        return i
+                start += len(messages)
+        logger.info("mqtt logging (%d records)", len(records))
+        return len(records)
 
-        publish.single(
-            self.config['mqtt']['topic'], payload=json.dumps(json_data),
-            hostname=self.config['mqtt']['server'], port=self.config['mqtt'].getint('port'),
-            auth=auth, client_id="renogy-bt"
-        )
+    def mqtt_messages(self, json_data):
+        mqtt_config = self.config['mqtt']
+        topic = mqtt_config['topic']
+        qos = mqtt_config.getint('qos', fallback=0)
+        retain = mqtt_config.getboolean('retain', fallback=False)
+        encoder = self.encoder('mqtt')
 
+        messages = []
+        if mqtt_config.getboolean('homeassistant_discovery', fallback=False) and isinstance(encoder, JsonEncoder):
+            from .MqttPublisher import get_publisher, discovery_config, node_id
+            publisher = get_publisher(self.config)
+            prefix = mqtt_config.get('discovery_prefix', 'homeassistant').strip()
+            alias = self.config['device']['alias']
+            for field in json_data:
+                if field.startswith('__'): continue
+                config_topic = f"{prefix}/sensor/{node_id(alias)}/{field}/config"
+                if publisher.announce(config_topic): # only once per broker session
+                    payload = discovery_config(field, topic, alias, json_data.get('model'), self.config['data']['temperature_unit'])
+                    messages.append((config_topic, payload, qos, True))
+
+        for kind, payload in encoder.encode(json_data):
+            if kind == 'schema': messages.append((f"{topic}/schema/{frame_schema_id(payload)}", payload, qos, True))
+            else: messages.append((topic, payload, qos, retain))
+        if mqtt_config.getboolean('field_topics', fallback=False):
+            for field, value in json_data.items():
+                if field.startswith('__'): continue
+                payload = json.dumps(value) if isinstance(value, (list, dict)) else str(value)
+                messages.append((f"{topic}/{field}", payload, qos, retain))
+        return messages
+
+    # Readings are buffered and uploaded as PVOutput status intervals within the request budget
     def log_pvoutput(self, json_data):
-        date_time = datetime.now().strftime("d=%Y%m%d&t=%H:%M")
-        data = f"{date_time}&v1={json_data['power_generation_today']}&v2={json_data['pv_power']}&v3={json_data['power_consumption_today']}&v4={json_data['load_power']}&v5={json_data['controller_temperature']}&v6={json_data['battery_voltage']}"
-        response = requests.post(PVOUTPUT_URL, data=data, headers={
-            "Content-Type": "application/x-www-form-urlencoded",
-            "X-Pvoutput-Apikey": self.config['pvoutput']['api_key'],
-            "X-Pvoutput-SystemId":  self.config['pvoutput']['system_id']
-        })
-        print(f"pvoutput {response}")
+        from .PVOutputUploader import get_uploader
+        now = time.time()
+        uploader = get_uploader(self.config, get_session())
+        if uploader is None: return
+        uploader.add(json_data, now)
+        uploader.upload(now)
+
+    # Keeps the reading in the local time-series store for charts and queries
+    def log_timeseries(self, json_data):
+        from .TimeSeriesStore import get_store
+        get_store(self.config).append(self.config['device']['alias'], json_data, time.time())
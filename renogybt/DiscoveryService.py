@@ -0,0 +1,116 @@
+import asyncio
+import time
+from bleak import BleakScanner
+from logger_config import logger
+from .Metrics import metrics
+
+# Process-wide bluetooth discovery shared by all clients.
+# Scan results are indexed by mac address and alias and kept for CACHE_TTL seconds, so N clients cost
+# one scan per cycle instead of N. A scan stops as soon as every requested device has been seen.
+
+DISCOVERY_TIMEOUT = 5 # max wait time to complete the bluetooth scanning (seconds)
+CACHE_TTL = 120 # keep below the BlueZ device expiry, cached BLEDevice objects are passed to BleakClient
+MISS_TTL = 30 # don't rescan for a device that was missing from a full scan this recently (seconds)
+
+class DiscoveryService:
+    def __init__(self, ttl=CACHE_TTL, timeout=DISCOVERY_TIMEOUT):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.devices = {} # key => (BLEDevice, last seen)
+        self.misses = {} # key => time of the last full scan that did not see it
+        self.targets = set() # keys of devices clients are waiting for
+        self.discovered_devices = [] # devices seen by the last scan
+        self.lock = None
+        self.lock_loop = None
+
+    @staticmethod
+    def keys(mac_address=None, alias=None):
+        keys = []
+        if mac_address: keys.append(mac_address.strip().upper())
+        if alias: keys.append(alias.strip())
+        return keys
+
+    def register(self, mac_address, alias=None):
+        # Let the next scan wait for this device too, used by the Collector to cover all devices with one scan
+        self.targets.update(self.keys(mac_address, alias)[:1])
+
+    def lookup(self, mac_address, alias=None):
+        now = time.monotonic()
+        for key in self.keys(mac_address, alias):
+            entry = self.devices.get(key)
+            if entry is not None and now - entry[1] < self.ttl:
+                return entry[0]
+        return None
+
+    def forget(self, mac_address, alias=None):
+        for key in self.keys(mac_address, alias):
+            self.devices.pop(key, None)
+
+    def recently_missed(self, mac_address):
+        missed = self.misses.get(mac_address.strip().upper())
+        return missed is not None and time.monotonic() - missed < MISS_TTL
+
+    def add(self, device, name=None):
+        now = time.monotonic()
+        name = device.name or name
+        if device.address: self.devices[device.address.upper()] = (device, now)
+        if name: self.devices[name.strip()] = (device, now)
+
+    def get_lock(self):
+        loop = asyncio.get_running_loop()
+        if self.lock is None or self.lock_loop is not loop:
+            self.lock = asyncio.Lock()
+            self.lock_loop = loop
+        return self.lock
+
+    async def find(self, mac_address, alias=None):
+        device = self.lookup(mac_address, alias)
+        if device is not None:
+            logger.info(f"Discovery cache hit {alias} => {mac_address}")
+            metrics.inc('renogy_discovery_cache_hits_total')
+            return device
+
+        self.register(mac_address, alias)
+        async with self.get_lock():
+            # another client may have completed a scan while we were waiting for the lock
+            device = self.lookup(mac_address, alias)
+            if device is None and not self.recently_missed(mac_address):
+                await self.scan()
+                device = self.lookup(mac_address, alias)
+        return device
+
+    async def scan(self):
+        requested = set(self.targets)
+        pending = set(key for key in requested if self.lookup(key) is None)
+        seen = {}
+        all_found = asyncio.Event()
+
+        def on_detection(device, advertisement_data):
+            name = device.name or getattr(advertisement_data, 'local_name', None)
+            seen[device.address] = device
+            self.add(device, name)
+            pending.discard(device.address.upper())
+            if name: pending.discard(name.strip())
+            if len(pending) == 0: all_found.set()
+
+        if len(pending) == 0: all_found.set()
+
+        logger.info(f"Starting discovery for {len(pending)} devices...")
+        start = time.monotonic()
+        scanner = BleakScanner(detection_callback=on_detection)
+        await scanner.start()
+        try:
+            await asyncio.wait_for(all_found.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            now = time.monotonic()
+            for key in pending: self.misses[key] = now
+        finally:
+            await scanner.stop()
+
+        self.discovered_devices = list(seen.values())
+        self.targets.difference_update(requested)
+        metrics.observe('renogy_discovery_seconds', time.monotonic() - start)
+        metrics.set('renogy_discovery_devices', len(self.discovered_devices))
+        logger.info(f"Devices found: {len(self.discovered_devices)} in {time.monotonic() - start:.1f} seconds")
+
+discovery_service = DiscoveryService()
@@ -0,0 +1,174 @@
+import json
+import struct
+import zlib
+
+# Wire encodings for the sinks, chosen once per sink with the `encoding` option:
+#   json     verbose, readable (default)
+#   msgpack  MessagePack, needs `pip install msgpack`
+#   cbor     CBOR, needs `pip install cbor2`
+#   packed   schema-versioned binary: the field dictionary is sent once as a schema frame,
+#            readings then only carry fixed-width numbers in schema order
+#
+# encode() returns a list of (kind, payload) with kind 'schema' or 'data', in sending order.
+#
+# Packed frame: b'RB', version (u8), kind (u8, 1 = schema, 2 = data), schema id (u32, crc32 of the schema)
+#   schema: header + utf-8 JSON {"fields": [[name, type], ...]}
+#   data:   header + bitmap of the fields present (1 bit per schema field, lsb first) + their values,
+#           little endian: 'd' (float64), 'i' (int32), 'q' (int64) or 's' (u16 length + utf-8 JSON, for
+#           text such as the model or the charging status)
+# The schema only holds names and types, so status changes and deadband change-sets with fewer fields
+# keep it. A new schema is sent when a field appears or a type widens (int32 => int64 => float64 => text).
+
+PACKED_MAGIC = b'RB'
+PACKED_VERSION = 2
+SCHEMA_FRAME = 1
+DATA_FRAME = 2
+HEADER = struct.Struct('<2sBBI')
+MAX_FIELDS = 256 # fields of a packed schema, a reading with more new fields starts over with its own
+VALUE_STRUCTS = {code: struct.Struct('<' + code) for code in 'diq'}
+TEXT_LENGTH = struct.Struct('<H')
+WIDER = {'i': 0, 'q': 1, 'd': 2, 's': 3}
+
+def get_encoder(name):
+    name = (name or 'json').strip().lower()
+    if name not in ENCODERS: raise ValueError(f"unknown encoding {name}")
+    return ENCODERS[name]()
+
+class Encoder:
+    content_type = 'application/octet-stream'
+    batchable = False
+
+    # forget what the receiver was told, e.g. after a failed delivery
+    def reset(self):
+        pass
+
+class JsonEncoder(Encoder):
+    content_type = 'application/json'
+    batchable = True # a list of readings can be sent in one payload
+
+    def encode(self, data):
+        return [('data', json.dumps(data))]
+
+    def encode_batch(self, records):
+        return json.dumps(records)
+
+class MsgPackEncoder(Encoder):
+    content_type = 'application/msgpack'
+    batchable = True
+
+    def __init__(self):
+        import msgpack # optional dependency, only needed with encoding = msgpack
+        self.packb = msgpack.packb
+
+    def encode(self, data):
+        return [('data', self.packb(data))]
+
+    def encode_batch(self, records):
+        return self.packb(records)
+
+class CborEncoder(Encoder):
+    content_type = 'application/cbor'
+    batchable = True
+
+    def __init__(self):
+        import cbor2 # optional dependency, only needed with encoding = cbor
+        self.dumps = cbor2.dumps
+
+    def encode(self, data):
+        return [('data', self.dumps(data))]
+
+    def encode_batch(self, records):
+        return self.dumps(records)
+
+class Schema:
+    def __init__(self, fields):
+        self.fields = fields # [(name, type)]
+        self.index = {name: i for i, (name, code) in enumerate(fields)}
+        self.frame = json.dumps({'fields': fields}, separators=(',', ':')).encode('utf-8')
+        self.id = zlib.crc32(self.frame)
+        self.header = HEADER.pack(PACKED_MAGIC, PACKED_VERSION, DATA_FRAME, self.id)
+        self.schema_frame = HEADER.pack(PACKED_MAGIC, PACKED_VERSION, SCHEMA_FRAME, self.id) + self.frame
+
+def value_type(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)): return 's'
+    if isinstance(value, float): return 'd'
+    return 'i' if -2**31 <= value < 2**31 else 'q'
+
+def pack_value(code, value):
+    if code == 's':
+        text = json.dumps(value).encode('utf-8')[:0xFFFF]
+        return TEXT_LENGTH.pack(len(text)) + text
+    return VALUE_STRUCTS[code].pack(value)
+
+class PackedEncoder(Encoder):
+    def __init__(self):
+        self.schema = None # fields seen so far, every reading of the sink is encoded with it
+        self.sent = False # the schema frame went through this sink
+
+    # Adds the new fields of a reading to the schema and widens the types that no longer fit
+    def update_schema(self, data):
+        fields = list(self.schema.fields) if self.schema is not None else []
+        index = self.schema.index if self.schema is not None else {}
+        changed = False
+        for field, value in data.items():
+            code = value_type(value)
+            i = index.get(field)
+            if i is None:
+                fields.append((field, code))
+                changed = True
+            elif WIDER[code] > WIDER[fields[i][1]]:
+                fields[i] = (field, code)
+                changed = True
+        if not changed: return
+        if len(fields) > MAX_FIELDS: fields = [(field, value_type(value)) for field, value in data.items()]
+        self.schema = Schema(fields)
+        self.sent = False
+
+    def encode(self, data):
+        self.update_schema(data)
+        schema = self.schema
+        frames = []
+        if not self.sent:
+            self.sent = True
+            frames.append(('schema', schema.schema_frame))
+        bitmap = bytearray((len(schema.fields) + 7) // 8)
+        present = sorted(schema.index[field] for field in data)
+        for i in present: bitmap[i >> 3] |= 1 << (i & 7)
+        values = b''.join(pack_value(schema.fields[i][1], data[schema.fields[i][0]]) for i in present)
+        frames.append(('data', schema.header + bytes(bitmap) + values))
+        return frames
+
+    def reset(self):
+        self.sent = False
+
+def frame_schema_id(frame):
+    return HEADER.unpack_from(frame)[3]
+
+# Reverses PackedEncoder, for receivers written in Python. schemas: {schema id: parsed schema}
+def decode_packed(frame, schemas):
+    magic, version, kind, schema_id = HEADER.unpack_from(frame)
+    if magic != PACKED_MAGIC or version != PACKED_VERSION: raise ValueError("not a packed frame")
+    if kind == SCHEMA_FRAME:
+        schemas[schema_id] = json.loads(bytes(frame[HEADER.size:]).decode('utf-8'))
+        return None
+    fields = schemas[schema_id]['fields']
+    offset = HEADER.size + (len(fields) + 7) // 8
+    data = {}
+    for i, (name, code) in enumerate(fields):
+        if not frame[HEADER.size + (i >> 3)] & (1 << (i & 7)): continue
+        if code == 's':
+            length = TEXT_LENGTH.unpack_from(frame, offset)[0]
+            offset += TEXT_LENGTH.size
+            data[name] = json.loads(bytes(frame[offset:offset + length]).decode('utf-8'))
+            offset += length
+        else:
+            data[name] = VALUE_STRUCTS[code].unpack_from(frame, offset)[0]
+            offset += VALUE_STRUCTS[code].size
+    return data
+
+ENCODERS = {
+    'json': JsonEncoder,
+    'msgpack': MsgPackEncoder,
+    'cbor': CborEncoder,
+    'packed': PackedEncoder
+}
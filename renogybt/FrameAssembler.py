@@ -0,0 +1,80 @@
+from .Utils import check_crc
+
+# Joins BLE notifications into complete Modbus response frames.
+# Adapters with a small MTU split long responses (e.g. Rover's 34 word section) over several notifications.
+# Fragments are copied into a preallocated buffer, the expected frame length is taken from the header,
+# and only frames with a valid CRC are emitted. On a bad CRC or an unknown header the first byte is
+# dropped and the search restarts at the next byte (resync).
+
+BUFFER_SIZE = 512 # two maximum size Modbus RTU frames
+READ_FUNCTIONS = (1, 2, 3, 4) # device id, function, byte count, data, crc
+WRITE_FUNCTIONS = (5, 6, 15, 16) # device id, function, register, value, crc
+ERROR_FLAG = 0x80 # device id, function | 0x80, error code, crc
+
+def expected_length(buffer, start, available):
+    if available < 2: return None
+    function = buffer[start + 1]
+    if function & ERROR_FLAG: return 5
+    if function in WRITE_FUNCTIONS: return 8
+    if function in READ_FUNCTIONS:
+        return None if available < 3 else buffer[start + 2] + 5
+    return 0 # not a frame start
+
+class FrameAssembler:
+    def __init__(self, size=BUFFER_SIZE):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        self.errors = 0 # bytes dropped while resyncing, a sign of corrupted or lost fragments
+        self.crc_failures = 0 # candidate frames with a bad CRC
+
+    def reset(self):
+        self.start = 0
+        self.end = 0
+
+    def pending(self):
+        return self.end - self.start
+
+    def feed(self, data):
+        # fast path: a complete frame in a single notification is passed through without copying
+        if self.start == self.end and expected_length(data, 0, len(data)) == len(data) and check_crc(data):
+            return [data]
+
+        self.append(data)
+        frames = []
+        while self.start < self.end:
+            available = self.end - self.start
+            length = expected_length(self.buffer, self.start, available)
+            if length is None or length > available: break # wait for more fragments
+            frame = self.view[self.start:self.start + length] if length > 0 else None
+            if frame is not None and check_crc(frame):
+                frames.append(bytes(frame))
+                self.start += length
+            else:
+                if frame is not None: self.crc_failures += 1
+                self.start += 1
+                self.errors += 1
+            if frame is not None: frame.release()
+
+        if self.start == self.end: self.reset()
+        return frames
+
+    def append(self, data):
+        if len(data) > len(self.buffer):
+            self.errors += len(data) - len(self.buffer)
+            data = data[-len(self.buffer):]
+        size = len(data)
+        if self.end + size > len(self.buffer):
+            # move the unprocessed bytes to the front, drop the oldest ones if that is not enough
+            pending = self.end - self.start
+            if pending + size > len(self.buffer):
+                drop = pending + size - len(self.buffer)
+                self.errors += drop
+                self.start += drop
+                pending -= drop
+            self.buffer[0:pending] = bytes(self.view[self.start:self.end])
+            self.start = 0
+            self.end = pending
+        self.buffer[self.end:self.end + size] = data
+        self.end += size
@@ -0,0 +1,152 @@
+import atexit
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+from logger_config import logger
+
+# Liveness of the collector without parsing renogy.log.
+# Every successful read stamps the device's slot in a small memory-mapped file and the header with
+# the time of the newest read. checkRestartPi.py only reads the 12 byte header, in O(1). It runs
+# standalone from cron and keeps its own copy of MAGIC and HEADER, change both together.
+# Under systemd with WatchdogSec= set, a thread sends WATCHDOG=1 while the newest read is younger
+# than max_age, so a stuck collector is restarted by systemd instead of rebooting the Pi.
+#
+#   header: magic 'RHB1', newest read (float64 unix time)
+#   slot:   alias (32 bytes, NUL padded), last read (float64 unix time), readings (uint64)
+
+MAGIC = b'RHB1'
+HEADER = struct.Struct('<4sd')
+SLOT = struct.Struct('<32sdQ')
+MAX_DEVICES = 64
+FILE_SIZE = HEADER.size + SLOT.size * MAX_DEVICES
+MAX_AGE = 1800 # a collector without a successful read for this long counts as stuck (seconds)
+
+heartbeats = {}
+watchdog = None
+ready = False # READY=1 was sent to systemd
+last_read = None # newest successful read of this process (unix time)
+
+# Called after every successful read of a device
+def beat(config, alias):
+    global last_read
+    last_read = time.time()
+    heartbeat = get_heartbeat(config)
+    if heartbeat is not None: heartbeat.beat(alias, last_read)
+
+def get_heartbeat(config):
+    if not config.has_section('heartbeat') or not config['heartbeat'].getboolean('enabled', fallback=False): return None
+    path = config['heartbeat'].get('path', 'renogy.heartbeat').strip()
+    if not os.path.isabs(path): path = os.path.join(os.getcwd(), path)
+    if path not in heartbeats: heartbeats[path] = Heartbeat(path)
+    return heartbeats[path]
+
+def close_heartbeats():
+    for heartbeat in heartbeats.values(): heartbeat.close()
+    heartbeats.clear()
+
+atexit.register(close_heartbeats)
+
+class Heartbeat:
+    def __init__(self, path):
+        self.path = path
+        self.slots = {} # alias => slot index
+        with open(path, 'ab'): pass
+        with open(path, 'r+b') as f:
+            if os.path.getsize(path) < FILE_SIZE: f.truncate(FILE_SIZE)
+            self.mm = mmap.mmap(f.fileno(), FILE_SIZE)
+        if self.mm[:4] != MAGIC: HEADER.pack_into(self.mm, 0, MAGIC, 0.0)
+
+    def slot(self, alias):
+        index = self.slots.get(alias)
+        if index is not None: return index
+        name = alias.encode('utf-8')[:32]
+        free = None
+        # another process (e.g. example.py from cron) may share the file, look for its slot first
+        for i in range(MAX_DEVICES):
+            slot_name = SLOT.unpack_from(self.mm, HEADER.size + i * SLOT.size)[0].rstrip(b'\0')
+            if slot_name == name:
+                index = i
+                break
+            if slot_name == b'' and free is None: free = i
+        if index is None: index = free
+        if index is None:
+            logger.warning("Heartbeat: no free slot for %s, only the header is updated", alias)
+            return None
+        self.slots[alias] = index
+        return index
+
+    def beat(self, alias, now=None):
+        now = now or time.time()
+        index = self.slot(alias)
+        if index is not None:
+            offset = HEADER.size + index * SLOT.size
+            readings = SLOT.unpack_from(self.mm, offset)[2]
+            SLOT.pack_into(self.mm, offset, alias.encode('utf-8')[:32], now, readings + 1)
+        HEADER.pack_into(self.mm, 0, MAGIC, now)
+
+    # alias => (last read, readings) of every device in the file
+    def devices(self):
+        result = {}
+        for i in range(MAX_DEVICES):
+            name, last, readings = SLOT.unpack_from(self.mm, HEADER.size + i * SLOT.size)
+            name = name.rstrip(b'\0')
+            if name: result[name.decode('utf-8', 'replace')] = (last, readings)
+        return result
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.flush()
+            self.mm.close()
+            self.mm = None
+
+# Minimal sd_notify(3): one datagram to $NOTIFY_SOCKET, no systemd python package needed
+def sd_notify(state):
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address: return False
+    if address.startswith('@'): address = '\0' + address[1:] # abstract namespace
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(state.encode('utf-8'))
+        return True
+    except OSError as e:
+        logger.warning("sd_notify failed: %s", e)
+        return False
+
+class Watchdog:
+    def __init__(self, interval, max_age=MAX_AGE):
+        self.interval = interval # ping interval, half of WatchdogSec
+        self.max_age = max_age
+        self.started = time.time()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='watchdog', daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            age = time.time() - (last_read or self.started) # the start time counts until the first read
+            if age < self.max_age:
+                sd_notify('WATCHDOG=1')
+            else:
+                logger.error("Watchdog: no successful read for %d seconds, letting systemd restart the service", age)
+
+    def stop(self):
+        self.stopped.set()
+
+# Tells systemd the service is up (Type=notify) and, with WatchdogSec= set, starts the watchdog thread
+def start_watchdog(config):
+    global watchdog, ready
+    if ready or not os.environ.get('NOTIFY_SOCKET'): return watchdog
+    ready = sd_notify('READY=1')
+    if not ready: return None
+    atexit.register(sd_notify, 'STOPPING=1')
+    usec = os.environ.get('WATCHDOG_USEC')
+    if not usec or (os.environ.get('WATCHDOG_PID') and int(os.environ['WATCHDOG_PID']) != os.getpid()): return None
+    max_age = config['heartbeat'].getint('max_age', fallback=MAX_AGE) if config.has_section('heartbeat') else MAX_AGE
+    watchdog = Watchdog(int(usec) / 1e6 / 2, max_age)
+    watchdog.thread.start()
+    atexit.register(watchdog.stop)
+    logger.info("Watchdog: pinging systemd every %.1f seconds", watchdog.interval)
+    return watchdog
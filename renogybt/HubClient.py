@@ -0,0 +1,119 @@
+import configparser
+import functools
+from logger_config import logger
+from .BaseClient import BaseClient
+from .Collector import create_client
+from .Metrics import metrics
+from .Pacing import get_pacing
+
+# Hub mode: one connection to a BT-2 module that bridges several devices (Communication Hub or daisy chain).
+# The devices listed in hub_devices are read one after another over the same GATT session and
+# notification subscription. Each one is a regular client (its sections, read plan and parsers) that
+# never connects itself, and emits its own reading with its own alias and config.
+#
+#   hub_devices = 97:RNG_CTRL, 48:RNG_BATT:Battery 1, 49:RNG_BATT:Battery 2, 50:RNG_BATT:Battery 3
+#
+# The alias defaults to <alias>_<device_id>. The shunt streams its own packets and cannot be a member.
+
+# 'device_id:type[:alias], ...' => [(device_id, type, alias or None), ...]
+def parse_hub_devices(value):
+    members = []
+    for entry in value.split(','):
+        parts = [part.strip() for part in entry.split(':', 2)]
+        if parts == ['']: continue
+        if len(parts) < 2: raise ValueError(f"hub_devices entry '{entry.strip()}' should be device_id:type[:alias]")
+        members.append((int(parts[0]), parts[1], parts[2] if len(parts) > 2 and parts[2] else None))
+    return members
+
+# Copy of the hub's config for one member, so sinks, filters and the outbox see it as its own device
+def member_config(config, device_id, device_type, alias):
+    member = configparser.ConfigParser(inline_comment_prefixes=('#'))
+    for section in config.sections():
+        member[section] = dict(config.items(section, raw=True))
+    member['device'].update({'device_id': str(device_id), 'type': device_type, 'alias': alias, 'hub_devices': ''})
+    return member
+
+class HubClient(BaseClient):
+    def __init__(self, config, on_data_callback=None, on_error_callback=None):
+        super().__init__(config)
+        self.on_data_callback = on_data_callback
+        self.on_error_callback = on_error_callback
+        self.members = []
+        self.member_index = 0
+        self.stop_requested = False # a member's callback asked to stop, done after the last member
+        for device_id, device_type, alias in parse_hub_devices(config['device']['hub_devices']):
+            if device_type == 'RNG_SHNT':
+                logger.error(f"HubClient: the shunt cannot be read through a hub, skipping device {device_id}")
+                continue
+            member = create_client(member_config(config, device_id, device_type, alias or f"{self.alias}_{device_id}"),
+                                   on_data_callback, on_error_callback)
+            if member is None: continue
+            member.stop = functools.partial(self.on_member_stop, member)
+            self.members.append(member)
+        if len(self.members) > 0: self.select_member(0)
+        logger.info(f"HubClient: {len(self.members)} devices behind {self.config['device']['alias']}")
+
+    def select_member(self, index):
+        self.member_index = index
+        member = self.members[index]
+        self.device_id = member.device_id
+        self.sections = member.sections
+        self.section_index = 0
+        self.retries = 0
+        if self.adaptive_pacing: self.pacing = get_pacing(self.config['device']['mac_addr'], self.device_id)
+
+    # Read plans and static values are the member's own
+    def get_read_plan(self):
+        return self.members[self.member_index].get_read_plan()
+
+    def parse_response(self, request, response):
+        self.members[self.member_index].parse_response(request, response)
+
+    def reset_session(self):
+        super().reset_session()
+        for member in self.members: member.reset_session()
+
+    async def on_data_received(self, response):
+        if self.device_id != 255 and response[0] != self.device_id:
+            # late answer to a member that already timed out
+            logger.info("HubClient: ignoring a frame of device %d while reading device %d", response[0], self.device_id)
+            return
+        await super().on_data_received(response)
+
+    # The member emits its reading (callback, metrics, heartbeat and cache under its own alias)
+    def on_read_operation_complete(self):
+        member = self.members[self.member_index]
+        member.ble_manager = self.ble_manager
+        member.read_start = self.read_start
+        member.on_read_operation_complete()
+        member.data = {}
+
+    # Moves on to the next member right away, the poll interval applies to the whole hub
+    async def check_polling(self):
+        if self.member_index < len(self.members) - 1:
+            self.select_member(self.member_index + 1)
+            await self.wait_before_request()
+            if self.is_running and not self.reconnecting: await self.read_section()
+            return
+        self.select_member(0)
+        if self.stop_requested: return self.stop()
+        await super().check_polling()
+
+    # A member that does not answer must not end the read of the others, nor the next polls when it is the last one
+    def on_read_timeout(self):
+        if self.read_timeout and not self.read_timeout.cancelled(): self.read_timeout.cancel()
+        if self.response_timeout and not self.response_timeout.cancelled(): self.response_timeout.cancel()
+        connected = self.ble_manager.client and self.ble_manager.client.is_connected
+        next_read = self.member_index < len(self.members) - 1 or self.config['data'].getboolean('enable_polling')
+        if self.is_running and connected and next_read:
+            member = self.members[self.member_index]
+            logger.error(f"HubClient: no response from device {self.device_id}, moving on")
+            metrics.inc('renogy_timeouts_total', device=member.alias, phase='read')
+            member.data = {}
+            self.poll_task = self.loop.create_task(self.check_polling())
+            return
+        super().on_read_timeout()
+
+    # Scripts stop a client after its reading when polling is off, the hub stops after its last member
+    def on_member_stop(self, member):
+        self.stop_requested = True
@@ -1,4 +1,5 @@
 from .BaseClient import BaseClient
+from .RegisterMap import RegisterMap, Field
 from .Utils import bytes_to_int
 
 FUNCTION = {
@@ -15,6 +16,36 @@ CHARGING_STATE = {
     7: 'battery disconnecting'
 }
 
+INVERTER_STATS = RegisterMap([
+    Field('function', 1, 1, enum = FUNCTION),
+    Field('input_voltage', 3, scale = 0.1),
+    Field('input_current', 5, scale = 0.01),
+    Field('output_voltage', 7, scale = 0.1),
+    Field('output_current', 9, scale = 0.01),
+    Field('output_frequency', 11, scale = 0.01),
+    Field('battery_voltage', 13, scale = 0.1),
+    Field('temperature', 15, scale = 0.1),
+    Field('input_frequency', 21, scale = 0.01)
+])
+
+CHARGING_INFO = RegisterMap([
+    Field('battery_percentage', 3),
+    Field('charging_current', 5, scale = 0.1, signed = True),
+    Field('solar_voltage', 7, scale = 0.1),
+    Field('solar_current', 9, scale = 0.1),
+    Field('solar_power', 11),
+    Field('charging_status', 13, enum = CHARGING_STATE),
+    Field('charging_power', 15)
+])
+
+LOAD_INFO = RegisterMap([
+    Field('load_curent', 3, scale = 0.1),
+    Field('load_active_power', 5),
+    Field('load_apparent_power', 7),
+    Field('line_charging_current', 11, scale = 0.1),
+    Field('load_percentage', 13)
+])
+
 class InverterClient(BaseClient):
     def __init__(self, config, on_data_callback=None, on_error_callback=None):
         super().__init__(config)
@@ -23,24 +54,14 @@ class InverterClient(BaseClient):
         self.data = {}
         self.sections = [
             {'register': 4000, 'words': 10, 'parser': self.parse_inverter_stats},
-            {'register': 4109, 'words': 1, 'parser': self.parse_device_id},
-            {'register': 4311, 'words': 8, 'parser': self.parse_inverter_model},
+            {'register': 4109, 'words': 1, 'parser': self.parse_device_id, 'refresh': 'static'},
+            {'register': 4311, 'words': 8, 'parser': self.parse_inverter_model, 'refresh': 'static'},
             {'register': 4327, 'words': 7, 'parser': self.parse_charging_info},
             {'register': 4408, 'words': 6, 'parser': self.parse_load_info}
         ]
 
     def parse_inverter_stats(self, bs):
-        data = {}
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['input_voltage'] = bytes_to_int(bs, 3, 2, scale=0.1)
-        data['input_current'] = bytes_to_int(bs, 5, 2, scale=0.01)
-        data['output_voltage'] = bytes_to_int(bs, 7, 2, scale=0.1)
-        data['output_current'] = bytes_to_int(bs, 9, 2, scale=0.01)
-        data['output_frequency'] = bytes_to_int(bs, 11, 2, scale=0.01)
-        data['battery_voltage'] = bytes_to_int(bs, 13, 2, scale=0.1)
-        data['temperature'] = bytes_to_int(bs, 15, 2, scale=0.1)
-        data['input_frequency'] = bytes_to_int(bs, 21, 2, scale=0.01)
-        self.data.update(data)
+        self.data.update(INVERTER_STATS.decode(bs))
 
     def parse_device_id(self, bs):
         data = { 'device_id': bytes_to_int(bs, 3, 2) }
@@ -51,21 +72,7 @@ class InverterClient(BaseClient):
         self.data.update(data)
 
     def parse_charging_info(self, bs):
-        data = {}
-        data['battery_percentage'] = bytes_to_int(bs, 3, 2)
-        data['charging_current'] = bytes_to_int(bs, 5, 2, scale=0.1, signed=True)
-        data['solar_voltage'] = bytes_to_int(bs, 7, 2, scale=0.1)
-        data['solar_current'] = bytes_to_int(bs, 9, 2, scale=0.1)
-        data['solar_power'] = bytes_to_int(bs, 11, 2)
-        data['charging_status'] = CHARGING_STATE.get(bytes_to_int(bs, 13, 2))
-        data['charging_power'] = bytes_to_int(bs, 15, 2)
-        self.data.update(data)
+        self.data.update(CHARGING_INFO.decode(bs))
 
     def parse_load_info(self, bs):
-        data = {}
-        data['load_curent'] = bytes_to_int(bs, 3, 2, scale=0.1)
-        data['load_active_power'] = bytes_to_int(bs, 5, 2)
-        data['load_apparent_power'] = bytes_to_int(bs, 7, 2)
-        data['line_charging_current'] = bytes_to_int(bs, 11, 2, scale=0.1)
-        data['load_percentage'] = bytes_to_int(bs, 13, 2)
-        self.data.update(data)
+        self.data.update(LOAD_INFO.decode(bs))
@@ -0,0 +1,184 @@
+import json
+import threading
+from logger_config import logger
+
+# Process-wide counters and timings per phase, device, section and sink.
+# Recording is a dict lookup and a few additions under a lock, cheap enough for every notification.
+# stats() is the in-process API, render() the Prometheus text format served by start_server().
+#
+#   from renogybt.Metrics import metrics
+#   metrics.stats()['renogy_request_seconds'] => [{'labels': {'device': 'BT-TH-XXXX', 'register': '256'}, 'count': 12, 'avg': 0.08, ...}]
+
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30) # histogram bounds (seconds)
+PORT = 9108
+ADDRESS = '127.0.0.1' # local scrapes only, 0.0.0.0 in [metrics] serves the whole network
+
+# name => (type, help)
+DESCRIPTIONS = {
+    'renogy_discovery_seconds': ('histogram', 'Duration of bluetooth scans'),
+    'renogy_discovery_devices': ('gauge', 'Devices seen by the last scan'),
+    'renogy_discovery_cache_hits_total': ('counter', 'Device lookups answered from the discovery cache'),
+    'renogy_connect_seconds': ('histogram', 'Duration of the bluetooth connection setup'),
+    'renogy_services_seconds': ('histogram', 'Duration of the service enumeration and notification subscription'),
+    'renogy_connect_failures_total': ('counter', 'Failed connection attempts'),
+    'renogy_link_lost_total': ('counter', 'Connections lost while reading'),
+    'renogy_request_seconds': ('histogram', 'Round trip time from the request write to the complete response, per register'),
+    'renogy_read_seconds': ('histogram', 'Duration of a complete read of all sections'),
+    'renogy_readings_total': ('counter', 'Completed readings'),
+    'renogy_read_errors_total': ('counter', 'Requests rejected by the device, per register'),
+    'renogy_timeouts_total': ('counter', 'Timeouts per phase (discovery, read, response)'),
+    'renogy_crc_errors_total': ('counter', 'Candidate frames dropped because of a bad CRC'),
+    'renogy_sink_seconds': ('histogram', 'Duration of a sink call'),
+    'renogy_sink_queue_seconds': ('histogram', 'Time a sink call waited in its queue'),
+    'renogy_sink_failures_total': ('counter', 'Failed or timed out sink calls'),
+    'renogy_sink_dropped_total': ('counter', 'Sink calls dropped because the queue was full'),
+}
+
+def label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def format_labels(key, extra=()):
+    items = key + tuple(extra)
+    if len(items) == 0: return ''
+    escape = lambda value: value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in items) + '}'
+
+class Timing:
+    __slots__ = ('count', 'sum', 'max', 'buckets')
+
+    def __init__(self, bounds):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(bounds) # not cumulative, summed up by render()
+
+class Metrics:
+    def __init__(self, buckets=BUCKETS):
+        self.bounds = tuple(buckets)
+        self.lock = threading.Lock()
+        self.counters = {} # name => {label key => value}
+        self.gauges = {}
+        self.timings = {} # name => {label key => Timing}
+
+    def inc(self, name, value=1, **labels):
+        key = label_key(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges.setdefault(name, {})[label_key(labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        key = label_key(labels)
+        with self.lock:
+            series = self.timings.setdefault(name, {})
+            timing = series.get(key)
+            if timing is None: timing = series[key] = Timing(self.bounds)
+            timing.count += 1
+            timing.sum += seconds
+            if seconds > timing.max: timing.max = seconds
+            for i, bound in enumerate(self.bounds):
+                if seconds <= bound:
+                    timing.buckets[i] += 1
+                    break
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.gauges = {}
+            self.timings = {}
+
+    # Snapshot for in-process use: name => list of {'labels', 'value'} or {'labels', 'count', 'sum', 'avg', 'max'}
+    def stats(self):
+        result = {}
+        with self.lock:
+            for values in (self.counters, self.gauges):
+                for name, series in values.items():
+                    result[name] = [{'labels': dict(key), 'value': value} for key, value in series.items()]
+            for name, series in self.timings.items():
+                result[name] = [{'labels': dict(key), 'count': timing.count, 'sum': round(timing.sum, 6),
+                                 'avg': round(timing.sum / timing.count, 6) if timing.count > 0 else 0, 'max': round(timing.max, 6)}
+                                for key, timing in series.items()]
+        return result
+
+    # Prometheus text exposition format (version 0.0.4)
+    def render(self):
+        lines = []
+        def header(name, kind):
+            lines.append(f"# HELP {name} {DESCRIPTIONS.get(name, (kind, name))[1]}")
+            lines.append(f"# TYPE {name} {kind}")
+        with self.lock:
+            for kind, values in (('counter', self.counters), ('gauge', self.gauges)):
+                for name, series in sorted(values.items()):
+                    header(name, kind)
+                    for key, value in series.items(): lines.append(f"{name}{format_labels(key)} {value}")
+            for name, series in sorted(self.timings.items()):
+                header(name, 'histogram')
+                for key, timing in series.items():
+                    cumulative = 0
+                    for bound, count in zip(self.bounds, timing.buckets):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{format_labels(key, [('le', str(bound))])} {cumulative}")
+                    lines.append(f"{name}_bucket{format_labels(key, [('le', '+Inf')])} {timing.count}")
+                    lines.append(f"{name}_sum{format_labels(key)} {timing.sum}")
+                    lines.append(f"{name}_count{format_labels(key)} {timing.count}")
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+# http.server is only imported when the endpoint is enabled
+def make_handler():
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?')[0]
+            if path == '/metrics':
+                self.reply(metrics.render(), 'text/plain; version=0.0.4; charset=utf-8')
+            elif path == '/stats':
+                self.reply(json.dumps(metrics.stats()), 'application/json')
+            else:
+                self.send_error(404)
+
+        def reply(self, body, content_type):
+            body = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(f"Metrics: {self.address_string()} {format % args}")
+
+    return MetricsHandler
+
+server = None
+
+# Serves /metrics (Prometheus) and /stats (JSON) from a daemon thread when [metrics] is enabled.
+# Called once per config file by the scripts, only the first enabled one starts the server
+def start_server(config):
+    global server
+    if server is not None or not config.has_section('metrics') or not config['metrics'].getboolean('enabled', fallback=False):
+        return server
+    address = config['metrics'].get('address', fallback=ADDRESS)
+    port = config['metrics'].getint('port', fallback=PORT)
+    from http.server import ThreadingHTTPServer
+    try:
+        server = ThreadingHTTPServer((address, port), make_handler())
+    except OSError as e:
+        logger.error(f"Metrics: unable to listen on {address}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    logger.info(f"Metrics: serving http://{address}:{port}/metrics")
+    return server
+
+def stop_server():
+    global server
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        server = None
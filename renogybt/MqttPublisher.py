@@ -0,0 +1,155 @@
+import atexit
+import json
+import os
+import re
+import socket
+import threading
+from collections import deque
+from logger_config import logger
+
+# Long-lived MQTT connection shared by all loggers that use the same broker.
+# paho's network loop runs in its own thread and reconnects automatically; messages published
+# while the broker is unreachable are kept (bounded) and sent as one batch once connected.
+# Each process uses a unique client id, so several publishers no longer kick each other off the broker.
+
+KEEPALIVE = 60 # (seconds)
+MAX_PENDING = 1000 # messages kept while disconnected, oldest dropped first
+RECONNECT_MAX_DELAY = 120 # (seconds)
+CLOSE_TIMEOUT = 5 # max wait for in-flight messages on exit (seconds)
+
+# Home Assistant sensor settings guessed from the field name suffix
+HA_SENSOR_TYPES = [
+    ('_voltage', 'voltage', 'V'),
+    ('_current', 'current', 'A'),
+    ('_amps', 'current', 'A'),
+    ('_power', 'power', 'W'),
+    ('_watts', 'power', 'W'),
+    ('_percentage', 'battery', '%'),
+    ('_percent', 'battery', '%'),
+    ('_temperature', 'temperature', None) # unit from temperature_unit
+]
+
+publishers = {}
+
+def get_publisher(config):
+    mqtt_config = config['mqtt']
+    key = (mqtt_config['server'], mqtt_config.getint('port'), mqtt_config['user'])
+    if key not in publishers:
+        publishers[key] = MqttPublisher(
+            mqtt_config['server'], mqtt_config.getint('port'), mqtt_config['user'], mqtt_config['password'],
+            client_id=mqtt_config.get('client_id', '').strip() or 'renogy-bt', keepalive=mqtt_config.getint('keepalive', fallback=KEEPALIVE))
+        publishers[key].start()
+    return publishers[key]
+
+def close_publishers():
+    for publisher in publishers.values(): publisher.close()
+    publishers.clear()
+
+atexit.register(close_publishers)
+
+def create_client(client_id):
+    import paho.mqtt.client as mqtt # only loaded once a broker is used
+    try:
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id) # paho-mqtt 2.x
+    except AttributeError:
+        return mqtt.Client(client_id=client_id)
+
+class MqttPublisher:
+    def __init__(self, server, port, user=None, password=None, client_id='renogy-bt', keepalive=KEEPALIVE):
+        self.server = server
+        self.port = port
+        self.keepalive = keepalive
+        self.client_id = f"{client_id}-{socket.gethostname()}-{os.getpid()}"
+        self.client = create_client(self.client_id)
+        if user and password: self.client.username_pw_set(user, password)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=RECONNECT_MAX_DELAY)
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.lock = threading.Lock()
+        self.connected = False
+        self.connected_event = threading.Event()
+        self.pending = deque(maxlen=MAX_PENDING)
+        self.in_flight = deque(maxlen=MAX_PENDING)
+        self.announced = set() # discovery topics sent in this session
+
+    def start(self):
+        logger.info(f"MqttPublisher: connecting to {self.server}:{self.port} as {self.client_id}")
+        self.client.connect_async(self.server, self.port, self.keepalive)
+        self.client.loop_start()
+
+    def on_connect(self, client, userdata, flags, reason_code, properties=None):
+        failed = reason_code.is_failure if hasattr(reason_code, 'is_failure') else reason_code != 0
+        if failed:
+            return logger.error(f"MqttPublisher: connection refused: {reason_code}")
+        logger.info(f"MqttPublisher: connected to {self.server}:{self.port}")
+        with self.lock:
+            self.connected = True
+            pending = list(self.pending)
+            self.pending.clear()
+            self.send(pending)
+            self.connected_event.set() # after the pending messages are in flight, close() waits for them
+
+    def on_disconnect(self, client, userdata, *args):
+        with self.lock:
+            self.connected = False
+            self.connected_event.clear()
+            self.announced.clear() # the session is gone, send discovery configs again in the next one
+        logger.warning(f"MqttPublisher: disconnected from {self.server}:{self.port}, reconnecting")
+
+    # messages: list of (topic, payload, qos, retain), published back to back.
+    # Returns the paho message infos, or an empty list when not connected: the messages are then queued
+    # until connected, or dropped with queue=False when the caller keeps them itself (the outbox)
+    def publish(self, messages, queue=True):
+        with self.lock:
+            if self.connected:
+                return self.send(messages)
+            if not queue: return []
+            if len(self.pending) + len(messages) > MAX_PENDING: logger.warning("MqttPublisher: not connected, dropping oldest messages")
+            self.pending.extend(messages)
+            return []
+
+    def send(self, messages):
+        infos = [self.client.publish(topic, payload=payload, qos=qos, retain=retain) for topic, payload, qos, retain in messages]
+        self.in_flight.extend(infos)
+        return infos
+
+    def announce(self, topic):
+        # True the first time a discovery topic is seen in this session
+        with self.lock:
+            if topic in self.announced: return False
+            self.announced.add(topic)
+            return True
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        if len(self.pending) > 0: self.connected_event.wait(timeout) # flushed by on_connect
+        with self.lock:
+            in_flight = list(self.in_flight)
+        for info in in_flight:
+            try:
+                info.wait_for_publish(timeout)
+            except Exception:
+                pass
+        self.client.disconnect()
+        self.client.loop_stop()
+
+def node_id(alias):
+    return re.sub(r'[^a-z0-9_]', '_', alias.strip().lower())
+
+# Home Assistant MQTT discovery config for one field of the JSON state topic
+def discovery_config(field, state_topic, alias, model=None, temperature_unit='F'):
+    node = node_id(alias)
+    config = {
+        'name': field.replace('_', ' '),
+        'state_topic': state_topic,
+        'value_template': f"{{{{ value_json.{field} }}}}",
+        'unique_id': f"{node}_{field}",
+        'device': {'identifiers': [node], 'name': alias, 'manufacturer': 'Renogy'}
+    }
+    if model: config['device']['model'] = model
+    for suffix, device_class, unit in HA_SENSOR_TYPES:
+        if field.endswith(suffix):
+            config['device_class'] = device_class
+            config['unit_of_measurement'] = unit if unit else ('°F' if temperature_unit.strip() == 'F' else '°C')
+            config['state_class'] = 'measurement'
+            break
+    return json.dumps(config)
@@ -0,0 +1,104 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logger_config import logger
+
+# Durable store-and-forward queue between the readings and the remote sinks.
+# Readings are appended to a SQLite database in WAL mode and only removed once the sink acknowledged
+# them, so nothing is lost while the uplink or the broker is down. When it comes back the backlog is
+# replayed oldest first in large batches. Disk use is bounded by max_records, the oldest readings are
+# evicted first. store() writes on the outbox's own thread, the BLE event loop never waits for SQLite.
+
+MAX_RECORDS = 100000
+BATCH_SIZE = 200 # records per delivery when replaying a backlog
+EVICT_CHUNK = 0.1 # share of max_records removed at once when the outbox is full
+
+outboxes = {}
+
+def get_outbox(config):
+    outbox_config = config['outbox']
+    path = outbox_config.get('path', 'renogy_outbox.db').strip()
+    if not os.path.isabs(path): path = os.path.join(os.getcwd(), path)
+    if path not in outboxes:
+        outboxes[path] = Outbox(path, max_records=outbox_config.getint('max_records', fallback=MAX_RECORDS),
+                                batch_size=outbox_config.getint('batch_size', fallback=BATCH_SIZE))
+    return outboxes[path]
+
+class Outbox:
+    def __init__(self, path, max_records=MAX_RECORDS, batch_size=BATCH_SIZE):
+        self.path = path
+        self.max_records = max_records
+        self.batch_size = batch_size
+        self.lock = threading.Lock() # used from the writer and the sink worker threads
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='outbox')
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, sink TEXT NOT NULL, created REAL NOT NULL, payload TEXT NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS outbox_sink ON outbox (sink, id)')
+        self.db.commit()
+        self.count = self.db.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+        if self.count > 0: logger.info(f"Outbox: {self.count} records waiting in {path}")
+
+    def add(self, sink, record):
+        with self.lock:
+            self.db.execute('INSERT INTO outbox (sink, created, payload) VALUES (?, ?, ?)', (sink, time.time(), json.dumps(record)))
+            self.count += 1
+            if self.count > self.max_records: self.evict()
+            self.db.commit()
+
+    # Returns a future of the write, flush() callers wait for it so the record goes out with the backlog
+    def store(self, sink, record):
+        return self.writer.submit(self.add, sink, record)
+
+    def evict(self):
+        drop = max(1, self.count - self.max_records, int(self.max_records * EVICT_CHUNK))
+        self.db.execute('DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)', (drop,))
+        self.count = self.db.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+        logger.warning(f"Outbox: full, evicted the oldest {drop} records")
+
+    def peek(self, sink, limit):
+        with self.lock:
+            rows = self.db.execute('SELECT id, payload FROM outbox WHERE sink = ? ORDER BY id LIMIT ?', (sink, limit)).fetchall()
+        return [(row[0], json.loads(row[1])) for row in rows]
+
+    def ack(self, ids):
+        with self.lock:
+            cursor = self.db.executemany('DELETE FROM outbox WHERE id = ?', ((i,) for i in ids))
+            self.db.commit()
+            self.count -= cursor.rowcount # records evicted meanwhile are gone already
+
+    def pending(self, sink=None):
+        with self.lock:
+            if sink is None: return self.count
+            return self.db.execute('SELECT COUNT(*) FROM outbox WHERE sink = ?', (sink,)).fetchone()[0]
+
+    # Delivers the backlog of a sink oldest first. deliver(records) returns how many of the records,
+    # from the first one on, the sink accepted and raises when it is unreachable. The others stay in
+    # the outbox for the next attempt
+    def flush(self, sink, deliver):
+        delivered = 0
+        while True:
+            batch = self.peek(sink, self.batch_size)
+            if len(batch) == 0: break
+            try:
+                accepted = deliver([record for record_id, record in batch])
+            except Exception as e:
+                logger.error(f"Outbox: delivery to {sink} failed, {self.pending(sink)} records kept: {e}")
+                break
+            self.ack([record_id for record_id, record in batch[:accepted]])
+            delivered += accepted
+            if accepted < len(batch):
+                logger.error(f"Outbox: delivery to {sink} stopped after {accepted} of {len(batch)} records, {self.pending(sink)} records kept")
+                break
+            if len(batch) < self.batch_size: break
+        if delivered > 1: logger.info(f"Outbox: replayed {delivered} records to {sink}")
+        return delivered
+
+    def close(self):
+        self.writer.shutdown(wait=True)
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,161 @@
+import atexit
+import time
+from datetime import datetime
+from logger_config import logger, RATE_LIMITED
+
+# Buffers readings for PVOutput, aggregates them into status intervals (5, 10 or 15 minutes, as
+# configured for the system on pvoutput.org) and uploads the closed intervals through the batch
+# status endpoint, up to 30 per request. The remaining request budget is read from the rate limit
+# response headers, so polling every few seconds stays within the hourly cap of the account and
+# intervals that could not be sent yet are kept and uploaded later.
+
+PVOUTPUT_BATCH_URL = 'https://pvoutput.org/service/r2/addbatchstatus.jsp'
+STATUS_INTERVAL = 5 # (minutes)
+BATCH_SIZE = 30 # statuses per request (100 for donators)
+RATE_LIMIT = 60 # requests per hour until the headers told otherwise
+MAX_PENDING = 14 * 24 * 12 # intervals kept in memory, PVOutput only accepts the last 14 days
+HTTP_TIMEOUT = 15 # (seconds)
+
+# status value => (default field, aggregation)
+STATUS_FIELDS = [
+    ('v1', 'power_generation_today', 'last'), # energy generation (Wh)
+    ('v2', 'pv_power', 'avg'), # power generation (W)
+    ('v3', 'power_consumption_today', 'last'), # energy consumption (Wh)
+    ('v4', 'load_power', 'avg'), # power consumption (W)
+    ('v5', 'controller_temperature', 'avg'), # temperature (C)
+    ('v6', 'battery_voltage', 'avg') # voltage (V)
+]
+
+uploaders = {}
+
+# One uploader per PVOutput system, fed by a single device: readings of several devices would be
+# averaged into the same statuses. None for the readings of any other device
+def get_uploader(config, session):
+    pvoutput_config = config['pvoutput']
+    key = pvoutput_config['system_id']
+    alias = config['device']['alias']
+    if key in uploaders and uploaders[key].device != alias:
+        logger.error(f"PVOutput: system {key} is fed by {uploaders[key].device}, ignoring the readings of {alias}", extra=RATE_LIMITED)
+        return None
+    if key not in uploaders:
+        fields = {name: pvoutput_config.get(name, field).strip() for name, field, aggregation in STATUS_FIELDS}
+        uploaders[key] = PVOutputUploader(session, pvoutput_config['api_key'], pvoutput_config['system_id'], fields,
+                                          interval=pvoutput_config.getint('status_interval', fallback=STATUS_INTERVAL),
+                                          batch_size=pvoutput_config.getint('batch_size', fallback=BATCH_SIZE),
+                                          fahrenheit=config['data']['temperature_unit'].strip() == 'F')
+        uploaders[key].device = alias
+    return uploaders[key]
+
+# Sends the open interval on exit, e.g. when a single reading is taken per run from cron
+def close_uploaders():
+    now = time.time()
+    for uploader in uploaders.values():
+        uploader.close_interval(now)
+        try:
+            uploader.upload(now)
+        except Exception as e:
+            logger.error(f"PVOutput: upload failed, {len(uploader.pending)} statuses lost: {e}")
+    uploaders.clear()
+
+atexit.register(close_uploaders)
+
+class PVOutputUploader:
+    def __init__(self, session, api_key, system_id, fields, interval=STATUS_INTERVAL, batch_size=BATCH_SIZE, fahrenheit=False):
+        self.session = session
+        self.api_key = api_key
+        self.system_id = system_id
+        self.fields = fields # v1..v6 => reading field, empty to skip
+        self.interval = interval * 60
+        self.batch_size = batch_size
+        self.fahrenheit = fahrenheit
+        self.device = None # alias of the device feeding the system
+        self.bucket = None # end time of the open interval
+        self.sums = {}
+        self.counts = {}
+        self.last = {}
+        self.pending = [] # closed intervals: (end time, {v1: .., ..})
+        self.limit = RATE_LIMIT
+        self.remaining = RATE_LIMIT
+        self.reset_time = 0
+        self.last_request = 0
+
+    def add(self, json_data, now):
+        bucket = (int(now) // self.interval + 1) * self.interval
+        if self.bucket is not None and bucket != self.bucket: self.close_interval(now)
+        self.bucket = bucket
+        for name, field, aggregation in STATUS_FIELDS:
+            value = json_data.get(self.fields[name])
+            if not isinstance(value, (int, float)): continue
+            if name == 'v5' and self.fahrenheit: value = (value - 32) * 5 / 9
+            self.last[name] = value
+            self.sums[name] = self.sums.get(name, 0) + value
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def close_interval(self, now):
+        if self.bucket is None or len(self.counts) == 0: return
+        end = self.bucket if self.bucket <= now else int(now) // 60 * 60 # PVOutput refuses times in the future
+        values = {}
+        for name, field, aggregation in STATUS_FIELDS:
+            if name not in self.counts: continue
+            values[name] = self.last[name] if aggregation == 'last' else self.sums[name] / self.counts[name]
+        self.pending.append((end, values))
+        if len(self.pending) > MAX_PENDING:
+            logger.warning("PVOutput: too many pending intervals, dropping the oldest")
+            del self.pending[0:len(self.pending) - MAX_PENDING]
+        self.bucket = None
+        self.sums, self.counts, self.last = {}, {}, {}
+
+    # Spreads the requests over the hour and stops when the budget from the headers is used up
+    def can_send(self, now):
+        if self.remaining <= 0:
+            if now < self.reset_time: return False
+            self.remaining = self.limit
+        return now - self.last_request >= 3600 / self.limit
+
+    def upload(self, now):
+        while len(self.pending) > 0 and self.can_send(now):
+            batch = self.pending[0:self.batch_size]
+            if not self.send(batch, now): break
+            del self.pending[0:len(batch)]
+            now = time.time()
+
+    def send(self, batch, now):
+        data = ';'.join(self.format_status(end, values) for end, values in batch)
+        self.last_request = now
+        response = self.session.post(PVOUTPUT_BATCH_URL, data={'data': data}, timeout=HTTP_TIMEOUT, headers={
+            "X-Pvoutput-Apikey": self.api_key,
+            "X-Pvoutput-SystemId": self.system_id,
+            "X-Rate-Limit": "1"
+        })
+        self.update_budget(response.headers, now)
+        if response.status_code == 403 and 'Exceeded' in response.text:
+            self.remaining = 0
+            if self.reset_time <= now: self.reset_time = now + 3600
+            logger.warning(f"PVOutput: rate limit exceeded, waiting until {datetime.fromtimestamp(self.reset_time):%H:%M}")
+            return False
+        if response.status_code != 200:
+            logger.error(f"PVOutput: error {response.status_code} {response.text.strip()}")
+            return response.status_code == 400 # rejected data, don't send it again
+        rejected = [status for status in response.text.strip().split(';') if status.endswith(',0')]
+        if len(rejected) > 0: logger.warning(f"PVOutput: {len(rejected)} statuses not added: {';'.join(rejected)}")
+        logger.info(f"PVOutput: uploaded {len(batch)} statuses, {self.remaining} requests left")
+        return True
+
+    def update_budget(self, headers, now):
+        try:
+            if 'X-Rate-Limit-Limit' in headers: self.limit = max(1, int(headers['X-Rate-Limit-Limit']))
+            if 'X-Rate-Limit-Remaining' in headers: self.remaining = int(headers['X-Rate-Limit-Remaining'])
+            else: self.remaining -= 1
+            if 'X-Rate-Limit-Reset' in headers: self.reset_time = int(headers['X-Rate-Limit-Reset'])
+        except ValueError:
+            self.remaining -= 1
+
+    def format_status(self, end, values):
+        date_time = datetime.fromtimestamp(end).strftime("%Y%m%d,%H:%M")
+        columns = []
+        for name, field, aggregation in STATUS_FIELDS:
+            value = values.get(name)
+            if value is None: columns.append('')
+            elif name in ('v5', 'v6'): columns.append(f"{value:.1f}")
+            else: columns.append(str(int(round(value))))
+        return f"{date_time},{','.join(columns)}"
@@ -0,0 +1,50 @@
+import time
+
+# Adaptive inter-frame pacing, replaces the fixed 0.5 s sleeps between requests when adaptive_pacing is enabled.
+# The next request is sent as soon as the previous response checked out, after a gap learned per device:
+# every answered request shrinks the gap, a lost or corrupted response doubles it and raises the floor
+# the gap may shrink to, so it settles just above what the device tolerates.
+
+MIN_GAP = 0.02 # (seconds)
+MAX_GAP = 1.0 # (seconds)
+INITIAL_GAP = 0.25 # (seconds)
+GAP_DECREASE = 0.8
+GAP_INCREASE = 2.0
+FLOOR_DECAY = 0.98 # lets the floor recover slowly after the device had a bad moment
+MIN_RESPONSE_TIMEOUT = 1.0 # resend a request when no response arrived within this time (seconds)
+MAX_RETRIES = 2 # resends per request before falling back to the read timeout
+
+class Pacing:
+    def __init__(self, gap=INITIAL_GAP):
+        self.gap = gap
+        self.floor = MIN_GAP
+        self.rtt = None # smoothed round trip time of a request (seconds)
+        self.sent_at = None
+
+    def on_sent(self):
+        self.sent_at = time.perf_counter()
+
+    def on_success(self):
+        if self.sent_at is not None:
+            rtt = time.perf_counter() - self.sent_at
+            self.rtt = rtt if self.rtt is None else 0.8 * self.rtt + 0.2 * rtt
+            self.sent_at = None
+        self.floor = max(MIN_GAP, self.floor * FLOOR_DECAY)
+        self.gap = max(self.floor, self.gap * GAP_DECREASE)
+
+    def on_failure(self):
+        self.sent_at = None
+        self.floor = min(MAX_GAP, max(self.floor, self.gap * 1.25))
+        self.gap = min(MAX_GAP, max(self.floor, self.gap * GAP_INCREASE))
+
+    def response_timeout(self):
+        return MIN_RESPONSE_TIMEOUT if self.rtt is None else max(MIN_RESPONSE_TIMEOUT, self.rtt * 4)
+
+# Learned gaps are kept for the life of the process, so the Collector starts each cycle with them
+pacings = {}
+
+def get_pacing(mac_address, device_id):
+    key = (mac_address.strip().upper(), device_id)
+    if key not in pacings:
+        pacings[key] = Pacing()
+    return pacings[key]
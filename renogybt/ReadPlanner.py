@@ -0,0 +1,45 @@
+from .Utils import crc16_modbus
+
+# Merges consecutive register sections into fewer Modbus read requests.
+# A planned request looks like {'register': 12, 'words': 15, 'sections': [(0, section), (14, section)]}
+# where each section is kept with its word offset inside the merged response.
+# Only sections that follow each other in the list and in register order are merged, so parsers
+# still run in the order the client defined them (RoverHistoryClient reads overlapping ranges backwards).
+
+MAX_READ_WORDS = 34 # largest single section the devices are known to answer, clients may raise it
+MODBUS_MAX_READ_WORDS = 125 # largest read request (function 3) a Modbus PDU can carry
+MAX_READ_GAP = 8 # max unused registers read between two sections (words)
+
+def plan_reads(sections, max_words=MAX_READ_WORDS, max_gap=MAX_READ_GAP):
+    max_words = min(max_words, MODBUS_MAX_READ_WORDS)
+    plan = []
+    for section in sections:
+        if len(plan) > 0 and can_merge(plan[-1], section, max_words, max_gap):
+            request = plan[-1]
+            offset = section['register'] - request['register']
+            request['words'] = offset + section['words']
+            request['sections'].append((offset, section))
+        else:
+            plan.append(single_request(section))
+    return plan
+
+def single_request(section):
+    return {'register': section['register'], 'words': section['words'], 'sections': [(0, section)]}
+
+def split_request(request):
+    return [single_request(section) for offset, section in request['sections']]
+
+def can_merge(request, section, max_words, max_gap):
+    gap = section['register'] - (request['register'] + request['words'])
+    total = section['register'] + section['words'] - request['register']
+    return 0 <= gap <= max_gap and total <= max_words
+
+# Cuts the part of a merged response that belongs to one section and rebuilds it as the
+# frame the section parser expects: device id, function, byte count, data, crc
+def slice_response(response, offset, words):
+    start = 3 + offset * 2
+    frame = bytearray(response[0:2])
+    frame.append(words * 2)
+    frame += response[start:start + words * 2]
+    frame += crc16_modbus(frame)
+    return frame
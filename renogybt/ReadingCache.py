@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+import time
+from logger_config import logger
+
+# Latest decoded reading of every device, kept in memory by the clients after each successful read.
+# With [api] enabled a daemon thread serves it over HTTP on a TCP port or a Unix socket, so dashboards
+# and Home Assistant read the cache (microseconds, no bluetooth traffic) while the collector keeps
+# polling on its own schedule. A reading is serialized once, on the first request after it changed.
+#
+#   GET /readings          {"<alias>": {"time": ..., "age": ..., "data": {...}}, ...}
+#   GET /readings/<alias>  {"device": "<alias>", "time": ..., "age": ..., "data": {...}}
+#   GET /devices           ["<alias>", ...]
+
+PORT = 8088
+ADDRESS = '127.0.0.1'
+
+class Entry:
+    __slots__ = ('data', 'time', 'readings', 'encoded')
+
+    def __init__(self, data, timestamp, readings):
+        self.data = data
+        self.time = timestamp
+        self.readings = readings
+        self.encoded = None # JSON of data, built on the first request
+
+class ReadingCache:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {} # alias => Entry
+
+    def update(self, alias, data, timestamp=None):
+        with self.lock:
+            previous = self.entries.get(alias)
+            self.entries[alias] = Entry(dict(data), timestamp or time.time(), previous.readings + 1 if previous else 1)
+
+    def get(self, alias):
+        entry = self.entries.get(alias)
+        return None if entry is None else {'time': entry.time, 'readings': entry.readings, 'data': entry.data}
+
+    def devices(self):
+        return list(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries = {}
+
+    def encoded(self, entry):
+        if entry.encoded is None: entry.encoded = json.dumps(entry.data).encode('utf-8')
+        return entry.encoded
+
+    def entry_json(self, entry, now):
+        return b'"time": %.3f, "age": %.1f, "readings": %d, "data": %s' % (entry.time, now - entry.time, entry.readings, self.encoded(entry))
+
+    # Response bodies, None when the device is unknown
+    def device_json(self, alias, now=None):
+        entry = self.entries.get(alias)
+        if entry is None: return None
+        return b'{"device": %s, %s}' % (json.dumps(alias).encode('utf-8'), self.entry_json(entry, now or time.time()))
+
+    def readings_json(self, now=None):
+        now = now or time.time()
+        entries = list(self.entries.items())
+        return b'{' + b', '.join(b'%s: {%s}' % (json.dumps(alias).encode('utf-8'), self.entry_json(entry, now)) for alias, entry in entries) + b'}'
+
+reading_cache = ReadingCache()
+
+# http.server is only imported when the API is enabled
+def make_handler(cache):
+    from http.server import BaseHTTPRequestHandler
+    from urllib.parse import unquote
+
+    class ReadingHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = unquote(self.path.split('?')[0]).rstrip('/')
+            if path == '/readings':
+                body = cache.readings_json()
+            elif path.startswith('/readings/'):
+                body = cache.device_json(path[len('/readings/'):])
+            elif path == '/devices':
+                body = json.dumps(cache.devices()).encode('utf-8')
+            else:
+                body = None
+            if body is None: return self.send_error(404)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def address_string(self):
+            return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+        def log_message(self, format, *args):
+            logger.debug("API: %s %s", self.address_string(), format % args)
+
+    return ReadingHandler
+
+server = None
+
+# Serves the reading cache from a daemon thread when [api] is enabled, on `socket` if set,
+# otherwise on address:port. Called once per config file by the scripts, the first enabled one wins
+def start_api(config, cache=reading_cache):
+    global server
+    if server is not None or not config.has_section('api') or not config['api'].getboolean('enabled', fallback=False):
+        return server
+    import socketserver
+    from http.server import ThreadingHTTPServer
+    section = config['api']
+    path = section.get('socket', fallback='').strip()
+    try:
+        if path:
+            class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+                daemon_threads = True
+            if os.path.exists(path): os.unlink(path) # left over from a previous run
+            server = UnixHTTPServer(path, make_handler(cache))
+            where = f"unix:{path}"
+        else:
+            address = section.get('address', fallback=ADDRESS)
+            port = section.getint('port', fallback=PORT)
+            server = ThreadingHTTPServer((address, port), make_handler(cache))
+            server.daemon_threads = True
+            where = f"http://{address}:{port}"
+    except OSError as e:
+        logger.error(f"API: unable to listen: {e}")
+        server = None
+        return None
+    threading.Thread(target=server.serve_forever, name='api', daemon=True).start()
+    logger.info(f"API: serving the latest readings on {where}/readings")
+    return server
+
+def stop_api():
+    global server
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+        if isinstance(server.server_address, str) and os.path.exists(server.server_address): os.unlink(server.server_address)
+        server = None
@@ -0,0 +1,83 @@
+import struct
+from .Utils import bytes_to_int
+
+# Declarative register layouts compiled once into a struct.Struct decoder.
+# A layout is a list of fields with their byte offset in the response frame (3 = first data byte).
+# decode() unpacks all fields with a single unpack_from() over the notification buffer, no per-field
+# slicing, and returns the same dict the bytes_to_int based parsers built.
+#
+# CHARGING_INFO = RegisterMap([
+#     Field('battery_voltage', 5, 2, scale = 0.1),
+#     Field('controller_temperature', 9, 1, convert = parse_temperature), # called with the temperature unit
+# ])
+
+STRUCT_CODES = {
+    (1, False): 'B', (1, True): 'b',
+    (2, False): 'H', (2, True): 'h',
+    (4, False): 'I', (4, True): 'i'
+}
+
+class Field:
+    def __init__(self, name, offset, width = 2, signed = False, scale = 1, enum = None, shift = 0, convert = None):
+        self.name = name
+        self.offset = offset
+        self.width = width
+        self.signed = signed
+        self.scale = scale
+        self.enum = enum # value => label, like dict.get() in the parsers
+        self.shift = shift # right shift applied to the raw value, e.g. a flag in the top bit
+        self.convert = convert # convert(value, temperature_unit) applied last
+
+class RegisterMap:
+    def __init__(self, fields):
+        self.fields = list(fields)
+        ordered = sorted(self.fields, key=lambda f: f.offset)
+        fmt = '>'
+        position = 0
+        index = 0
+        indexes = {}
+        for f in ordered:
+            if f.offset < position:
+                raise ValueError(f"RegisterMap: field {f.name} overlaps the previous field")
+            if f.offset > position: fmt += f'{f.offset - position}x'
+            if f.width == 3: # no 24 bit struct code, unpack as 1 + 2 bytes and combine
+                fmt += 'BH'
+                indexes[f.name] = (index, index + 1)
+                index += 2
+            else:
+                fmt += STRUCT_CODES[(f.width, f.signed)]
+                indexes[f.name] = (index,)
+                index += 1
+            position = f.offset + f.width
+        self.struct = struct.Struct(fmt)
+        self.size = position
+        # (name, value indexes, signed 24 bit, scale, enum, shift, convert) in declaration order
+        self.steps = [(f.name, indexes[f.name], f.width == 3 and f.signed, f.scale, f.enum, f.shift, f.convert) for f in self.fields]
+
+    def decode(self, bs, temperature_unit = None):
+        if len(bs) < self.size: return self.decode_slow(bs, temperature_unit)
+        values = self.struct.unpack_from(bs)
+        data = {}
+        for name, index, signed24, scale, enum, shift, convert in self.steps:
+            if len(index) == 1:
+                value = values[index[0]]
+            else:
+                value = (values[index[0]] << 16) | values[index[1]]
+                if signed24 and value & 0x800000: value -= 0x1000000
+            if shift: value >>= shift
+            if scale != 1: value = round(value * scale, 2)
+            if enum is not None: value = enum.get(value)
+            if convert is not None: value = convert(value, temperature_unit)
+            data[name] = value
+        return data
+
+    # Short frames keep the bytes_to_int behaviour of reading missing fields as 0
+    def decode_slow(self, bs, temperature_unit = None):
+        data = {}
+        for f in self.fields:
+            value = bytes_to_int(bs, f.offset, f.width, f.signed) >> f.shift
+            if f.scale != 1: value = round(value * f.scale, 2)
+            if f.enum is not None: value = f.enum.get(value)
+            if f.convert is not None: value = f.convert(value, temperature_unit)
+            data[f.name] = value
+        return data
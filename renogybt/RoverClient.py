@@ -1,6 +1,7 @@
 import asyncio
 from logger_config import logger
 from .BaseClient import BaseClient
+from .RegisterMap import RegisterMap, Field
 from .Utils import bytes_to_int, parse_temperature
 
 # Read and parse BT-1/BT-2 type bluetooth modules connected to Renogy Rover/Wanderer/Adventurer
@@ -33,6 +34,30 @@ BATTERY_TYPE = {
     5: 'custom'
 }
 
+CHARGING_INFO = RegisterMap([
+    Field('function', 1, 1, enum = FUNCTION),
+    Field('battery_percentage', 3),
+    Field('battery_voltage', 5, scale = 0.1),
+    Field('battery_current', 7, scale = 0.01),
+    Field('battery_temperature', 10, 1, convert = parse_temperature),
+    Field('controller_temperature', 9, 1, convert = parse_temperature),
+    Field('load_status', 67, 1, shift = 7, enum = LOAD_STATE),
+    Field('load_voltage', 11, scale = 0.1),
+    Field('load_current', 13, scale = 0.01),
+    Field('load_power', 15),
+    Field('pv_voltage', 17, scale = 0.1),
+    Field('pv_current', 19, scale = 0.01),
+    Field('pv_power', 21),
+    Field('max_charging_power_today', 33),
+    Field('max_discharging_power_today', 35),
+    Field('charging_amp_hours_today', 37),
+    Field('discharging_amp_hours_today', 39),
+    Field('power_generation_today', 41),
+    Field('power_consumption_today', 43),
+    Field('power_generation_total', 59, 4),
+    Field('charging_status', 68, 1, enum = CHARGING_STATE)
+])
+
 class RoverClient(BaseClient):
     def __init__(self, config, on_data_callback=None, on_error_callback=None):
         super().__init__(config)
@@ -40,10 +65,10 @@ class RoverClient(BaseClient):
         self.on_error_callback = on_error_callback
         self.data = {}
         self.sections = [
-            {'register': 12, 'words': 8, 'parser': self.parse_device_info},
-            {'register': 26, 'words': 1, 'parser': self.parse_device_address},
+            {'register': 12, 'words': 8, 'parser': self.parse_device_info, 'refresh': 'static'},
+            {'register': 26, 'words': 1, 'parser': self.parse_device_address, 'refresh': 'static'},
             {'register': 256, 'words': 34, 'parser': self.parse_chargin_info},
-            {'register': 57348, 'words': 1, 'parser': self.parse_battery_type}
+            {'register': 57348, 'words': 1, 'parser': self.parse_battery_type, 'refresh': 'static'}
         ]
         self.set_load_params = {'function': 6, 'register': 266}
 
@@ -79,30 +104,7 @@ class RoverClient(BaseClient):
         self.data.update(data)
 
     def parse_chargin_info(self, bs):
-        data = {}
-        temp_unit = self.config['data']['temperature_unit']
-        data['function'] = FUNCTION.get(bytes_to_int(bs, 1, 1))
-        data['battery_percentage'] = bytes_to_int(bs, 3, 2)
-        data['battery_voltage'] = bytes_to_int(bs, 5, 2, scale = 0.1)
-        data['battery_current'] = bytes_to_int(bs, 7, 2, scale = 0.01)
-        data['battery_temperature'] = parse_temperature(bytes_to_int(bs, 10, 1), temp_unit)
-        data['controller_temperature'] = parse_temperature(bytes_to_int(bs, 9, 1), temp_unit)
-        data['load_status'] = LOAD_STATE.get(bytes_to_int(bs, 67, 1) >> 7)
-        data['load_voltage'] = bytes_to_int(bs, 11, 2, scale = 0.1)
-        data['load_current'] = bytes_to_int(bs, 13, 2, scale = 0.01)
-        data['load_power'] = bytes_to_int(bs, 15, 2)
-        data['pv_voltage'] = bytes_to_int(bs, 17, 2, scale = 0.1) 
-        data['pv_current'] = bytes_to_int(bs, 19, 2, scale = 0.01)
-        data['pv_power'] = bytes_to_int(bs, 21, 2)
-        data['max_charging_power_today'] = bytes_to_int(bs, 33, 2)
-        data['max_discharging_power_today'] = bytes_to_int(bs, 35, 2)
-        data['charging_amp_hours_today'] = bytes_to_int(bs, 37, 2)
-        data['discharging_amp_hours_today'] = bytes_to_int(bs, 39, 2)
-        data['power_generation_today'] = bytes_to_int(bs, 41, 2)
-        data['power_consumption_today'] = bytes_to_int(bs, 43, 2)
-        data['power_generation_total'] = bytes_to_int(bs, 59, 4)
-        data['charging_status'] = CHARGING_STATE.get(bytes_to_int(bs, 68, 1))
-        self.data.update(data)
+        self.data.update(CHARGING_INFO.decode(bs, self.config['data']['temperature_unit']))
 
     def parse_battery_type(self, bs):
         data = {}
@@ -1,7 +1,7 @@
 import asyncio
 import configparser
 import traceback
-from logger_config import logger
+from logger_config import logger, RATE_LIMITED
 from .BaseClient import BaseClient
 from .BLEManager import BLEManager
 from .Utils import bytes_to_int, crc16_modbus, int_to_bytes
@@ -19,23 +19,31 @@ class ShuntBaseClient(BaseClient):
         self.G_WRITE_CHAR_UUID = ""  # RMTShunt sends all data over notify to any connected device
         self.G_READ_TIMEOUT = 30 # (seconds)
 
+    # The shunt streams its own 110 byte packets, not Modbus frames, so they skip the frame assembler
+    async def on_notification(self, data):
+        await self.on_data_received(data)
+
     async def on_data_received(self, response):
-        logger.info("ShuntBaseCLient on_data_received")
+        logger.debug("ShuntBaseCLient on_data_received")
         operation = bytes_to_int(response, 1, 1)
         if self.read_timeout and not self.read_timeout.cancelled(): self.read_timeout.cancel()
 
         if operation == 87: # notify operation for Shunt300
-            logger.info(f"ShuntBaseClient.on_data_received: response for notify operation {self.section_index} {len(self.sections)}")
+            logger.info("ShuntBaseClient.on_data_received: response for notify operation %d %d", self.section_index, len(self.sections), extra=RATE_LIMITED)
             if (self.section_index < len(self.sections) and
                 self.sections[self.section_index]['parser'] != None and
                 self.sections[self.section_index]['words'] == len(response)):
 
                 # parse and update data
-                self.data = self.sections[self.section_index]['parser'](response)
-                self.__safe_callback(self.on_data_callback, self.data, self.config)
-                if self.discovery_timeout and not self.discovery_timeout.cancelled(): self.discovery_timeout.cancel() #only cancel on successful process
+                self.on_shunt_data(self.sections[self.section_index]['parser'](response))
         else:
-            logger.warning("on_data_received: unknown operation={}".format(operation))
+            logger.warning("on_data_received: unknown operation=%s", operation, extra=RATE_LIMITED)
+
+    def on_shunt_data(self, data):
+        self.data = data
+        self.on_reading()
+        self.__safe_callback(self.on_data_callback, self.data, self.config)
+        if self.discovery_timeout and not self.discovery_timeout.cancelled(): self.discovery_timeout.cancel() #only cancel on successful process
 
     def __safe_callback(self, calback, param, param2=None):
         if calback is not None:
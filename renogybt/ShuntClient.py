@@ -1,7 +1,9 @@
 import asyncio
 import time
-from logger_config import logger
+from logger_config import logger, packet_logger, HexDump, RATE_LIMITED
 from .ShuntBaseClient import ShuntBaseClient
+from .WindowAggregator import WindowAggregator
+from .RegisterMap import RegisterMap, Field
 from .Utils import bytes_to_int, parse_temperature, format_temperature
 
 # Read and parse Smart Shunt 300
@@ -34,6 +36,16 @@ BATTERY_TYPE = {
     5: 'custom'
 }
 
+SHUNT_INFO = RegisterMap([
+    Field('main_battery_percent', 34, scale = 0.1), # 0xA6 (#1)
+    Field('main_battery_voltage', 25, 3, scale = 0.001), # 0xA6 (#1)
+    Field('starter_battery_voltage', 30, scale = 0.001), # 0xA6 (#2)
+    Field('charge_amps', 21, 3, scale = 0.001, signed = True), # 0xA4 (#1)
+    Field('battery_temperature', 66, scale = 0.1, convert = format_temperature) # 0xAD (#3)
+])
+
+NOTIFY_OPERATION = 87
+AGGREGATE_FIELDS = ['main_battery_voltage', 'charge_amps', 'charge_watts', 'battery_temperature']
 
 class ShuntClient(ShuntBaseClient):
     def __init__(self, config, on_data_callback=None, on_error_callback=None):
@@ -49,14 +61,23 @@ class ShuntClient(ShuntBaseClient):
         ]
         self.set_load_params = {'function': 6, 'register': 266}
 
+        # With polling, every packet of a poll_interval window is aggregated into one record
+        # instead of keeping a single packet per interval
+        self.aggregator = None
+        self.sample_interval = self.config['data'].getfloat('shunt_sample_interval', fallback=0)
+        self.last_sample = None
+        if self.config['data'].getboolean('enable_polling', fallback=False) and self.config['data'].getboolean('shunt_aggregate', fallback=True):
+            self.aggregator = WindowAggregator(AGGREGATE_FIELDS, self.throttleTimerLen, current_field='charge_amps', power_field='charge_watts')
+
         #logger.info(f'ShuntClient.__init__ {self.G_NOTIFY_CHAR_UUID} {self.G_WRITE_SERVICE_UUID} {self.G_WRITE_CHAR_UUID} {self.G_READ_TIMEOUT}')
 
     async def on_data_received(self, response):
-        logger.info("on_data_receive")
+        if self.aggregator is not None: return self.aggregate(response)
+        logger.debug("on_data_receive")
         operation = bytes_to_int(response, 1, 1)
         # The Smart Shunt sends many data requests, so we need to check if the client is running 
         if self.is_running and (time.perf_counter() - self.throttleTimer) > self.throttleTimerLen:  
-            logger.info(f'ShuntClient.on_data_received {operation} {self.is_running} {time.perf_counter() - self.throttleTimer}')
+            logger.info("ShuntClient.on_data_received %s %s %.1f", operation, self.is_running, time.perf_counter() - self.throttleTimer, extra=RATE_LIMITED)
             self.throttleTimer = time.perf_counter()
 
             if operation == 6: # write operation
@@ -67,6 +88,20 @@ class ShuntClient(ShuntBaseClient):
                 # read is handled in base class
                 await super().on_data_received(response)
 
+    def aggregate(self, response):
+        # reject unwanted packets before any decoding or logging
+        if not self.is_running or len(response) != self.sections[0]['words'] or response[1] != NOTIFY_OPERATION: return
+        now = time.monotonic()
+        if self.last_sample is not None and now - self.last_sample < self.sample_interval: return
+        self.last_sample = now
+        if self.read_timeout and not self.read_timeout.cancelled(): self.read_timeout.cancel()
+
+        self.aggregator.add(self.decode_shunt_info(response), now)
+        if self.aggregator.due(now):
+            record = self.aggregator.flush(now)
+            logger.info("ShuntClient.aggregate: %s samples in %s seconds", record['samples'], record['window'])
+            self.on_shunt_data(record)
+
     def on_write_operation_complete(self):
         #logger.info("on_write_operation_complete")
         if self.on_data_callback is not None:
@@ -89,22 +124,20 @@ class ShuntClient(ShuntBaseClient):
         self.data.update(data)
 
     def parse_shunt_info(self, bs):
-        data = {}
-        temp_unit = self.config['data']['temperature_unit']
-        data['main_battery_percent'] = bytes_to_int(bs, 34, 2, scale = 0.1) # 0xA6 (#1)
-        data['main_battery_voltage'] = bytes_to_int(bs, 25, 3, scale = 0.001) # 0xA6 (#1)
-        data['starter_battery_voltage'] = bytes_to_int(bs, 30, 2, scale = 0.001) # 0xA6 (#2)
-        data['charge_amps'] = bytes_to_int(bs, 21, 3, scale = 0.001, signed=True) # 0xA4 (#1)
+        data = self.decode_shunt_info(bs)
+        self.data.update(data)
+        # logger.debug(msg=f"DATA: {self.data}")
+        packet_logger.debug("parse_shunt_info bs hex => %s", HexDump(bs))
+        return data
+
+    def decode_shunt_info(self, bs):
+        data = SHUNT_INFO.decode(bs, self.config['data']['temperature_unit'])
         data['charge_watts'] = round((data['main_battery_voltage'] * data['charge_amps']), 2)
         #data['temperature_1'] = 0.00 if bytes_to_int(bs, 67, 1) == 0 else bytes_to_int(bs, 66, 3, scale = 0.001) # 0xAD (#3)
-        data['battery_temperature'] = format_temperature(bytes_to_int(bs, 66, 2, scale = 0.1), temp_unit) # 0xAD (#3)
         #data['temperature_2'] = 0.00 if bytes_to_int(bs, 71, 1) == 0 else bytes_to_int(bs, 70, 3, scale = 0.001) # 0xAD (#4)
         # unknown values:
         # - time_remaining
         # - discharge_duration
         # - consumed_amp_hours
-        self.data.update(data)
-        # logger.debug(msg=f"DATA: {self.data}")
-        logger.warning(f'parse_shunt_info bs hex => {bs.hex()}')
         return data
         
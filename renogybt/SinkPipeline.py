@@ -0,0 +1,138 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logger_config import logger, RATE_LIMITED
+from .Metrics import metrics
+
+# Decouples the data loggers (MQTT, PVOutput, remote HTTP) from the BLE event loop.
+# submit() only puts the call on a bounded per-sink queue, so a slow server never stalls
+# notification handling. Each sink has its own workers and thread pool (concurrency limit)
+# and a timeout per call. When a queue is full the oldest entry is dropped, put() waits for
+# space instead (backpressure) for producers that can afford to wait.
+# A thread cannot be interrupted: a call that timed out keeps its thread until it returns, and
+# while all threads of a sink are taken that way its calls are skipped instead of piling up.
+
+QUEUE_SIZE = 100 # pending calls per sink
+SINK_CONCURRENCY = 1 # parallel calls per sink
+SINK_TIMEOUT = 20 # (seconds)
+DRAIN_TIMEOUT = 30 # max wait for queued calls when shutting down (seconds)
+
+class Sink:
+    def __init__(self, name, concurrency, timeout, queue_size):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f'sink-{name}')
+        self.workers = []
+        self.running = set() # executor futures, the ones that timed out included
+        self.dropped = 0
+        self.failed = 0
+        self.sent = 0
+
+class SinkPipeline:
+    def __init__(self, queue_size=QUEUE_SIZE, drop_oldest=True):
+        self.queue_size = queue_size
+        self.drop_oldest = drop_oldest # otherwise the newest call is dropped
+        self.settings = {} # name => (concurrency, timeout)
+        self.sinks = {}
+        self.loop = None
+
+    def add_sink(self, name, concurrency=SINK_CONCURRENCY, timeout=SINK_TIMEOUT):
+        self.settings[name] = (concurrency, timeout)
+
+    def get_sink(self, name):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            # queues and workers belong to one event loop, start over when a client runs a new one
+            for sink in self.sinks.values(): sink.executor.shutdown(wait=False)
+            self.sinks = {}
+            self.loop = loop
+        sink = self.sinks.get(name)
+        if sink is None:
+            concurrency, timeout = self.settings.get(name, (SINK_CONCURRENCY, SINK_TIMEOUT))
+            sink = Sink(name, concurrency, timeout, self.queue_size)
+            sink.workers = [loop.create_task(self.worker(sink)) for _ in range(sink.concurrency)]
+            self.sinks[name] = sink
+        return sink
+
+    # Never blocks: called from the data callbacks which run on the BLE event loop
+    def submit(self, name, func, *args, **kwargs):
+        call = functools.partial(func, *args, **kwargs)
+        try:
+            sink = self.get_sink(name)
+        except RuntimeError: # no running event loop, nothing to protect
+            return self.call(name, call)
+
+        if sink.queue.full():
+            sink.dropped += 1
+            metrics.inc('renogy_sink_dropped_total', sink=name)
+            if not self.drop_oldest:
+                return logger.warning("SinkPipeline: %s queue full, dropping newest entry", name, extra=RATE_LIMITED)
+            sink.queue.get_nowait()
+            sink.queue.task_done()
+            logger.warning("SinkPipeline: %s queue full, dropping oldest entry", name, extra=RATE_LIMITED)
+        sink.queue.put_nowait((time.perf_counter(), call))
+
+    async def put(self, name, func, *args, **kwargs):
+        await self.get_sink(name).queue.put((time.perf_counter(), functools.partial(func, *args, **kwargs)))
+
+    def busy(self, sink):
+        sink.running = {future for future in sink.running if not future.done()}
+        return len(sink.running) >= sink.concurrency
+
+    async def worker(self, sink):
+        while True:
+            queued, call = await sink.queue.get()
+            start = time.perf_counter()
+            metrics.observe('renogy_sink_queue_seconds', start - queued, sink=sink.name)
+            if self.busy(sink):
+                sink.failed += 1
+                metrics.inc('renogy_sink_failures_total', sink=sink.name)
+                logger.error("SinkPipeline: %s skipped, %d earlier calls still hang", sink.name, len(sink.running), extra=RATE_LIMITED)
+                sink.queue.task_done()
+                continue
+            try:
+                future = sink.executor.submit(call)
+                sink.running.add(future)
+                await asyncio.wait_for(asyncio.wrap_future(future), sink.timeout)
+                sink.sent += 1
+            except asyncio.TimeoutError:
+                sink.failed += 1
+                metrics.inc('renogy_sink_failures_total', sink=sink.name)
+                logger.error(f"SinkPipeline: {sink.name} timed out after {sink.timeout} seconds")
+            except Exception as e:
+                sink.failed += 1
+                metrics.inc('renogy_sink_failures_total', sink=sink.name)
+                logger.error(f"SinkPipeline: {sink.name} failed: {e}")
+            finally:
+                sink.queue.task_done()
+            elapsed = time.perf_counter() - start
+            metrics.observe('renogy_sink_seconds', elapsed, sink=sink.name)
+            logger.debug("SinkPipeline: %s took %.2f seconds", sink.name, elapsed)
+
+    def call(self, name, call):
+        start = time.perf_counter()
+        try:
+            call()
+        except Exception as e:
+            metrics.inc('renogy_sink_failures_total', sink=name)
+            logger.error(f"SinkPipeline: {name} failed: {e}")
+        metrics.observe('renogy_sink_seconds', time.perf_counter() - start, sink=name)
+
+    # Waits for the queued calls, then stops the workers. Call before the event loop ends
+    async def drain(self, timeout=DRAIN_TIMEOUT):
+        if self.loop is not asyncio.get_running_loop(): return
+        sinks = list(self.sinks.values())
+        try:
+            await asyncio.wait_for(asyncio.gather(*(sink.queue.join() for sink in sinks)), timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"SinkPipeline: gave up waiting for sinks after {timeout} seconds")
+        for sink in sinks:
+            for worker in sink.workers: worker.cancel()
+            if sink.dropped > 0: logger.warning(f"SinkPipeline: {sink.name} dropped {sink.dropped} entries")
+        await asyncio.gather(*(worker for sink in sinks for worker in sink.workers), return_exceptions=True)
+        for sink in sinks: sink.executor.shutdown(wait=False)
+        self.sinks = {}
+        self.loop = None
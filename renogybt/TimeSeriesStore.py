@@ -0,0 +1,241 @@
+import atexit
+import bisect
+import math
+import mmap
+import os
+import re
+import threading
+from array import array
+from logger_config import logger
+
+# Embedded time-series store, so readings can be charted without running a database on the Pi.
+# Every device has a timestamp column and one float64 column per numeric field, each column is a
+# file mapped into memory and grown in fixed chunks. Rollups (1 minute, 1 hour, 1 day, UTC aligned)
+# keep min/max/sum/count per bucket and are updated on every insert. Timestamps only grow, so a
+# range query is a binary search on the timestamp column followed by a slice, never a full scan.
+# Every series keeps at most max_rows rows: once it is a chunk over, the oldest rows are dropped by
+# moving the rest to the front of the files, so the files stop growing about a chunk past max_rows.
+#
+#   <path>/<device>/raw/time.col, <field>.col
+#   <path>/<device>/1m/time.col, <field>.col (4 values per row: min, max, sum, count)
+
+CHUNK_ROWS = 4096 # columns grow by this many rows
+MAX_ROWS = 100000 # rows kept per series, about 70 days of readings (or 1m rollups) at one per minute
+ROLLUPS = {'1m': 60, '1h': 3600, '1d': 86400}
+NAN = float('nan')
+TIME_FILL = (0.0,)
+RAW_FILL = (NAN,)
+ROLLUP_FILL = (NAN, NAN, 0.0, 0.0) # min, max, sum, count
+
+stores = {}
+
+def get_store(config):
+    path = config['timeseries'].get('path', 'timeseries').strip()
+    if not os.path.isabs(path): path = os.path.join(os.getcwd(), path)
+    if path not in stores: stores[path] = TimeSeriesStore(path, config['timeseries'].getint('max_rows', fallback=MAX_ROWS))
+    return stores[path]
+
+def close_stores():
+    for store in stores.values(): store.close()
+    stores.clear()
+
+atexit.register(close_stores)
+
+def series_name(name):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name.strip())
+
+class Column:
+    def __init__(self, path, fill):
+        self.path = path
+        self.width = len(fill) # values per row
+        self.fill = array('d', fill).tobytes() # row that was never written
+        self.mm = None
+        self.values = None
+        with open(path, 'ab'): pass
+        self.capacity = os.path.getsize(path) // (8 * self.width)
+        if self.capacity == 0: self.grow(CHUNK_ROWS)
+        else: self.map()
+
+    def map(self):
+        with open(self.path, 'r+b') as f:
+            self.mm = mmap.mmap(f.fileno(), 0)
+        self.values = memoryview(self.mm).cast('d')
+
+    def unmap(self):
+        if self.mm is None: return
+        self.values.release()
+        self.mm.close()
+        self.mm = None
+
+    def grow(self, rows):
+        capacity = (rows + CHUNK_ROWS - 1) // CHUNK_ROWS * CHUNK_ROWS
+        self.unmap()
+        with open(self.path, 'r+b') as f:
+            f.seek(self.capacity * 8 * self.width)
+            f.write(self.fill * (capacity - self.capacity))
+        self.capacity = capacity
+        self.map()
+
+    def ensure(self, rows):
+        if rows > self.capacity: self.grow(rows)
+
+    # drops the first count of rows rows, the freed rows at the end are empty again
+    def drop(self, rows, count):
+        size = 8 * self.width
+        self.mm.move(0, count * size, (rows - count) * size)
+        self.mm[(rows - count) * size:rows * size] = self.fill * count
+
+    def flush(self):
+        if self.mm is not None: self.mm.flush()
+
+class Series:
+    def __init__(self, path, fill, max_rows=0):
+        self.path = path
+        self.fill = fill
+        self.max_rows = max_rows # 0 keeps every row
+        os.makedirs(path, exist_ok=True)
+        self.time = Column(os.path.join(path, 'time.col'), TIME_FILL)
+        self.columns = {}
+        for file in os.listdir(path):
+            if file.endswith('.col') and file != 'time.col':
+                self.columns[file[:-4]] = Column(os.path.join(path, file), fill)
+        # written rows have a timestamp, the rest of the last chunk is still zero
+        self.rows = bisect.bisect_left(ZeroSearch(self.time.values), True, 0, self.time.capacity)
+
+    def column(self, field):
+        column = self.columns.get(field)
+        if column is None:
+            column = Column(os.path.join(self.path, f'{field}.col'), self.fill)
+            column.ensure(self.rows)
+            self.columns[field] = column
+        return column
+
+    def append(self, timestamp):
+        if self.max_rows > 0 and self.rows >= self.max_rows + CHUNK_ROWS: self.drop(self.rows - self.max_rows)
+        self.time.ensure(self.rows + 1)
+        for column in self.columns.values(): column.ensure(self.rows + 1)
+        self.time.values[self.rows] = timestamp
+        self.rows += 1
+        return self.rows - 1
+
+    def drop(self, count):
+        for column in self.columns.values(): column.drop(self.rows, count)
+        self.time.drop(self.rows, count)
+        self.rows -= count
+
+    def last_time(self):
+        return self.time.values[self.rows - 1] if self.rows > 0 else None
+
+    # rows with start <= timestamp <= end
+    def range(self, start=None, end=None):
+        times = self.time.values
+        lo = 0 if start is None else bisect.bisect_left(times, start, 0, self.rows)
+        hi = self.rows if end is None else bisect.bisect_right(times, end, lo, self.rows)
+        return lo, hi
+
+    def flush(self):
+        self.time.flush()
+        for column in self.columns.values(): column.flush()
+
+    def close(self):
+        self.time.unmap()
+        for column in self.columns.values(): column.unmap()
+
+class ZeroSearch:
+    # bisect helper: False for written timestamps, True for the zero padding after them
+    def __init__(self, values):
+        self.values = values
+
+    def __getitem__(self, i):
+        return self.values[i] == 0
+
+class TimeSeriesStore:
+    def __init__(self, path, max_rows=MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self.lock = threading.RLock() # written by the sink worker, queried from anywhere
+        self.devices = {} # device => {'raw': Series, '1m': Series, ..}
+
+    def device(self, device):
+        name = series_name(device)
+        series = self.devices.get(name)
+        if series is None:
+            base = os.path.join(self.path, name)
+            series = {'raw': Series(os.path.join(base, 'raw'), RAW_FILL, self.max_rows)}
+            for level in ROLLUPS: series[level] = Series(os.path.join(base, level), ROLLUP_FILL, self.max_rows)
+            self.devices[name] = series
+        return series
+
+    def append(self, device, data, timestamp):
+        values = {series_name(field): float(value) for field, value in data.items()
+                  if isinstance(value, (int, float)) and not field.startswith('__')}
+        with self.lock:
+            series = self.device(device)
+            raw = series['raw']
+            last = raw.last_time()
+            if last is not None and timestamp <= last:
+                logger.warning(f"TimeSeriesStore: {device} timestamp went backwards, storing at {last}")
+                timestamp = last + 1e-6
+            for field in values: raw.column(field)
+            row = raw.append(timestamp)
+            for field, column in raw.columns.items():
+                column.values[row] = values.get(field, NAN)
+            for level, size in ROLLUPS.items():
+                self.rollup(series[level], timestamp // size * size, values)
+
+    # updates the bucket in place, or starts a new one (new rows are already empty)
+    def rollup(self, series, bucket, values):
+        for field in values: series.column(field)
+        if series.last_time() != bucket: series.append(bucket)
+        row = (series.rows - 1) * 4
+        for field, value in values.items():
+            if math.isnan(value): continue
+            stats = series.columns[field].values
+            if stats[row + 3] == 0 or value < stats[row]: stats[row] = value
+            if stats[row + 3] == 0 or value > stats[row + 1]: stats[row + 1] = value
+            stats[row + 2] += value
+            stats[row + 3] += 1
+
+    # resolution 'raw' returns [(time, value)], a rollup ('1m', '1h', '1d') returns [(time, min, max, mean)]
+    def query(self, device, field, start=None, end=None, resolution='raw'):
+        with self.lock:
+            series = self.device(device).get(resolution)
+            if series is None: raise ValueError(f"unknown resolution {resolution}")
+            column = series.columns.get(series_name(field))
+            if column is None: return []
+            lo, hi = series.range(start, end)
+            times = series.time.values
+            if resolution == 'raw':
+                return [(times[i], column.values[i]) for i in range(lo, hi) if not math.isnan(column.values[i])]
+            result = []
+            stats = column.values
+            for i in range(lo, hi):
+                count = stats[i * 4 + 3]
+                if count > 0: result.append((times[i], stats[i * 4], stats[i * 4 + 1], stats[i * 4 + 2] / count))
+            return result
+
+    def latest(self, device):
+        with self.lock:
+            raw = self.device(device)['raw']
+            if raw.rows == 0: return None
+            row = raw.rows - 1
+            data = {field: column.values[row] for field, column in raw.columns.items() if not math.isnan(column.values[row])}
+            data['time'] = raw.time.values[row]
+            return data
+
+    def fields(self, device):
+        with self.lock:
+            return sorted(self.device(device)['raw'].columns)
+
+    def flush(self):
+        with self.lock:
+            for series in self.devices.values():
+                for level in series.values(): level.flush()
+
+    def close(self):
+        with self.lock:
+            for series in self.devices.values():
+                for level in series.values():
+                    level.flush()
+                    level.close()
+            self.devices = {}
@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 # Reads data from a list of bytes, and converts to an int
 def bytes_to_int(bs, offset, length, signed = False, scale = 1):
         ret = 0
@@ -74,14 +76,29 @@ CRC16_HIGH_BYTES = (
     0x00, 0xC1, 0x81, 0x40, 0x01, 0xC0, 0x80, 0x41, 0x01, 0xC0, 0x80, 0x41, 0x00, 0xC1, 0x81, 0x40
 )
 
+# Both byte tables merged into one 16 bit table, one lookup per byte
+CRC16_TABLE = tuple(high | (low << 8) for high, low in zip(CRC16_HIGH_BYTES, CRC16_LOW_BYTES))
+
+# CRC-16 for Modbus as an int, the low byte is sent first
+def crc16_modbus_int(data, crc = 0xFFFF):
+    table = CRC16_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
 # Calculate CRC-16 for Modbus
 def crc16_modbus(data: bytes):
-    crc_high = 0xFF
-    crc_low = 0xFF
+    crc = crc16_modbus_int(data)
+    return bytes((crc & 0xFF, crc >> 8))
 
-    for byte in data:
-        index = crc_high ^ int(byte)
-        crc_high = crc_low ^ CRC16_HIGH_BYTES[index]
-        crc_low = CRC16_LOW_BYTES[index]
+# Checks the trailing CRC of a complete Modbus frame.
+# The CRC over a frame including its own CRC is 0, so no slicing or comparing is needed
+def check_crc(frame):
+    return len(frame) > 2 and crc16_modbus_int(frame) == 0
 
-    return bytes([crc_high, crc_low])
+# Builds a Modbus request frame: device id, function, register, value (word count for reads), crc.
+# The frames of a client never change between polls, so they are built once and cached
+@lru_cache(maxsize = 512)
+def modbus_request(device_id, function, register, value):
+    frame = bytes((device_id & 0xFF, function & 0xFF, (register >> 8) & 0xFF, register & 0xFF, (value >> 8) & 0xFF, value & 0xFF))
+    return frame + crc16_modbus(frame)
@@ -0,0 +1,72 @@
+# Running statistics over a time window for streaming devices like the Smart Shunt.
+# Each window keeps min/max/mean/last of the configured fields and integrates current and power
+# over time (trapezoidal) into amp hours and watt hours, then emits a single record.
+
+MAX_SAMPLE_GAP = 60 # don't integrate across gaps longer than this, e.g. while reconnecting (seconds)
+
+class WindowAggregator:
+    def __init__(self, fields, window, current_field=None, power_field=None):
+        self.fields = list(fields)
+        self.window = window
+        self.current_field = current_field
+        self.power_field = power_field
+        self.last_time = None
+        self.last_current = None
+        self.last_power = None
+        self.reset(None)
+
+    def reset(self, now):
+        self.window_start = now
+        self.count = 0
+        self.last = None
+        self.stats = {field: None for field in self.fields} # field => [min, max, sum]
+        self.amp_hours = 0.0
+        self.watt_hours = 0.0
+
+    def add(self, data, now):
+        if self.window_start is None: self.window_start = now
+        for field in self.fields:
+            value = data.get(field)
+            if value is None: continue
+            stats = self.stats[field]
+            if stats is None:
+                self.stats[field] = [value, value, value]
+            else:
+                if value < stats[0]: stats[0] = value
+                if value > stats[1]: stats[1] = value
+                stats[2] += value
+        self.integrate(data, now)
+        self.last = data
+        self.count += 1
+
+    def integrate(self, data, now):
+        current = data.get(self.current_field) if self.current_field else None
+        power = data.get(self.power_field) if self.power_field else None
+        if self.last_time is not None and 0 < now - self.last_time <= MAX_SAMPLE_GAP:
+            hours = (now - self.last_time) / 3600
+            if current is not None and self.last_current is not None:
+                self.amp_hours += (current + self.last_current) / 2 * hours
+            if power is not None and self.last_power is not None:
+                self.watt_hours += (power + self.last_power) / 2 * hours
+        self.last_time = now
+        self.last_current = current
+        self.last_power = power
+
+    def due(self, now):
+        return self.count > 0 and now - self.window_start >= self.window
+
+    # Returns the record of the current window and starts the next one.
+    # The last values keep their field names, so consumers of single readings keep working
+    def flush(self, now):
+        record = dict(self.last)
+        for field, stats in self.stats.items():
+            if stats is None: continue
+            record[f'{field}_min'] = stats[0]
+            record[f'{field}_max'] = stats[1]
+            record[f'{field}_avg'] = round(stats[2] / self.count, 3)
+        if self.current_field: record['charge_amp_hours'] = round(self.amp_hours, 4)
+        if self.power_field: record['charge_watt_hours'] = round(self.watt_hours, 3)
+        record['samples'] = self.count
+        record['window'] = round(now - self.window_start, 1)
+        self.reset(now)
+        return record
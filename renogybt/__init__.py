@@ -1,8 +1,36 @@
-from .RoverClient import RoverClient
-from .DataLogger import DataLogger
-from .BatteryClient import BatteryClient
-from .RoverHistoryClient import RoverHistoryClient
-from .InverterClient import InverterClient
-from .DCChargerClient import DCChargerClient
-from .ShuntClient import ShuntClient
+import importlib
+import sys
+import types
 from .Utils import *
+
+# Clients and loggers are imported on first use (PEP 562), so `import renogybt` does not load
+# bleak, asyncio, requests or paho-mqtt until a script actually needs them.
+LAZY_IMPORTS = {
+    'RoverClient': '.RoverClient',
+    'DataLogger': '.DataLogger',
+    'BatteryClient': '.BatteryClient',
+    'RoverHistoryClient': '.RoverHistoryClient',
+    'InverterClient': '.InverterClient',
+    'DCChargerClient': '.DCChargerClient',
+    'ShuntClient': '.ShuntClient',
+    'Collector': '.Collector',
+    'TimeSeriesStore': '.TimeSeriesStore',
+}
+
+def __getattr__(name):
+    module = LAZY_IMPORTS.get(name)
+    if module is None: raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(module, __name__), name)
+
+def __dir__():
+    return sorted(list(globals()) + list(LAZY_IMPORTS))
+
+class LazyModule(types.ModuleType):
+    # The import system binds every loaded submodule on the package, e.g. renogybt.Collector,
+    # keep the class of the same name there instead, like the former eager imports did
+    def __setattr__(self, name, value):
+        if name in LAZY_IMPORTS and isinstance(value, types.ModuleType) and hasattr(value, name):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+sys.modules[__name__].__class__ = LazyModule
@@ -0,0 +1,174 @@
+import asyncio
+import configparser
+import random
+import time
+from .DeviceModels import DEVICE_MODELS, HubModel
+from .FakeBleak import BLEDevice, BleakError
+
+# A set of virtual devices behind the fake bleak classes. Responses are delayed by latency +
+# uniform(0, jitter), split into notifications of at most mtu bytes, and each notification (and
+# each written request) is lost with probability loss. Streaming models (the shunt) push a packet
+# every packet_interval to every subscribed client.
+
+LATENCY = 0.05 # (seconds)
+JITTER = 0.02 # (seconds)
+MTU = 20 # notification payload, 23 byte ATT MTU minus the 3 byte header
+CONNECT_LATENCY = 0.3 # (seconds)
+ADVERTISE_INTERVAL = 0.002 # time between two advertisements seen by a scan (seconds)
+
+CONFIG_TEMPLATE = """
+[device]
+adapter = {adapter}
+mac_addr = {address}
+alias = {name}
+type = {type}
+device_id = {device_id}
+hub_devices = {hub_devices}
+
+[data]
+enable_polling = false
+poll_interval = 60
+temperature_unit = C
+fields =
+
+[remote_logging]
+enabled = false
+
+[mqtt]
+enabled = false
+
+[pvoutput]
+enabled = false
+"""
+
+class VirtualDevice:
+    def __init__(self, model):
+        self.model = model
+        self.name = model.name
+        self.address = model.address
+        self.ble_device = BLEDevice(model.address, model.name)
+        self.clients = []
+
+class DeviceFarm:
+    def __init__(self, latency=LATENCY, jitter=JITTER, mtu=MTU, loss=0.0, connect_latency=CONNECT_LATENCY,
+                 connect_failure=0.0, fragment_gap=0.0, advertise_interval=ADVERTISE_INTERVAL, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.mtu = max(1, mtu)
+        self.loss = loss
+        self.connect_latency = connect_latency
+        self.connect_failure = connect_failure
+        self.fragment_gap = fragment_gap # pause between the notifications of one frame (seconds)
+        self.advertise_interval = advertise_interval
+        self.random = random.Random(seed)
+        self.devices = {} # upper case address => VirtualDevice
+        self.streams = {} # client => task
+        self.scans = 0
+        self.connections = 0
+        self.requests = 0
+        self.responses = 0
+        self.notifications = 0
+        self.lost = 0
+
+    def add(self, model):
+        device = VirtualDevice(model)
+        self.devices[model.address.upper()] = device
+        return device
+
+    # kind: key of DEVICE_MODELS ('rover', 'dcc', 'battery', 'inverter', 'shunt')
+    def add_devices(self, kind, count, device_id=255):
+        model_class = DEVICE_MODELS[kind]
+        start = len(self.devices)
+        devices = []
+        for i in range(start, start + count):
+            address = 'DE:AD:{:02X}:{:02X}:{:02X}:{:02X}'.format(list(DEVICE_MODELS).index(kind), (i >> 16) & 0xFF, (i >> 8) & 0xFF, i & 0xFF)
+            devices.append(self.add(model_class(address, device_id=device_id, seed=self.random.random())))
+        return devices
+
+    # One BT-2 in hub mode, members: [(kind, device_id), ...] e.g. [('rover', 97), ('battery', 48)]
+    def add_hub(self, members):
+        i = len(self.devices)
+        address = 'DE:AD:FF:{:02X}:{:02X}:{:02X}'.format((i >> 16) & 0xFF, (i >> 8) & 0xFF, i & 0xFF)
+        models = [DEVICE_MODELS[kind](address, device_id=device_id, seed=self.random.random()) for kind, device_id in members]
+        return self.add(HubModel(address, models, seed=self.random.random()))
+
+    # Readings a full cycle yields, a hub has one per member
+    def readings_per_cycle(self):
+        return sum(len(getattr(device.model, 'members', [None])) for device in self.devices.values())
+
+    def get(self, address):
+        return self.devices.get(str(address).upper())
+
+    def advertising(self):
+        devices = list(self.devices.values())
+        self.random.shuffle(devices)
+        return devices
+
+    def delay(self, base):
+        return base + self.random.uniform(0, self.jitter)
+
+    def lose(self):
+        if self.loss > 0 and self.random.random() < self.loss:
+            self.lost += 1
+            return True
+        return False
+
+    async def connect(self, client):
+        await asyncio.sleep(self.delay(self.connect_latency))
+        if self.connect_failure > 0 and self.random.random() < self.connect_failure:
+            raise BleakError("simulated connection failure")
+        self.connections += 1
+        client.device.clients.append(client)
+
+    def subscribed(self, client):
+        if client.device.model.streaming and client not in self.streams:
+            self.streams[client] = asyncio.ensure_future(self.stream(client))
+
+    def disconnected(self, client):
+        if client in client.device.clients: client.device.clients.remove(client)
+        task = self.streams.pop(client, None)
+        if task is not None: task.cancel()
+
+    def write(self, client, request):
+        self.requests += 1
+        if self.lose(): return
+        response = client.device.model.handle(request)
+        if response is not None: asyncio.ensure_future(self.deliver(client, response))
+
+    async def deliver(self, client, frame, mtu=None):
+        mtu = mtu or self.mtu
+        await asyncio.sleep(self.delay(self.latency))
+        self.responses += 1
+        for start in range(0, len(frame), mtu):
+            if not client.is_connected or client.notify_callback is None: return
+            if start > 0 and self.fragment_gap > 0: await asyncio.sleep(self.fragment_gap)
+            if self.lose(): continue
+            self.notifications += 1
+            await client.notify_callback(client.notify_char, bytearray(frame[start:start + mtu]))
+
+    async def stream(self, client):
+        model = client.device.model
+        while client.is_connected:
+            await asyncio.sleep(model.packet_interval)
+            packet = model.packet(time.time())
+            await self.deliver(client, packet, len(packet)) # the shunt negotiates a larger MTU, one packet per notification
+
+    # Simulates a link loss of every connection to the device
+    def drop_link(self, address):
+        for client in list(self.get(address).clients): client.lose_link()
+
+    # config.ini equivalents for the devices, spread over `adapters` bluetooth adapters
+    def configs(self, adapters=1, **data_options):
+        configs = []
+        for i, device in enumerate(self.devices.values()):
+            config = configparser.ConfigParser(inline_comment_prefixes=('#'))
+            config.read_string(CONFIG_TEMPLATE.format(adapter=f"hci{i % adapters}", address=device.address, name=device.name,
+                                                      type=device.model.client_type, device_id=device.model.device_id,
+                                                      hub_devices=getattr(device.model, 'hub_devices', '')))
+            for option, value in data_options.items(): config['data'][option] = str(value)
+            configs.append(config)
+        return configs
+
+    def stats(self):
+        return {'devices': len(self.devices), 'scans': self.scans, 'connections': self.connections, 'requests': self.requests,
+                'responses': self.responses, 'notifications': self.notifications, 'lost': self.lost}
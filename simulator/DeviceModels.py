@@ -0,0 +1,289 @@
+import math
+import random
+import time
+# Virtual Renogy devices. Each model keeps a register image laid out like the real device, so the
+# renogybt clients read and parse it unchanged. update() refreshes the live values from a simple
+# daylight curve plus noise before every read.
+
+NOTIFY_CHAR_UUID = "0000fff1-0000-1000-8000-00805f9b34fb"
+WRITE_SERVICE_UUID = "0000ffd0-0000-1000-8000-00805f9b34fb"
+WRITE_CHAR_UUID = "0000ffd1-0000-1000-8000-00805f9b34fb"
+SHUNT_NOTIFY_CHAR_UUID = "0000c411-0000-1000-8000-00805f9b34fb"
+
+ILLEGAL_ADDRESS = 2 # Modbus exception code
+
+# Plain bitwise CRC, independent of renogybt.Utils so the simulator checks the library's frames
+# (and can be imported before bleak is replaced)
+def crc16_modbus(data):
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return bytes([crc & 0xFF, crc >> 8])
+
+def check_crc(frame):
+    return crc16_modbus(frame[:-2]) == bytes(frame[-2:])
+
+def daylight(now):
+    # 0 at night, 1 at noon (local time)
+    hours = time.localtime(now).tm_hour + time.localtime(now).tm_min / 60
+    return max(0.0, math.sin((hours - 6) / 12 * math.pi))
+
+class DeviceModel:
+    client_type = None # config.ini device type
+    name_prefix = 'BT-TH'
+    notify_uuid = NOTIFY_CHAR_UUID
+    write_service_uuid = WRITE_SERVICE_UUID
+    write_uuid = WRITE_CHAR_UUID
+    blocks = [] # (register, words) ranges the device answers
+    streaming = False # sends packets on its own instead of answering requests
+
+    def __init__(self, address, name=None, device_id=255, seed=None):
+        self.address = address
+        self.name = name or f"{self.name_prefix}-{address.replace(':', '')[-8:]}"
+        self.device_id = device_id
+        self.random = random.Random(seed if seed is not None else address)
+        self.registers = {} # register => 16 bit word
+        self.reads = 0
+        self.writes = 0
+        self.setup()
+
+    def setup(self):
+        pass
+
+    def update(self, now):
+        pass
+
+    def set(self, register, value, words=1, signed=False):
+        value = int(round(value))
+        if signed and value < 0: value += 1 << (16 * words)
+        for i in range(words):
+            self.registers[register + i] = (value >> (16 * (words - 1 - i))) & 0xFFFF
+
+    def set_bytes(self, register, high, low):
+        self.registers[register] = ((high & 0xFF) << 8) | (low & 0xFF)
+
+    def set_text(self, register, text, words, pad=b' '):
+        data = text.encode('utf-8').ljust(words * 2, pad)[:words * 2]
+        for i in range(words):
+            self.registers[register + i] = (data[i * 2] << 8) | data[i * 2 + 1]
+
+    def read_words(self, register, words):
+        return [self.registers.get(register + i, 0) for i in range(words)]
+
+    def answers(self, register, words):
+        return any(start <= register and register + words <= start + count for start, count in self.blocks)
+
+    def noise(self, value, spread):
+        return value + self.random.uniform(-spread, spread)
+
+    # Modbus request in, response frame out (None when the request is not for this device)
+    def handle(self, request):
+        request = bytes(request)
+        if len(request) != 8 or not check_crc(request): return None
+        device_id, function = request[0], request[1]
+        if device_id not in (self.device_id, 255): return None
+        register = int.from_bytes(request[2:4], 'big')
+        value = int.from_bytes(request[4:6], 'big')
+        if function == 3:
+            self.reads += 1
+            if not self.answers(register, value): return self.error(device_id, function, ILLEGAL_ADDRESS)
+            self.update(time.time())
+            frame = bytearray([device_id, 3, value * 2])
+            for word in self.read_words(register, value): frame += word.to_bytes(2, 'big')
+            return bytes(frame + crc16_modbus(frame))
+        if function == 6:
+            self.writes += 1
+            self.registers[register] = value
+            return request # echoed
+        return self.error(device_id, function, 1)
+
+    def error(self, device_id, function, code):
+        frame = bytearray([device_id, function | 0x80, code])
+        return bytes(frame + crc16_modbus(frame))
+
+class RoverModel(DeviceModel):
+    client_type = 'RNG_CTRL'
+    blocks = [(10, 17), (256, 34), (57348, 1), (61440, 40)] # implemented register ranges
+    history_register = 61440 # one 10 word record per day back, register 61440 + day
+
+    def setup(self):
+        self.set_text(12, ' ML2440N', 8)
+        self.set(26, self.device_id if self.device_id != 255 else 1)
+        self.set(57348, 4) # lithium
+        self.generated_total = self.random.randint(100000, 2000000)
+        self.history = []
+        for day in range(30):
+            record = [0] * 10
+            record[4] = self.random.randint(200, 900) # max power
+            record[6] = self.random.randint(10, 60) # charge Ah
+            record[8] = self.random.randint(300, 2500) # power generation
+            self.history.append(record)
+
+    def read_words(self, register, words):
+        if register < self.history_register: return super().read_words(register, words)
+        # history records are paged: each register returns the record of one day
+        return self.history[register - self.history_register][0:words] + [0] * max(0, words - 10)
+
+    def update(self, now):
+        sun = daylight(now)
+        pv_voltage = self.noise(18 + 2 * sun, 0.2) if sun > 0 else 0
+        pv_power = self.noise(400 * sun, 5) if sun > 0 else 0
+        battery_voltage = self.noise(13.1 + 0.6 * sun, 0.05)
+        load_power = self.noise(35, 3)
+        self.set(256, min(100, 60 + 40 * sun))
+        self.set(257, battery_voltage * 10)
+        self.set(258, max(0, pv_power - load_power) / battery_voltage * 100)
+        self.set_bytes(259, 25 + int(10 * sun), 20) # controller, battery temperature
+        self.set(260, battery_voltage * 10)
+        self.set(261, load_power / battery_voltage * 100)
+        self.set(262, load_power)
+        self.set(263, pv_voltage * 10)
+        self.set(264, pv_power / pv_voltage * 100 if pv_voltage > 0 else 0)
+        self.set(265, pv_power)
+        self.set(271, 420)
+        self.set(272, 60)
+        self.set(273, 55)
+        self.set(274, 20)
+        self.set(275, 1200 * sun)
+        self.set(276, 250)
+        self.set(284, self.generated_total, 2)
+        self.set_bytes(288, 0x80, 2 if sun > 0 else 0) # load on, mppt
+
+class DCChargerModel(DeviceModel):
+    client_type = 'RNG_DCC'
+    blocks = [(10, 17), (256, 30), (288, 3), (57348, 1)]
+
+    def setup(self):
+        self.set_text(12, 'RBC50D1S-G1', 8)
+        self.set(26, self.device_id if self.device_id != 255 else 1)
+        self.set(57348, 4)
+        self.set(277, self.random.randint(10, 400)) # working days
+        self.set(279, self.random.randint(10, 400)) # fully charged count
+        self.set(280, self.random.randint(1000, 90000), 2) # accumulated Ah
+
+    def update(self, now):
+        sun = daylight(now)
+        battery_voltage = self.noise(13.4, 0.05)
+        self.set(256, 80)
+        self.set(257, battery_voltage * 10)
+        self.set(258, self.noise(20, 1) * 100)
+        self.set_bytes(259, 30, 22)
+        self.set(260, self.noise(14.2, 0.05) * 10)
+        self.set(261, self.noise(12, 0.5) * 100)
+        self.set(262, self.noise(170, 5))
+        self.set(263, (19 * sun) * 10)
+        self.set(264, 8 * sun * 100)
+        self.set(265, 150 * sun)
+        self.set(267, 124)
+        self.set(268, 144)
+        self.set(269, 2500)
+        self.set(271, 320)
+        self.set(273, 40)
+        self.set(275, 900)
+        self.set(284, 350000, 2)
+        self.set_bytes(289, 0, 2) # mppt
+
+class BatteryModel(DeviceModel):
+    client_type = 'RNG_BATT'
+    blocks = [(5000, 17), (5017, 17), (5042, 6), (5122, 8), (5223, 1)]
+
+    def setup(self):
+        self.set(5000, 4) # cells
+        self.set(5017, 4) # temperature sensors
+        self.set_text(5122, 'RBT100LFP12S-G', 8, pad=b'\x00')
+        self.set(5223, self.device_id if self.device_id != 255 else 48)
+        self.remaining = self.random.uniform(40, 95)
+
+    def update(self, now):
+        current = self.noise(8 * daylight(now) - 3, 0.2)
+        self.remaining = min(100, max(5, self.remaining + current / 3600))
+        for cell in range(4): self.set(5001 + cell, self.noise(33.2, 0.3))
+        for sensor in range(4): self.set(5018 + sensor, self.noise(210, 5), signed=True)
+        self.set(5042, current * 100, signed=True)
+        self.set(5043, self.noise(13.3, 0.05) * 10)
+        self.set(5044, self.remaining * 1000, 2)
+        self.set(5046, 100000, 2)
+
+class InverterModel(DeviceModel):
+    client_type = 'RNG_INVT'
+    name_prefix = 'RNGRIU'
+    blocks = [(4000, 10), (4109, 1), (4311, 8), (4327, 7), (4408, 6)]
+
+    def setup(self):
+        self.set(4109, self.device_id if self.device_id != 255 else 32)
+        self.set_text(4311, 'RIV1230RCH-SPS', 8, pad=b'\x00')
+
+    def update(self, now):
+        sun = daylight(now)
+        load = self.noise(300, 20)
+        self.set(4000, self.noise(230, 1) * 10)
+        self.set(4001, 0)
+        self.set(4002, self.noise(230, 1) * 10)
+        self.set(4003, load / 230 * 100)
+        self.set(4004, 5000)
+        self.set(4005, self.noise(26.4, 0.1) * 10)
+        self.set(4006, self.noise(35, 1) * 10)
+        self.set(4009, 5000)
+        self.set(4327, 75)
+        self.set(4328, (20 * sun - 5) * 10, signed=True)
+        self.set(4329, 80 * sun * 10)
+        self.set(4330, 8 * sun * 10)
+        self.set(4331, 640 * sun)
+        self.set(4332, 2 if sun > 0 else 0)
+        self.set(4333, 600 * sun)
+        self.set(4408, load / 230 * 10)
+        self.set(4409, load)
+        self.set(4410, load * 1.1)
+        self.set(4412, 0)
+        self.set(4413, load / 30)
+
+class ShuntModel(DeviceModel):
+    client_type = 'RNG_SHNT'
+    name_prefix = 'RTMShunt300'
+    notify_uuid = SHUNT_NOTIFY_CHAR_UUID
+    write_service_uuid = ""
+    write_uuid = ""
+    streaming = True
+    packet_interval = 0.5 # the shunt streams a few packets per second (seconds)
+
+    def setup(self):
+        self.percent = self.random.uniform(40, 95)
+
+    def packet(self, now):
+        amps = self.noise(6 * daylight(now) - 2, 0.3)
+        volts = self.noise(13.2, 0.05)
+        self.percent = min(100, max(5, self.percent + amps / 3600))
+        packet = bytearray(110)
+        packet[0] = self.device_id & 0xFF
+        packet[1] = 87 # notify operation
+        packet[21:24] = (int(amps * 1000) & 0xFFFFFF).to_bytes(3, 'big')
+        packet[25:28] = int(volts * 1000).to_bytes(3, 'big')
+        packet[30:32] = int(self.noise(12.7, 0.05) * 1000).to_bytes(2, 'big')
+        packet[34:36] = int(self.percent * 10).to_bytes(2, 'big')
+        packet[66:68] = int(self.noise(21, 0.5) * 10).to_bytes(2, 'big')
+        return bytes(packet)
+
+# A BT-2 module on a Communication Hub or daisy chain: one bluetooth device in front of several
+# Modbus devices, each answering its own device id (hub_devices in config.ini)
+class HubModel(DeviceModel):
+    def __init__(self, address, members, name=None, seed=None):
+        self.members = members # device models with distinct device ids
+        super().__init__(address, name, seed=seed)
+        self.client_type = members[0].client_type
+        self.hub_devices = ', '.join(f"{model.device_id}:{model.client_type}" for model in members)
+
+    def handle(self, request):
+        for model in self.members:
+            response = model.handle(request)
+            if response is not None: return response
+        return None
+
+DEVICE_MODELS = {
+    'rover': RoverModel,
+    'dcc': DCChargerModel,
+    'battery': BatteryModel,
+    'inverter': InverterModel,
+    'shunt': ShuntModel
+}
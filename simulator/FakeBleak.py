@@ -0,0 +1,120 @@
+import asyncio
+import sys
+import types
+
+# Stand-ins for the parts of bleak that renogybt uses (BleakScanner, BleakClient, BLEDevice).
+# They talk to a DeviceFarm instead of a radio. install() registers them as the `bleak` module and
+# patches renogybt modules that were already imported.
+
+farm = None # DeviceFarm the fakes talk to, set by install()
+
+class BleakError(Exception):
+    pass
+
+class BLEDevice:
+    def __init__(self, address, name, details=None, rssi=-60):
+        self.address = address
+        self.name = name
+        self.details = details
+        self.rssi = rssi
+
+    def __repr__(self):
+        return f"BLEDevice({self.address}, {self.name})"
+
+class AdvertisementData:
+    def __init__(self, local_name, rssi=-60):
+        self.local_name = local_name
+        self.rssi = rssi
+
+class BleakScanner:
+    def __init__(self, detection_callback=None, **kwargs):
+        self.detection_callback = detection_callback
+        self.task = None
+
+    async def start(self):
+        farm.scans += 1
+        self.task = asyncio.ensure_future(self.advertise())
+
+    async def advertise(self):
+        for device in farm.advertising():
+            await asyncio.sleep(farm.advertise_interval)
+            if self.detection_callback is not None:
+                self.detection_callback(device.ble_device, AdvertisementData(device.name))
+
+    async def stop(self):
+        if self.task is not None: self.task.cancel()
+
+    @classmethod
+    async def discover(cls, timeout=5, **kwargs):
+        farm.scans += 1
+        devices = [device.ble_device for device in farm.advertising()]
+        await asyncio.sleep(min(timeout, farm.advertise_interval * len(devices)))
+        return devices
+
+class BleakGATTCharacteristic:
+    def __init__(self, uuid, handle):
+        self.uuid = uuid
+        self.handle = handle
+        self.properties = ['read', 'write-without-response', 'notify']
+
+class BleakGATTService:
+    def __init__(self, uuid, characteristics):
+        self.uuid = uuid
+        self.characteristics = characteristics
+
+class BleakClient:
+    def __init__(self, address_or_ble_device, disconnected_callback=None, **kwargs):
+        self.address = getattr(address_or_ble_device, 'address', address_or_ble_device)
+        self.disconnected_callback = disconnected_callback
+        self.is_connected = False
+        self.device = None
+        self.notify_callback = None
+        self.notify_char = None
+        self.services = []
+
+    async def connect(self, **kwargs):
+        self.device = farm.get(self.address)
+        if self.device is None: raise BleakError(f"Device with address {self.address} was not found")
+        await farm.connect(self)
+        self.is_connected = True
+        model = self.device.model
+        self.notify_char = BleakGATTCharacteristic(model.notify_uuid, 1)
+        services = [BleakGATTService("0000fff0-0000-1000-8000-00805f9b34fb", [self.notify_char])]
+        if model.write_uuid:
+            services.append(BleakGATTService(model.write_service_uuid, [BleakGATTCharacteristic(model.write_uuid, 2)]))
+        self.services = services
+        return True
+
+    async def start_notify(self, characteristic, callback, **kwargs):
+        self.notify_callback = callback
+        farm.subscribed(self)
+
+    async def write_gatt_char(self, char_specifier, data, response=False):
+        if not self.is_connected: raise BleakError("Not connected")
+        farm.write(self, bytes(data))
+
+    async def disconnect(self):
+        if not self.is_connected: return True
+        self.is_connected = False
+        farm.disconnected(self)
+        if self.disconnected_callback is not None: self.disconnected_callback(self)
+        return True
+
+    # link loss as seen by bleak, used by DeviceFarm.drop_link()
+    def lose_link(self):
+        if not self.is_connected: return
+        self.is_connected = False
+        farm.disconnected(self)
+        if self.disconnected_callback is not None: self.disconnected_callback(self)
+
+def install(device_farm):
+    global farm
+    farm = device_farm
+    module = types.ModuleType('bleak')
+    for name in ('BleakScanner', 'BleakClient', 'BLEDevice', 'BleakError'):
+        setattr(module, name, getattr(sys.modules[__name__], name))
+    sys.modules['bleak'] = module
+    # modules imported before install() keep references to the real classes
+    for name, attribute in (('renogybt.BLEManager', 'BleakClient'), ('renogybt.DiscoveryService', 'BleakScanner')):
+        if name in sys.modules: setattr(sys.modules[name], attribute, getattr(module, attribute))
+    return module
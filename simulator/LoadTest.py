@@ -0,0 +1,60 @@
+import json
+import threading
+import time
+
+# Drives the whole BaseClient -> parser -> sink pipeline against a DeviceFarm: every device is read
+# through the Collector and every reading goes through a SinkPipeline into a sink that only encodes it.
+# install() must have replaced bleak before renogybt is imported.
+
+def percentile(values, share):
+    if len(values) == 0: return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+def load_test(farm, loops=1, max_connections=2, adapters=1, **data_options):
+    from renogybt import Utils
+    from renogybt.Collector import Collector
+    from renogybt.SinkPipeline import SinkPipeline
+
+    sink_pipeline = SinkPipeline()
+    lock = threading.Lock()
+    result = {'readings': 0, 'errors': 0, 'sink_calls': 0, 'encoded_bytes': 0}
+    latencies = []
+    cycle_start = [time.perf_counter()]
+
+    def null_sink(json_data):
+        payload = json.dumps(json_data)
+        with lock:
+            result['sink_calls'] += 1
+            result['encoded_bytes'] += len(payload)
+
+    def on_data(client, data, config):
+        result['readings'] += 1
+        latencies.append(time.perf_counter() - cycle_start[0])
+        sink_pipeline.submit('null', null_sink, json_data=Utils.filter_fields(data, config['data']['fields']))
+        if not config['data'].getboolean('enable_polling'):
+            client.stop()
+
+    def on_error(client, error, param2=None):
+        result['errors'] += 1
+
+    collector = Collector(farm.configs(adapters, **data_options), on_data, on_error, max_connections=max_connections, sinks=sink_pipeline)
+    run_cycle = collector.run_cycle
+
+    async def timed_cycle():
+        cycle_start[0] = time.perf_counter()
+        await run_cycle()
+    collector.run_cycle = timed_cycle
+
+    start = time.perf_counter()
+    collector.start(loop_count=loops)
+    elapsed = time.perf_counter() - start
+
+    result.update(farm.stats())
+    result['loops'] = loops
+    result['elapsed'] = round(elapsed, 3)
+    result['readings_per_second'] = round(result['readings'] / elapsed, 2) if elapsed > 0 else 0
+    result['missing'] = farm.readings_per_cycle() * loops - result['readings']
+    result['latency_p50'] = round(percentile(latencies, 0.5) or 0, 3)
+    result['latency_p95'] = round(percentile(latencies, 0.95) or 0, 3)
+    return result
@@ -0,0 +1,14 @@
+# Virtual Renogy device farm for load testing without bluetooth hardware.
+# Call install() before importing renogybt, e.g.:
+#
+#   from simulator import DeviceFarm, install
+#   farm = DeviceFarm(latency=0.05, mtu=20, loss=0.01)
+#   farm.add_devices('rover', 50)
+#   install(farm)
+#   from renogybt.Collector import Collector
+#   Collector(farm.configs(), on_data).start()
+
+from .DeviceModels import DeviceModel, RoverModel, DCChargerModel, BatteryModel, InverterModel, ShuntModel, HubModel, DEVICE_MODELS
+from .DeviceFarm import DeviceFarm
+from .FakeBleak import install
+from .LoadTest import load_test
@@ -0,0 +1,46 @@
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from simulator import DeviceFarm, DEVICE_MODELS, install, load_test
+
+# Usage: python3 -m simulator --devices rover:50,battery:20,shunt:5 --latency 0.05 --mtu 20 --loss 0.01
+
+def parse_devices(value):
+    devices = []
+    for entry in value.split(','):
+        kind, _, count = entry.strip().partition(':')
+        if kind not in DEVICE_MODELS: raise argparse.ArgumentTypeError(f"unknown device {kind}, use one of {', '.join(DEVICE_MODELS)}")
+        devices.append((kind, int(count or 1)))
+    return devices
+
+def main():
+    parser = argparse.ArgumentParser(prog='simulator', description='Read a farm of virtual Renogy devices through renogybt')
+    parser.add_argument('--devices', type=parse_devices, default=parse_devices('rover:10'), help='kind:count list, e.g. rover:50,battery:20')
+    parser.add_argument('--latency', type=float, default=0.05, help='response latency (seconds)')
+    parser.add_argument('--jitter', type=float, default=0.02, help='extra random latency (seconds)')
+    parser.add_argument('--mtu', type=int, default=20, help='notification payload size (bytes)')
+    parser.add_argument('--loss', type=float, default=0.0, help='probability to lose a request or notification')
+    parser.add_argument('--connect-latency', type=float, default=0.3, help='connection setup time (seconds)')
+    parser.add_argument('--adapters', type=int, default=1, help='spread devices over this many adapters')
+    parser.add_argument('--max-connections', type=int, default=2, help='concurrent connections per adapter')
+    parser.add_argument('--loops', type=int, default=1, help='collector cycles')
+    parser.add_argument('--adaptive-pacing', action='store_true', help='enable adaptive_pacing in the device configs')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='write the result to this file')
+    args = parser.parse_args()
+
+    farm = DeviceFarm(latency=args.latency, jitter=args.jitter, mtu=args.mtu, loss=args.loss, connect_latency=args.connect_latency, seed=args.seed)
+    for kind, count in args.devices: farm.add_devices(kind, count)
+    install(farm)
+
+    result = load_test(farm, loops=args.loops, max_connections=args.max_connections, adapters=args.adapters,
+                       adaptive_pacing=str(args.adaptive_pacing).lower())
+    for key, value in result.items(): print(f"{key:<22} {value}")
+    if args.json:
+        with open(args.json, 'w') as f: json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
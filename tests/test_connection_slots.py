@@ -0,0 +1,84 @@
+import asyncio
+import pytest
+from simulator import DeviceFarm, install
+
+# A client waiting on the adapter's connection semaphore must not be stopped by the discovery timeout
+
+def make_client(farm, readings):
+    from renogybt.Collector import create_client
+    def on_data(client, data, config):
+        readings.append(data)
+        client.stop()
+    client = create_client(farm.configs()[0], on_data)
+    client.G_DISCOVERY_TIMEOUT = 0.5
+    return client
+
+async def hold_slot(limiter, seconds):
+    await limiter.acquire()
+    await asyncio.sleep(seconds)
+    limiter.release()
+
+def test_wait_for_slot_longer_than_discovery_timeout():
+    farm = DeviceFarm(latency=0.001, jitter=0, connect_latency=0.01, seed=1)
+    farm.add_devices('rover', 1)
+    install(farm)
+    readings = []
+
+    async def main():
+        client = make_client(farm, readings)
+        client.connection_limiter = asyncio.Semaphore(1)
+        holder = asyncio.ensure_future(hold_slot(client.connection_limiter, 1.5))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(client.run(), 10)
+        await holder
+
+    asyncio.run(main())
+    assert len(readings) == 1
+    assert farm.connections == 1
+
+def test_stopped_while_waiting_for_slot_does_not_connect():
+    farm = DeviceFarm(latency=0.001, jitter=0, connect_latency=0.01, seed=1)
+    farm.add_devices('rover', 1)
+    install(farm)
+    readings = []
+
+    async def main():
+        client = make_client(farm, readings)
+        client.connection_limiter = asyncio.Semaphore(1)
+        holder = asyncio.ensure_future(hold_slot(client.connection_limiter, 1))
+        await asyncio.sleep(0)
+        run = asyncio.ensure_future(client.run())
+        await asyncio.sleep(0.5) # discovered, waiting for the slot
+        client.stop()
+        await asyncio.wait_for(run, 5)
+        await holder
+        await asyncio.sleep(0.2)
+        assert not client.holds_connection
+        assert client.connection_limiter.locked() is False
+
+    asyncio.run(main())
+    assert readings == []
+    assert farm.connections == 0
+
+# More polling devices than connection slots on an adapter: the slots are handed on between polls
+
+@pytest.mark.parametrize('persistent', ['false', 'true']) # persistent sessions would keep the slots
+def test_polling_devices_share_the_slots(persistent):
+    farm = DeviceFarm(latency=0.001, jitter=0, connect_latency=0.01, seed=1)
+    farm.add_devices('rover', 4)
+    install(farm)
+    from renogybt.Collector import Collector
+    readings = {}
+    def on_data(client, data, config):
+        readings[data['__device']] = readings.get(data['__device'], 0) + 1
+
+    async def main():
+        collector = Collector(farm.configs(enable_polling='true', poll_interval=1, persistent_connection=persistent), on_data, max_connections=2)
+        try:
+            await asyncio.wait_for(collector.run_cycle(), 8)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(main())
+    assert len(readings) == 4
+    assert min(readings.values()) >= 2
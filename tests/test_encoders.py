@@ -0,0 +1,50 @@
+import json
+import renogybt.Encoders as Encoders
+from renogybt.Encoders import PackedEncoder, decode_packed
+
+READING = {'model': 'ML2440N', 'battery_voltage': 13.6, 'battery_percentage': 87, 'charging_status': 'mppt',
+           'pv_power': 120, 'power_generation_total': 2**40, 'load_status': 'on'}
+
+def decode_all(frames, schemas):
+    decoded = [decode_packed(payload, schemas) for kind, payload in frames]
+    return [data for data in decoded if data is not None] # schema frames are only registered
+
+def test_text_changes_keep_the_schema():
+    encoder = PackedEncoder()
+    schemas = {}
+    first = encoder.encode(READING)
+    assert [kind for kind, _ in first] == ['schema', 'data']
+    changed = dict(READING, charging_status='floating', load_status='off', pv_power=80)
+    frames = encoder.encode(changed)
+    assert [kind for kind, _ in frames] == ['data']
+    assert decode_all(first + frames, schemas) == [READING, changed]
+
+def test_change_sets_use_the_same_schema():
+    encoder = PackedEncoder()
+    schemas = {}
+    decode_all(encoder.encode(READING), schemas)
+    for change in ({'pv_power': 90}, {'charging_status': 'boost', 'battery_voltage': 14.2}, {}):
+        frames = encoder.encode(change)
+        assert [kind for kind, _ in frames] == ['data']
+        assert decode_all(frames, schemas) == [change]
+
+def test_widening_sends_a_new_schema():
+    encoder = PackedEncoder()
+    schemas = {}
+    frames = encoder.encode({'load_power': 10})
+    frames += encoder.encode({'load_power': 10.5}) # int32 => float64
+    assert [kind for kind, _ in frames] == ['schema', 'data', 'schema', 'data']
+    assert decode_all(frames, schemas) == [{'load_power': 10}, {'load_power': 10.5}]
+    assert [kind for kind, _ in encoder.encode({'load_power': 11})] == ['data'] # an int fits float64
+
+def test_packed_is_smaller_than_json():
+    encoder = PackedEncoder()
+    encoder.encode(READING)
+    data = encoder.encode(dict(READING, charging_status='floating'))[0][1]
+    assert len(data) < len(json.dumps(READING)) / 2
+
+def test_schema_is_bounded(monkeypatch):
+    monkeypatch.setattr(Encoders, 'MAX_FIELDS', 8)
+    encoder = PackedEncoder()
+    for i in range(20): encoder.encode({f'field_{i}': i})
+    assert len(encoder.schema.fields) <= 8
@@ -0,0 +1,27 @@
+import asyncio
+from simulator import DeviceFarm, install
+
+# A hub member that does not answer is skipped, also when it is the last one and the hub polls
+
+def test_last_member_timeout_keeps_polling():
+    farm = DeviceFarm(latency=0.001, jitter=0, connect_latency=0.01, seed=1)
+    hub = farm.add_hub([('rover', 97), ('battery', 48)])
+    hub.model.hub_devices = '97:RNG_CTRL, 48:RNG_BATT, 50:RNG_BATT' # 50 is not on the bus
+    install(farm)
+    from renogybt.Collector import create_client
+    readings = []
+    def on_data(client, data, config):
+        readings.append(data['__device'])
+
+    async def main():
+        client = create_client(farm.configs(enable_polling='true', poll_interval=1, persistent_connection='false', adaptive_pacing='true')[0], on_data)
+        client.G_READ_TIMEOUT = 0.5
+        run = asyncio.ensure_future(client.run())
+        await asyncio.sleep(4)
+        assert client.is_running
+        client.stop()
+        await asyncio.wait_for(run, 5)
+
+    asyncio.run(main())
+    assert readings.count(readings[0]) >= 2
+    assert len(set(readings)) == 2
@@ -0,0 +1,42 @@
+import threading
+import time
+import renogybt.MqttPublisher as MqttPublisher
+
+class FakeInfo:
+    def wait_for_publish(self, timeout=None):
+        pass
+
+class FakeClient:
+    def __init__(self, events):
+        self.events = events
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        time.sleep(0.2) # slow enough for close() to run in between
+        self.events.append(('publish', topic))
+        return FakeInfo()
+
+    def disconnect(self):
+        self.events.append(('disconnect', None))
+
+    def username_pw_set(self, user, password): pass
+    def reconnect_delay_set(self, **kwargs): pass
+    def loop_stop(self): pass
+
+def test_close_waits_for_messages_queued_before_connect(monkeypatch):
+    events = []
+    monkeypatch.setattr(MqttPublisher, 'create_client', lambda client_id: FakeClient(events))
+    publisher = MqttPublisher.MqttPublisher('localhost', 1883)
+    assert publisher.publish([('solar/state', '{}', 0, False)]) == [] # not connected yet, kept pending
+    threading.Thread(target=publisher.on_connect, args=(publisher.client, None, {}, 0)).start()
+    time.sleep(0.05)
+    publisher.close(timeout=2)
+    assert events == [('publish', 'solar/state'), ('disconnect', None)]
+
+# The outbox path keeps its own copy, messages it could not send must not be delivered again on reconnect
+def test_publish_without_queue_while_disconnected(monkeypatch):
+    events = []
+    monkeypatch.setattr(MqttPublisher, 'create_client', lambda client_id: FakeClient(events))
+    publisher = MqttPublisher.MqttPublisher('localhost', 1883)
+    assert publisher.publish([('solar/state', '{}', 1, False)], queue=False) == []
+    publisher.on_connect(publisher.client, None, {}, 0)
+    assert events == []
@@ -0,0 +1,34 @@
+import threading
+from renogybt.Outbox import Outbox
+
+def test_partial_delivery_keeps_the_rest(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox.db'), batch_size=10)
+    for i in range(5): outbox.add('remote', {'i': i})
+    sent = []
+    def deliver(records):
+        sent.extend(records[:2])
+        return 2 # the server accepted the first two records only
+    assert outbox.flush('remote', deliver) == 2
+    assert [record['i'] for record in sent] == [0, 1]
+    assert [record['i'] for _, record in outbox.peek('remote', 10)] == [2, 3, 4]
+    assert outbox.pending() == 3
+    outbox.close()
+
+def test_ack_of_evicted_records_keeps_the_count(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox.db'), max_records=10)
+    for i in range(10): outbox.add('remote', {'i': i})
+    ids = [record_id for record_id, _ in outbox.peek('remote', 3)]
+    outbox.add('remote', {'i': 10}) # full, evicts the oldest records
+    outbox.ack(ids)
+    assert outbox.pending() == outbox.db.execute('SELECT COUNT(*) FROM outbox').fetchone()[0]
+    outbox.close()
+
+def test_store_writes_on_the_outbox_thread(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox.db'))
+    threads = []
+    add = outbox.add
+    outbox.add = lambda sink, record: (threads.append(threading.current_thread().name), add(sink, record))
+    outbox.store('remote', {'i': 0}).result()
+    assert threads[0].startswith('outbox')
+    assert outbox.pending('remote') == 1
+    outbox.close()
@@ -0,0 +1,39 @@
+import asyncio
+from simulator import DeviceFarm, install
+from renogybt.Pacing import Pacing
+from renogybt.Utils import crc16_modbus
+
+def make_client():
+    farm = DeviceFarm(seed=1)
+    farm.add_devices('rover', 1)
+    install(farm)
+    from renogybt.Collector import create_client
+    client = create_client(farm.configs(adaptive_pacing='true')[0])
+    client.pacing = Pacing()
+    return client
+
+def frame(words, value=0):
+    data = bytearray([1, 3, words * 2]) + bytes([value]) * (words * 2)
+    return bytes(data + crc16_modbus(data))
+
+def accept(client, request, response):
+    return asyncio.run(client.check_paced_response(request, response, response[1]))
+
+def test_late_answer_to_resent_request_is_ignored():
+    client = make_client()
+    first = {'register': 10, 'words': 17, 'sections': []}
+    second = {'register': 30, 'words': 17, 'sections': []}
+    client.awaiting_response = True
+    client.retries = 1 # the first request was resent after a response timeout
+    assert accept(client, first, frame(17, 1))
+    assert client.resent
+    assert not accept(client, second, frame(17, 1)) # second answer to the first request, before the next write
+    client.awaiting_response = True # second request written
+    assert accept(client, second, frame(17, 2))
+    assert not client.resent
+
+def test_frame_of_another_length_is_ignored():
+    client = make_client()
+    client.awaiting_response = True
+    assert not accept(client, {'register': 256, 'words': 34, 'sections': []}, frame(17))
+    assert accept(client, {'register': 256, 'words': 34, 'sections': []}, frame(34))
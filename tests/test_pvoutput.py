@@ -0,0 +1,27 @@
+import configparser
+from renogybt.DataLogger import pvoutput_device
+from renogybt.PVOutputUploader import get_uploader, uploaders
+
+def make_config(device_type, alias, device_types=None):
+    config = configparser.ConfigParser(inline_comment_prefixes=('#'))
+    config.read_dict({
+        'device': {'type': device_type, 'alias': alias},
+        'data': {'temperature_unit': 'C'},
+        'pvoutput': {'enabled': 'true', 'api_key': 'key', 'system_id': '1234'},
+    })
+    if device_types is not None: config['pvoutput']['device_types'] = device_types
+    return config
+
+def test_only_the_charge_controller_by_default():
+    assert pvoutput_device(make_config('RNG_CTRL', 'rover'))
+    assert not pvoutput_device(make_config('RNG_INVT', 'inverter'))
+    assert not pvoutput_device(make_config('RNG_BATT', 'battery'))
+    assert pvoutput_device(make_config('RNG_INVT', 'inverter', device_types='RNG_CTRL, RNG_INVT'))
+
+def test_one_device_per_system():
+    uploaders.clear()
+    rover = get_uploader(make_config('RNG_CTRL', 'rover'), session=None)
+    assert rover is not None
+    assert get_uploader(make_config('RNG_CTRL', 'rover'), session=None) is rover
+    assert get_uploader(make_config('RNG_CTRL', 'second rover'), session=None) is None
+    uploaders.clear()
@@ -0,0 +1,51 @@
+import asyncio
+from simulator import DeviceFarm, install
+from renogybt.ReadPlanner import plan_reads, slice_response, MODBUS_MAX_READ_WORDS
+from renogybt.Utils import crc16_modbus
+
+def make_client(kind, **data_options):
+    farm = DeviceFarm(seed=1)
+    farm.add_devices(kind, 1)
+    install(farm)
+    from renogybt.Collector import create_client
+    return create_client(farm.configs(**data_options)[0])
+
+def layout(plan):
+    return [(request['register'], request['words'], [section['register'] for _, section in request['sections']]) for request in plan]
+
+def test_dc_charger_keeps_the_default_limit():
+    client = make_client('dcc')
+    assert layout(client.get_read_plan()) == [(12, 15, [12, 26]), (256, 30, [256]), (288, 3, [288]), (57348, 1, [57348])]
+
+def test_dc_charger_fast_plan():
+    client = make_client('dcc')
+    client.reads = 1 # static sections already read on this connection
+    assert layout(client.get_read_plan()) == [(256, 30, [256]), (288, 3, [288])]
+
+def test_config_raises_client_limit():
+    client = make_client('dcc', max_read_words=35)
+    assert layout(client.get_read_plan())[1] == (256, 35, [256, 288])
+
+# A device that rejects the merged read is read one section at a time
+def test_rejected_merged_read_falls_back_to_sections():
+    client = make_client('dcc', max_read_words=35)
+    readings = []
+    def on_data(client, data, config):
+        readings.append(data)
+        client.stop()
+    client.on_data_callback = on_data
+    asyncio.run(asyncio.wait_for(client.run(), 20))
+    assert len(readings) == 1
+    assert 'charging_status' in readings[0] and 'battery_voltage' in readings[0]
+
+def test_limit_capped_at_modbus_pdu():
+    sections = [{'register': 0, 'words': 100, 'parser': None}, {'register': 100, 'words': 100, 'parser': None}]
+    assert len(plan_reads(sections, max_words=1000)) == 2
+    assert MODBUS_MAX_READ_WORDS == 125
+
+def test_slice_response_rebuilds_section_frame():
+    frame = bytearray([1, 3, 8, 0, 1, 0, 2, 0, 3, 0, 4])
+    frame += crc16_modbus(frame)
+    part = slice_response(frame, 2, 2)
+    assert part[:7] == bytearray([1, 3, 4, 0, 3, 0, 4])
+    assert part[7:] == crc16_modbus(part[:7])
@@ -0,0 +1,27 @@
+import asyncio
+import threading
+from renogybt.SinkPipeline import SinkPipeline
+
+# A call that outlives its timeout keeps its thread, later calls of that sink are skipped instead of queueing behind it
+
+def test_hung_sink_is_skipped_while_its_call_runs():
+    release = threading.Event()
+    calls = []
+
+    async def main():
+        pipeline = SinkPipeline()
+        pipeline.add_sink('slow', concurrency=1, timeout=0.1)
+        pipeline.submit('slow', lambda: release.wait(5))
+        await asyncio.sleep(0.3) # first call timed out, its thread still waits
+        for i in range(3): pipeline.submit('slow', calls.append, i)
+        await asyncio.sleep(0.1)
+        sink = pipeline.sinks['slow']
+        assert calls == []
+        assert sink.failed == 4
+        release.set()
+        await asyncio.sleep(0.1)
+        pipeline.submit('slow', calls.append, 3)
+        await pipeline.drain(1)
+        assert calls == [3]
+
+    asyncio.run(main())
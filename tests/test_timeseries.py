@@ -0,0 +1,49 @@
+import math
+from renogybt.TimeSeriesStore import TimeSeriesStore, CHUNK_ROWS
+
+T0 = 1700000000 - 1700000000 % 3600 # an hour boundary
+
+def test_append_and_query(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    for i in range(5): store.append('rover', {'pv_power': i * 10, 'model': 'RNG-CTRL', '__device': 'rover'}, T0 + i)
+    assert store.query('rover', 'pv_power') == [(T0 + i, i * 10.0) for i in range(5)]
+    assert store.query('rover', 'pv_power', start=T0 + 1, end=T0 + 3) == [(T0 + 1, 10.0), (T0 + 2, 20.0), (T0 + 3, 30.0)]
+    assert store.fields('rover') == ['pv_power'] # text and internal fields are not stored
+    store.close()
+
+def test_rollup_query(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    for i in range(120): store.append('rover', {'battery_voltage': 12 + i % 60 / 10}, T0 + i)
+    assert store.query('rover', 'battery_voltage', resolution='1m') == [(T0, 12.0, 17.9, 14.95), (T0 + 60, 12.0, 17.9, 14.95)]
+    [(start, low, high, mean)] = store.query('rover', 'battery_voltage', resolution='1h')
+    assert (start, low, high) == (T0, 12.0, 17.9) and math.isclose(mean, 14.95)
+    store.close()
+
+def test_reopen_recovers_rows(tmp_path):
+    store = TimeSeriesStore(str(tmp_path))
+    for i in range(10): store.append('rover', {'pv_power': i}, T0 + i)
+    store.close()
+    store = TimeSeriesStore(str(tmp_path))
+    assert store.latest('rover') == {'pv_power': 9.0, 'time': T0 + 9}
+    store.append('rover', {'pv_power': 10, 'load_power': 1}, T0 + 10)
+    assert [value for _, value in store.query('rover', 'pv_power')] == list(range(11))
+    assert store.query('rover', 'load_power') == [(T0 + 10, 1.0)]
+    assert store.query('rover', 'pv_power', resolution='1m') == [(T0, 0.0, 10.0, 5.0)]
+    store.close()
+
+def test_max_rows_drops_oldest(tmp_path):
+    store = TimeSeriesStore(str(tmp_path), max_rows=100)
+    rows = 100 + CHUNK_ROWS + 1
+    for i in range(rows): store.append('rover', {'pv_power': i}, T0 + i)
+    raw = store.device('rover')['raw']
+    capacity = raw.time.capacity
+    assert raw.rows == 101
+    assert store.query('rover', 'pv_power')[0] == (T0 + rows - 101, rows - 101.0)
+    for i in range(rows, rows * 2): store.append('rover', {'pv_power': i}, T0 + i)
+    assert raw.time.capacity == capacity # the files stopped growing
+    kept = store.query('rover', 'pv_power')
+    assert 100 <= len(kept) <= 100 + CHUNK_ROWS and kept[-1] == (T0 + rows * 2 - 1, rows * 2 - 1.0)
+    store.close()
+    store = TimeSeriesStore(str(tmp_path), max_rows=100)
+    assert store.query('rover', 'pv_power') == kept
+    store.close()